@@ -0,0 +1,255 @@
+import math
+import threading
+from array import array
+
+# Número de ações mantidas por jogador
+ACTION_CAPACITY = 100
+
+# Tipos de ação internados: nome -> código e código -> nome
+_action_codes = {}
+_action_names = []
+# Serializa o registro de tipos novos; a leitura de tipos já registrados não usa o lock
+_action_codes_lock = threading.Lock()
+
+# Maior código que cabe no array('H') de PlayerActions
+MAX_ACTION_TYPES = 65536
+
+def intern_action_type(action_type):
+    """Retorna o código numérico do tipo de ação, registrando-o se for novo."""
+    code = _action_codes.get(action_type)
+    if code is None:
+        with _action_codes_lock:
+            code = _action_codes.get(action_type)
+            if code is None:
+                if len(_action_names) >= MAX_ACTION_TYPES:
+                    raise ValueError(f"Too many action types (max {MAX_ACTION_TYPES})")
+                # O nome entra antes do código, para que action_type_name(code) nunca falhe
+                _action_names.append(action_type)
+                code = _action_codes[action_type] = len(_action_names) - 1
+    return code
+
+def action_type_name(code):
+    """Retorna o nome do tipo de ação a partir do código."""
+    return _action_names[code]
+
+def action_type_names():
+    """Retorna os nomes de todos os tipos registrados, na ordem dos códigos."""
+    return list(_action_names)
+
+def action_type_code(action_type):
+    """Retorna o código do tipo de ação ou None se ele nunca foi registrado."""
+    return _action_codes.get(action_type)
+
+class PlayerActions:
+    """
+    Buffer circular das últimas ações de um jogador em arrays paralelos.
+
+    Cada ação ocupa 26 bytes: timestamp (double), código do tipo (uint16),
+    valor (double; 'amount' ou 'price' dos detalhes, NaN se ausente) e
+    referência (int64; 'item_id' dos detalhes, -1 se ausente). Os arrays
+    crescem até a capacidade e depois passam a sobrescrever a ação mais
+    antiga, apontada por `head`.
+
+    Cada ação também tem um número de sequência (0 para a primeira ação já
+    registrada do jogador); `appended` é o total de ações registradas.
+    """
+    __slots__ = ('timestamps', 'types', 'amounts', 'refs', 'head', 'appended')
+
+    def __init__(self):
+        self.timestamps = array('d')
+        self.types = array('H')
+        self.amounts = array('d')
+        self.refs = array('q')
+        self.head = 0
+        self.appended = 0
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def append(self, timestamp, code, amount, ref, capacity=ACTION_CAPACITY):
+        """
+        Adiciona uma ação, sobrescrevendo a mais antiga se o buffer estiver cheio.
+
+        Returns:
+            tuple ou None: (timestamp, código, valor, referência) da ação descartada
+        """
+        self.appended += 1
+        if len(self.timestamps) < capacity:
+            self.timestamps.append(timestamp)
+            self.types.append(code)
+            self.amounts.append(amount)
+            self.refs.append(ref)
+            return None
+        head = self.head
+        evicted = (self.timestamps[head], self.types[head], self.amounts[head], self.refs[head])
+        self.timestamps[head] = timestamp
+        self.types[head] = code
+        self.amounts[head] = amount
+        self.refs[head] = ref
+        self.head = (head + 1) % capacity
+        return evicted
+
+    def _index(self, position):
+        """Converte a posição cronológica (0 = mais antiga, -1 = mais recente) em índice."""
+        size = len(self.timestamps)
+        if position < 0:
+            position += size
+        return (self.head + position) % size
+
+    def timestamp(self, position):
+        return self.timestamps[self._index(position)]
+
+    def type_code(self, position):
+        return self.types[self._index(position)]
+
+    def amount(self, position):
+        return self.amounts[self._index(position)]
+
+    def ref(self, position):
+        return self.refs[self._index(position)]
+
+    @property
+    def first_sequence(self):
+        """Número de sequência da ação mais antiga ainda no buffer."""
+        return self.appended - len(self.timestamps)
+
+    def timestamp_at(self, sequence):
+        """Timestamp da ação com o número de sequência informado (deve estar no buffer)."""
+        return self.timestamps[sequence % len(self.timestamps)]
+
+    def type_at(self, sequence):
+        return self.types[sequence % len(self.types)]
+
+    def chronological(self):
+        """Itera (timestamp, código, valor, referência) da ação mais antiga para a mais recente."""
+        size = len(self.timestamps)
+        for offset in range(size):
+            index = (self.head + offset) % size
+            yield self.timestamps[index], self.types[index], self.amounts[index], self.refs[index]
+
+class TypeWindow:
+    """
+    Estado incremental de um tipo de ação dentro do buffer de um jogador.
+
+    Mantém quantas ações do tipo estão no buffer, a soma dos seus valores
+    (NaN conta como 0) e o número de sequência da mais antiga. Quando essa
+    ação sai do buffer, a próxima ocorrência é procurada a partir dela; como
+    a posição só avança, o custo amortizado por ação é O(1).
+    """
+    __slots__ = ('code', 'count', 'oldest', 'total', '_compensation')
+
+    def __init__(self, code):
+        self.code = code
+        self.count = 0
+        self.oldest = -1
+        self.total = 0.0
+        self._compensation = 0.0
+
+    def _accumulate(self, value):
+        # Soma compensada (Neumaier): adições e remoções repetidas não acumulam erro
+        if value != value:
+            return
+        total = self.total + value
+        if abs(self.total) >= abs(value):
+            self._compensation += (self.total - total) + value
+        else:
+            self._compensation += (value - total) + self.total
+        self.total = total
+
+    @property
+    def amount(self):
+        """Soma dos valores das ações do tipo no buffer."""
+        return self.total + self._compensation
+
+    def add(self, sequence, amount):
+        """Registra uma nova ação do tipo (a mais recente do buffer)."""
+        if self.count == 0:
+            self.oldest = sequence
+        self.count += 1
+        self._accumulate(amount)
+
+    def remove(self, actions, sequence, amount):
+        """Registra a saída do buffer da ação mais antiga do tipo."""
+        self.count -= 1
+        self._accumulate(-amount)
+        if self.count == 0:
+            self.oldest = -1
+            self.total = self._compensation = 0.0
+            return
+        sequence += 1
+        while actions.type_at(sequence) != self.code:
+            sequence += 1
+        self.oldest = sequence
+
+def _number(value, default):
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+def encode_details(details):
+    """
+    Extrai dos detalhes da ação os campos guardados no buffer.
+
+    Apenas 'amount' (ou 'price', se 'amount' estiver ausente) e 'item_id'
+    (inteiro) são guardados; as demais chaves são descartadas. As regras de
+    utils.fraud_rules, o snapshot e o log de ações usam só esses dois campos,
+    e um dicionário por ação desfaria a economia de memória dos arrays. Uma
+    regra que precise de outro campo deve ganhar uma coluna em PlayerActions.
+
+    Returns:
+        tuple: (valor: 'amount' ou 'price', NaN se ausente; referência: 'item_id', -1 se ausente)
+    """
+    details = details or {}
+    item_id = details.get('item_id')
+    return (
+        _number(details.get('amount', details.get('price')), math.nan),
+        item_id if isinstance(item_id, int) else -1
+    )
+
+class ActionStore:
+    """Armazena as últimas ações de cada jogador em PlayerActions."""
+
+    def __init__(self, capacity=ACTION_CAPACITY):
+        self.capacity = capacity
+        self._players = {}
+
+    def record(self, player_id, action_type, timestamp, details=None):
+        """
+        Registra uma ação do jogador.
+
+        Returns:
+            tuple ou None: Ação descartada do buffer, se ele estava cheio
+        """
+        amount, ref = encode_details(details)
+        return self.append(player_id, intern_action_type(action_type), timestamp, amount, ref)
+
+    def append(self, player_id, code, timestamp, amount, ref):
+        """Registra uma ação já codificada (ver encode_details). Retorna a ação descartada ou None."""
+        actions = self._players.get(player_id)
+        if actions is None:
+            actions = self._players[player_id] = PlayerActions()
+        return actions.append(timestamp, code, amount, ref, self.capacity)
+
+    def get(self, player_id):
+        """Retorna o PlayerActions do jogador ou None."""
+        return self._players.get(player_id)
+
+    def __contains__(self, player_id):
+        return player_id in self._players
+
+    def __len__(self):
+        return len(self._players)
+
+    def players(self):
+        """Itera (player_id, PlayerActions) de todos os jogadores."""
+        return self._players.items()
+
+    def put(self, player_id, actions):
+        """Substitui o buffer do jogador (usado na restauração de snapshots)."""
+        self._players[player_id] = actions
+
+    def clear(self):
+        self._players.clear()
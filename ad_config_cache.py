@@ -0,0 +1,139 @@
+import json
+import time
+import uuid
+import threading
+from sqlalchemy import inspect
+from models.adsense import AdSenseConfig, AdUnit
+from utils.security_store import get_store
+
+class CachedRecord:
+    """
+    Cópia somente leitura das colunas de uma linha do banco.
+
+    Pode ser usada por qualquer requisição, fora da sessão do SQLAlchemy em
+    que a linha foi lida; to_dict() retorna o to_dict() do modelo no momento
+    da leitura.
+    """
+
+    def __init__(self, row):
+        for attribute in inspect(row).mapper.column_attrs:
+            setattr(self, attribute.key, getattr(row, attribute.key))
+        self._dict = row.to_dict()
+
+    def to_dict(self):
+        return dict(self._dict)
+
+class AdConfigSnapshot:
+    """Configuração ativa do AdSense: linha, ad_settings já decodificado e unidades ativas por local."""
+
+    def __init__(self, config, ad_settings, units, version):
+        self.config = config
+        self.ad_settings = ad_settings
+        self.units = units
+        self.version = version
+
+    def unit_for(self, placement):
+        """Retorna a unidade ativa do local ou None."""
+        return self.units.get(placement)
+
+class AdConfigCache:
+    """
+    Cache em memória da configuração ativa do AdSense e das unidades de anúncio.
+
+    O caminho de exibição de anúncios lê o snapshot em memória, sem consultas
+    ao banco. Toda escrita em AdSenseConfig ou AdUnit (admin.py e
+    adsense.py) chama invalidate(), que descarta o snapshot deste processo e
+    grava uma nova versão no backend de utils.security_store; os outros
+    workers comparam essa versão no máximo a cada `check_interval` segundos
+    e recarregam quando ela muda.
+    """
+
+    VERSION_KEY = 'adsense:config_version'
+
+    def __init__(self, check_interval=1.0, store=None):
+        self.check_interval = check_interval
+        self.store = store
+        self._snapshot = None
+        self._generation = 0
+        self._shared_version = None
+        self._next_check = 0
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def _store(self):
+        return self.store or get_store()
+
+    def _check_shared_version(self, now):
+        """Descarta o snapshot se outro worker gravou uma nova versão."""
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        version = self._store().get(self.VERSION_KEY)
+        if version != self._shared_version:
+            with self._lock:
+                self._shared_version = version
+                self._generation += 1
+                self._snapshot = None
+
+    def get(self):
+        """
+        Retorna a configuração ativa, lendo do banco apenas quando o cache foi invalidado.
+
+        Deve ser chamado dentro do contexto da aplicação.
+
+        Returns:
+            AdConfigSnapshot: Snapshot com config None se não houver configuração ativa
+        """
+        self._check_shared_version(time.time())
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        generation = self._generation
+        config = AdSenseConfig.query.filter_by(is_active=True).first()
+        if config is None:
+            snapshot = AdConfigSnapshot(None, {}, {}, generation)
+        else:
+            units = {}
+            for unit in AdUnit.query.filter_by(adsense_config_id=config.id, is_active=True).order_by(AdUnit.id):
+                # Como o .first() anterior: a primeira unidade ativa de cada local
+                units.setdefault(unit.placement, CachedRecord(unit))
+            ad_settings = json.loads(config.ad_settings) if config.ad_settings else {}
+            snapshot = AdConfigSnapshot(CachedRecord(config), ad_settings, units, generation)
+        self.loads += 1
+
+        with self._lock:
+            # Uma invalidação durante a leitura vale para a próxima chamada
+            if self._generation == generation:
+                self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        """Descarta o snapshot deste processo e avisa os outros workers. Chamar após o commit."""
+        version = uuid.uuid4().hex
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+            self._shared_version = version
+        try:
+            self._store().set(self.VERSION_KEY, version)
+        except Exception as e:
+            # Os outros workers continuam com o snapshot antigo até a próxima invalidação
+            print(f"AD CONFIG CACHE ERROR: {e}")
+
+    def stats(self):
+        """
+        Retorna métricas do cache.
+
+        Returns:
+            dict: Leituras do banco, acertos e versão local
+        """
+        return {
+            'loads': self.loads,
+            'hits': self.hits,
+            'generation': self._generation,
+        }
+
+ad_config_cache = AdConfigCache()
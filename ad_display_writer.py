@@ -0,0 +1,684 @@
+import os
+import json
+import time
+import fcntl
+import atexit
+import bisect
+import threading
+from datetime import datetime
+from sqlalchemy import inspect, select, func, case, bindparam
+from sqlalchemy.exc import IntegrityError
+from models.user import db
+from models.adsense import AdDisplay
+
+# Níveis de durabilidade, do mais seguro ao mais rápido:
+#   commit  - um commit por exibição e por mudança de status (comportamento anterior)
+#   fsync   - gravação em lote; cada mudança vai para o journal com fsync (sobrevive a queda do sistema)
+#   journal - gravação em lote; cada mudança vai para o journal sem fsync (sobrevive a queda do processo)
+#   memory  - gravação em lote sem journal (uma queda perde até um intervalo de gravação)
+DURABILITY_LEVELS = ('commit', 'fsync', 'journal', 'memory')
+
+# Colunas de AdDisplay gravadas como datetime
+DATETIME_FIELDS = ('displayed_at', 'protection_end_time', 'closed_at', 'click_timestamp')
+
+JOURNAL_PREFIX = 'ad-displays-'
+
+# Linhas que o banco recusou mesmo gravadas uma a uma, em JSON lines no diretório do journal
+DEAD_LETTER_FILE = 'dead-letter-ad-displays.log'
+
+# Próximo ID livre por tabela, para reservar IDs em blocos
+id_blocks = db.Table(
+    'id_block',
+    db.Column('name', db.String(64), primary_key=True),
+    db.Column('next_id', db.Integer, nullable=False),
+)
+
+class IdBlockAllocator:
+    """
+    Reserva IDs de uma tabela em blocos, para que as linhas tenham ID antes do INSERT.
+
+    Reservar um bloco é um UPDATE em id_block em uma transação própria, fora
+    da sessão da requisição; no SQLite o UPDATE serializa os workers. O
+    início do bloco nunca fica abaixo de MAX(id) + 1, então linhas inseridas
+    antes com autoincremento não colidem. IDs não usados de um bloco (ex:
+    reinício do processo) ficam como lacunas.
+    """
+
+    def __init__(self, model, block_size=1000):
+        self.model = model
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+        self.blocks = 0
+
+    def _reserve(self):
+        table = id_blocks
+        name = self.model.__tablename__
+        floor = select(func.coalesce(func.max(self.model.__table__.c.id), 0) + 1).scalar_subquery()
+        for attempt in range(2):
+            try:
+                with db.engine.begin() as conn:
+                    result = conn.execute(table.update().where(table.c.name == name).values(
+                        next_id=case((table.c.next_id > floor, table.c.next_id), else_=floor) + self.block_size
+                    ))
+                    if result.rowcount == 0:
+                        conn.execute(table.insert().values(name=name, next_id=floor + self.block_size))
+                    end = conn.execute(select(table.c.next_id).where(table.c.name == name)).scalar()
+                break
+            except IntegrityError:
+                # Outro worker criou a linha da tabela ao mesmo tempo
+                if attempt:
+                    raise
+        self.blocks += 1
+        return end - self.block_size, end
+
+    def next_id(self):
+        """Retorna um ID livre, reservando um novo bloco se o atual acabou. Requer o contexto da aplicação."""
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve()
+            value = self._next
+            self._next += 1
+            return value
+
+class _Batch:
+    """Exibições novas e mudanças de status ainda não gravadas no banco."""
+    __slots__ = ('inserts', 'updates', 'displayed', 'journals')
+
+    def __init__(self):
+        # ID -> linha completa a inserir
+        self.inserts = {}
+        # ID -> colunas alteradas de linhas que já estão no banco
+        self.updates = {}
+        # (coluna, valor, ad_unit_id) -> horários das exibições, em ordem
+        self.displayed = {}
+        # Arquivos do journal que cobrem este lote
+        self.journals = []
+
+    def __len__(self):
+        return len(self.inserts) + len(self.updates)
+
+    def add(self, row):
+        self.inserts[row['id']] = row
+        for column in ('session_id', 'ip_address', 'player_id'):
+            if row[column]:
+                self.displayed.setdefault((column, row[column], row['ad_unit_id']), []).append(row['displayed_at'])
+
+    def update(self, display_id, values):
+        row = self.inserts.get(display_id)
+        if row is not None:
+            # A linha ainda não foi inserida: sai com os valores finais
+            row.update(values)
+        else:
+            self.updates.setdefault(display_id, {}).update(values)
+
+    def merge(self, newer):
+        """Incorpora um lote mais recente (usado quando a gravação deste lote falha)."""
+        for row in newer.inserts.values():
+            self.add(row)
+        for display_id, values in newer.updates.items():
+            self.update(display_id, values)
+        self.journals.extend(newer.journals)
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+def _decode_fields(values):
+    for field in DATETIME_FIELDS:
+        if values.get(field):
+            values[field] = datetime.fromisoformat(values[field])
+    return values
+
+class AdDisplayJournal:
+    """
+    Journal em JSON lines das exibições e mudanças de status ainda não gravadas.
+
+    Cada processo grava em seu próprio arquivo, trocado a cada lote
+    (ad-displays-<pid>-<geração>.log) e mantido com flock enquanto o processo
+    vive; um arquivo só é removido depois que o lote que ele cobre foi
+    gravado no banco. Na inicialização, os arquivos que ninguém mantém
+    bloqueados são de processos encerrados e são reaplicados.
+    """
+
+    def __init__(self, directory, sync=False):
+        self.directory = directory
+        self.sync = sync
+        self._generation = 0
+        self._active = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        while True:
+            self._generation += 1
+            path = os.path.join(self.directory, f'{JOURNAL_PREFIX}{os.getpid()}-{self._generation:08d}.log')
+            # Um PID reutilizado não deve continuar o arquivo de um processo encerrado
+            if not os.path.exists(path):
+                break
+        # O arquivo só aparece com o nome final já bloqueado, então orphaned() nunca o vê livre
+        temporary = f'{path}.{threading.get_ident()}.tmp'
+        journal = open(temporary, 'w', encoding='utf-8')
+        try:
+            fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(temporary, path)
+        except Exception:
+            journal.close()
+            os.remove(temporary)
+            raise
+        return path, journal
+
+    def rotate(self):
+        """Passa a gravar em um novo arquivo e retorna o anterior (caminho, arquivo) ou None."""
+        previous, self._active = self._active, self._open()
+        return previous
+
+    def append(self, record):
+        journal = self._active[1]
+        journal.write(json.dumps(record, default=_encode, separators=(',', ':')) + '\n')
+        journal.flush()
+        if self.sync:
+            os.fsync(journal.fileno())
+
+    @staticmethod
+    def remove(journals):
+        """Remove arquivos cujo lote já foi gravado."""
+        for path, journal in journals:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            journal.close()
+
+    def close(self):
+        """Fecha o arquivo ativo, removendo-o se estiver vazio."""
+        if self._active is None:
+            return
+        path, journal = self._active
+        self._active = None
+        if journal.tell() == 0:
+            self.remove([(path, journal)])
+        else:
+            journal.close()
+
+    def orphaned(self):
+        """
+        Abre e bloqueia os arquivos de processos encerrados.
+
+        Returns:
+            list: (caminho, arquivo) em ordem de processo e geração
+        """
+        journals = []
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(JOURNAL_PREFIX) and name.endswith('.log')]
+        for name in sorted(names, key=lambda name: [int(part) for part in name[len(JOURNAL_PREFIX):-4].split('-')]):
+            pid = int(name[len(JOURNAL_PREFIX):].split('-')[0])
+            # Arquivos de processos vivos nunca são reaplicados, mesmo se o flock ainda não foi feito.
+            # O PID deste processo só aparece em arquivos de um processo encerrado (PID reutilizado),
+            # porque a recuperação roda antes do primeiro arquivo do journal ser aberto
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                journal = open(path, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                # Removido pelo dono ou por outro worker que o recuperou
+                continue
+            try:
+                fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Arquivo de um processo ainda ativo
+                journal.close()
+                continue
+            journals.append((path, journal))
+        return journals
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def read_journal(journal):
+    """
+    Lê os registros de um arquivo do journal.
+
+    Uma linha incompleta no fim do arquivo (queda durante a escrita) encerra a leitura.
+
+    Yields:
+        dict: Registros {'op': 'insert', 'row': ...} ou {'op': 'update', 'id': ..., 'values': ...}
+    """
+    for line in journal:
+        if not line.endswith('\n'):
+            return
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return
+        if record['op'] == 'insert':
+            _decode_fields(record['row'])
+        else:
+            _decode_fields(record['values'])
+        yield record
+
+class AdDisplayWriter:
+    """
+    Gravação em lote (write-behind) das exibições de anúncio.
+
+    Sem start() (scripts e testes), ou com durabilidade 'commit', cada
+    exibição e cada mudança de status fazem seu próprio commit, como antes.
+    Após start(), create() reserva o ID da exibição em um bloco
+    (IdBlockAllocator) e só registra a linha em memória (e no journal,
+    conforme a durabilidade); close() e click() registram a mudança de
+    status da mesma forma. Uma thread grava tudo a cada `flush_interval`
+    segundos, ou ao acumular `batch_size` mudanças, em uma transação com
+    INSERT e UPDATE de várias linhas. Se o banco recusar o lote por
+    integridade (ex: ID já usado por uma inserção com autoincremento), as
+    mudanças são gravadas uma a uma e as recusadas vão para o arquivo
+    DEAD_LETTER_FILE no diretório do journal; outros erros (banco
+    indisponível) devolvem o lote para a próxima gravação. A requisição
+    nunca grava o lote: create(), close_display() e click_display() apenas
+    registram a mudança.
+
+    Leituras por ID (get) e a verificação de intervalo de AdManager
+    consultam também o que ainda não foi gravado, então o processo vê as
+    próprias exibições imediatamente. Outros workers só as veem depois da
+    gravação, em no máximo `flush_interval` segundos.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.durability = 'commit'
+        self.flush_interval = 1.0
+        self.batch_size = 1000
+        self.dead_letter_path = None
+        self._ids = None
+        self._journal = None
+        self._current = _Batch()
+        self._flushing = None
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self.created = 0
+        self.updated = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+        self.batches = 0
+        self.flush_errors = 0
+        self.dead_letters = 0
+
+    @property
+    def buffered(self):
+        return self.app is not None and self.durability != 'commit'
+
+    def start(self, app, durability='journal', journal_dir=None, flush_interval=1.0,
+              batch_size=1000, id_block_size=1000):
+        """
+        Recupera os journals de processos encerrados e passa a gravar em lote.
+
+        Args:
+            app: Aplicação Flask (a gravação roda em seu contexto)
+            durability: Um de DURABILITY_LEVELS
+            journal_dir: Diretório do journal (obrigatório para 'fsync' e 'journal')
+            flush_interval: Segundos entre gravações
+            batch_size: Mudanças acumuladas que antecipam a gravação
+            id_block_size: IDs reservados por bloco
+
+        Returns:
+            dict: Arquivos, linhas inseridas e atualizadas na recuperação
+        """
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Invalid ad display durability: {durability}")
+        if durability in ('fsync', 'journal') and not journal_dir:
+            raise ValueError(f"Ad display durability '{durability}' requires a journal directory")
+        if self._flusher is not None:
+            raise RuntimeError('Ad display writer already started')
+
+        self.app = app
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._ids = IdBlockAllocator(AdDisplay, id_block_size)
+        if journal_dir:
+            self.dead_letter_path = os.path.join(journal_dir, DEAD_LETTER_FILE)
+
+        # Journals deixados por uma execução anterior, em qualquer modo
+        recovered = {'files': 0, 'inserted': 0, 'updated': 0}
+        if journal_dir and os.path.isdir(journal_dir):
+            recovered = self._recover(AdDisplayJournal(journal_dir))
+
+        if not self.buffered:
+            return recovered
+        if durability in ('fsync', 'journal'):
+            self._journal = AdDisplayJournal(journal_dir, sync=durability == 'fsync')
+            self._journal.rotate()
+
+        def run():
+            while True:
+                with self._condition:
+                    self._condition.wait_for(lambda: len(self._current) >= self.batch_size, self.flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"AD DISPLAY WRITER ERROR: {e}")
+                    time.sleep(self.flush_interval)
+
+        self._flusher = threading.Thread(target=run, name='ad-display-writer', daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+        return recovered
+
+    def _recover(self, journal):
+        journals = journal.orphaned()
+        if not journals:
+            return {'files': 0, 'inserted': 0, 'updated': 0}
+        batch = _Batch()
+        for path, handle in journals:
+            for record in read_journal(handle):
+                if record['op'] == 'insert':
+                    batch.add(record['row'])
+                else:
+                    batch.update(record['id'], record['values'])
+        with self.app.app_context():
+            # A queda pode ter ocorrido depois do commit e antes da remoção do journal
+            inserted, updated = self._write(batch, skip_existing=True)
+        journal.remove(journals)
+        return {'files': len(journals), 'inserted': inserted, 'updated': updated}
+
+    def _execute(self, rows, updates):
+        table = AdDisplay.__table__
+        if rows:
+            db.session.execute(table.insert(), rows)
+        # executemany exige as mesmas colunas em todos os parâmetros
+        groups = {}
+        for display_id, values in updates:
+            params = {f'new_{column}': value for column, value in values.items()}
+            params['display_id'] = display_id
+            groups.setdefault(tuple(sorted(values)), []).append(params)
+        for columns, params in groups.items():
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('display_id')).values(
+                    {column: bindparam(f'new_{column}') for column in columns}
+                ),
+                params
+            )
+
+    def _write(self, batch, skip_existing=False):
+        """
+        Grava o lote em uma transação. Deve ser chamado dentro do contexto da aplicação.
+
+        Com erro de integridade, grava as mudanças uma a uma (ver _write_each).
+
+        Returns:
+            tuple: (linhas inseridas, linhas atualizadas)
+        """
+        table = AdDisplay.__table__
+        rows = list(batch.inserts.values())
+        if skip_existing and rows:
+            ids = [row['id'] for row in rows]
+            existing = set()
+            for start in range(0, len(ids), 500):
+                existing.update(db.session.execute(
+                    select(table.c.id).where(table.c.id.in_(ids[start:start + 500]))
+                ).scalars())
+            rows = [row for row in rows if row['id'] not in existing]
+        updates = list(batch.updates.items())
+        try:
+            self._execute(rows, updates)
+            db.session.commit()
+            return len(rows), len(updates)
+        except IntegrityError:
+            db.session.rollback()
+        except Exception:
+            db.session.rollback()
+            raise
+        return self._write_each(batch, rows, updates)
+
+    def _write_each(self, batch, rows, updates):
+        """
+        Grava cada mudança em sua própria transação e manda as recusadas para o dead letter.
+
+        Cada mudança gravada ou recusada sai do lote, então se o banco cair no
+        meio, só o que faltou volta para a próxima gravação.
+        """
+        inserted = updated = 0
+        changes = [({'op': 'insert', 'row': row}, [row], []) for row in rows]
+        changes += [({'op': 'update', 'id': display_id, 'values': values}, [], [(display_id, values)])
+                    for display_id, values in updates]
+        for record, change_rows, change_updates in changes:
+            try:
+                self._execute(change_rows, change_updates)
+                db.session.commit()
+            except IntegrityError as e:
+                db.session.rollback()
+                self._dead_letter(record, e)
+            except Exception:
+                db.session.rollback()
+                raise
+            else:
+                inserted += len(change_rows)
+                updated += len(change_updates)
+            with self._lock:
+                if change_rows:
+                    batch.inserts.pop(change_rows[0]['id'], None)
+                else:
+                    batch.updates.pop(record['id'], None)
+        return inserted, updated
+
+    def _dead_letter(self, record, error):
+        """Registra uma mudança recusada pelo banco, que não será tentada de novo."""
+        self.dead_letters += 1
+        display_id = record['row']['id'] if record['op'] == 'insert' else record['id']
+        message = str(getattr(error, 'orig', error))
+        print(f"AD DISPLAY WRITER ERROR: {record['op']} of display {display_id} rejected: {message}")
+        if self.dead_letter_path is None:
+            return
+        try:
+            with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(dict(record, error=message), default=_encode, separators=(',', ':')) + '\n')
+        except OSError as e:
+            print(f"AD DISPLAY WRITER ERROR: {e}")
+
+    def flush(self):
+        """
+        Grava as mudanças pendentes em uma única transação.
+
+        Se o banco estiver indisponível, as mudanças voltam para o próximo
+        lote; mudanças recusadas por integridade vão para o dead letter.
+
+        Returns:
+            int: Número de linhas inseridas ou atualizadas
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not len(self._current):
+                    return 0
+                # Trocar o arquivo do journal antes do lote: se a troca falhar, nada mudou
+                previous = self._journal.rotate() if self._journal is not None else None
+                batch = self._current
+                self._current = _Batch()
+                self._flushing = batch
+                if previous is not None:
+                    batch.journals.append(previous)
+            try:
+                with self.app.app_context():
+                    inserted, updated = self._write(batch)
+            except Exception:
+                with self._lock:
+                    batch.merge(self._current)
+                    self._current = batch
+                    self._flushing = None
+                    self.flush_errors += 1
+                raise
+            with self._lock:
+                self._flushing = None
+                self.rows_inserted += inserted
+                self.rows_updated += updated
+                self.batches += 1
+            AdDisplayJournal.remove(batch.journals)
+            return inserted + updated
+
+    def close(self):
+        """Grava as mudanças pendentes e fecha o journal (chamado na saída do processo)."""
+        if not self.buffered:
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"AD DISPLAY WRITER ERROR: {e}")
+        with self._lock:
+            if self._journal is not None:
+                self._journal.close()
+
+    def _record(self, apply, record):
+        with self._condition:
+            apply(self._current)
+            if self._journal is not None:
+                self._journal.append(record)
+            if len(self._current) >= self.batch_size:
+                self._condition.notify()
+
+    def create(self, **values):
+        """
+        Cria uma exibição com as colunas informadas.
+
+        Returns:
+            AdDisplay: Linha gravada (modo 'commit') ou cópia fora da sessão com o ID já reservado
+        """
+        if not self.buffered:
+            ad_display = AdDisplay(**values)
+            db.session.add(ad_display)
+            db.session.commit()
+            return ad_display
+
+        row = dict(values, id=self._ids.next_id(), displayed_at=datetime.utcnow(),
+                   status='displayed', closed_at=None, click_timestamp=None)
+        self._record(lambda batch: batch.add(row), {'op': 'insert', 'row': row})
+        self.created += 1
+        return AdDisplay(**row)
+
+    def _update(self, ad_display, **values):
+        for column, value in values.items():
+            setattr(ad_display, column, value)
+        self._record(lambda batch: batch.update(ad_display.id, values),
+                     {'op': 'update', 'id': ad_display.id, 'values': values})
+        self.updated += 1
+        return True
+
+    def close_display(self, ad_display):
+        """Marca a exibição como fechada (AdDisplay.close_ad no modo 'commit')."""
+        if not self.buffered:
+            return ad_display.close_ad()
+        return self._update(ad_display, status='closed', closed_at=datetime.utcnow())
+
+    def click_display(self, ad_display):
+        """Registra o clique na exibição (AdDisplay.click_ad no modo 'commit')."""
+        if not self.buffered:
+            return ad_display.click_ad()
+        return self._update(ad_display, status='clicked', click_timestamp=datetime.utcnow())
+
+    def get(self, display_id):
+        """
+        Retorna a exibição com as mudanças ainda não gravadas aplicadas.
+
+        Returns:
+            AdDisplay ou None: Linha do banco (modo 'commit') ou cópia fora da sessão
+        """
+        if not self.buffered:
+            return AdDisplay.query.get(display_id)
+
+        # O buffer é lido antes do banco: uma linha gravada entre as duas leituras aparece no banco
+        with self._lock:
+            batches = [batch for batch in (self._flushing, self._current) if batch is not None]
+            row = None
+            updates = {}
+            for batch in batches:
+                if display_id in batch.inserts:
+                    row = dict(batch.inserts[display_id])
+                updates.update(batch.updates.get(display_id, {}))
+        if row is None:
+            stored = AdDisplay.query.get(display_id)
+            if stored is None:
+                return None
+            row = {attribute.key: getattr(stored, attribute.key) for attribute in inspect(stored).mapper.column_attrs}
+        row.update(updates)
+        return AdDisplay(**row)
+
+    def first_pending(self, session_id, ip_address, player_id, ad_unit_id, since):
+        """
+        Retorna a primeira exibição ainda não gravada da unidade após `since`, por sessão, IP e jogador.
+
+        Returns:
+            dict: 'session_interval', 'ip_interval' e 'player_interval' (None se não houver)
+        """
+        result = {'session_interval': None, 'ip_interval': None, 'player_interval': None}
+        if not self.buffered:
+            return result
+        keys = (('session_interval', 'session_id', session_id),
+                ('ip_interval', 'ip_address', ip_address),
+                ('player_interval', 'player_id', player_id))
+        with self._lock:
+            for batch in (self._flushing, self._current):
+                if batch is None:
+                    continue
+                for name, column, value in keys:
+                    displayed = batch.displayed.get((column, value, ad_unit_id)) if value else None
+                    if not displayed:
+                        continue
+                    index = bisect.bisect_right(displayed, since)
+                    if index < len(displayed) and (result[name] is None or displayed[index] < result[name]):
+                        result[name] = displayed[index]
+        return result
+
+    def stats(self):
+        """
+        Retorna métricas da gravação em lote.
+
+        Returns:
+            dict: Durabilidade, mudanças pendentes, exibições e mudanças de
+                  status registradas, linhas gravadas, lotes, erros e blocos de IDs
+        """
+        with self._lock:
+            return {
+                'durability': self.durability if self.app is not None else 'commit',
+                'pending': len(self._current) + (len(self._flushing) if self._flushing is not None else 0),
+                'created': self.created,
+                'updated': self.updated,
+                'rows_inserted': self.rows_inserted,
+                'rows_updated': self.rows_updated,
+                'batches': self.batches,
+                'flush_errors': self.flush_errors,
+                'dead_letters': self.dead_letters,
+                'id_blocks': self._ids.blocks if self._ids is not None else 0,
+            }
+
+ad_display_writer = AdDisplayWriter()
+
+def init_ad_display_writer(app):
+    """
+    Configura a gravação das exibições de anúncio.
+
+    Lê do app.config: AD_DISPLAY_DURABILITY (padrão 'journal'; ver
+    DURABILITY_LEVELS), AD_DISPLAY_JOURNAL_DIR, AD_DISPLAY_FLUSH_SECONDS,
+    AD_DISPLAY_BATCH_SIZE e AD_DISPLAY_ID_BLOCK. Deve
+    ser chamado antes de reconstruir o estado derivado das exibições
+    (grafo de fraudes e contadores de frequência), para que as exibições
+    recuperadas do journal já estejam no banco.
+    """
+    recovered = ad_display_writer.start(
+        app,
+        durability=app.config.get('AD_DISPLAY_DURABILITY', 'journal'),
+        journal_dir=app.config.get('AD_DISPLAY_JOURNAL_DIR'),
+        flush_interval=app.config.get('AD_DISPLAY_FLUSH_SECONDS', 1.0),
+        batch_size=app.config.get('AD_DISPLAY_BATCH_SIZE', 1000),
+        id_block_size=app.config.get('AD_DISPLAY_ID_BLOCK', 1000),
+    )
+    if recovered['files']:
+        print(f"AD DISPLAY JOURNAL: recovered {recovered['files']} files, inserted "
+              f"{recovered['inserted']} displays and applied {recovered['updated']} status changes")
+    return ad_display_writer
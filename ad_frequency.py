@@ -0,0 +1,376 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from models.user import db
+from models.adsense import AdDisplay
+from utils.security_store import get_store, SQLiteBackend, RedisBackend
+
+# Dimensões limitadas: (nome, chave da contagem em _check_fraud_limits, janela em minutos)
+DIMENSIONS = (
+    ('ip', 'ip_hour', 60),
+    ('session', 'session_day', 1440),
+    ('player', 'player_day', 1440),
+)
+
+def _minute(timestamp):
+    return int(timestamp // 60)
+
+class MinuteBuckets:
+    """
+    Exibições de uma chave em baldes de um minuto, com o total mantido à parte.
+
+    Só os minutos com exibições ocupam espaço; como os baldes chegam em
+    ordem, expirar os antigos é retirar do início da fila, e a contagem custa
+    O(1) amortizado.
+    """
+    __slots__ = ('buckets', 'total')
+
+    def __init__(self):
+        self.buckets = deque()
+        self.total = 0
+
+    def add(self, minute, amount=1):
+        # Relógio voltando para trás conta no último balde, para manter a ordem
+        if self.buckets and self.buckets[-1][0] >= minute:
+            self.buckets[-1][1] += amount
+        else:
+            self.buckets.append([minute, amount])
+        self.total += amount
+
+    def expire(self, oldest):
+        """Descarta os baldes anteriores ao minuto `oldest` e retorna o total restante."""
+        buckets = self.buckets
+        while buckets and buckets[0][0] < oldest:
+            self.total -= buckets.popleft()[1]
+        return self.total
+
+    @property
+    def last_minute(self):
+        return self.buckets[-1][0] if self.buckets else None
+
+class LocalFrequencyBackend:
+    """
+    Contadores na memória do processo (um único worker ou desenvolvimento).
+
+    Cada dimensão guarda as chaves em ordem de último uso; quando o minuto
+    muda, as chaves do início que ficaram sem baldes dentro da janela são
+    removidas, então IPs e sessões que não voltam não se acumulam.
+    """
+
+    def __init__(self):
+        self._keys = {name: OrderedDict() for name, _, _ in DIMENSIONS}
+        self._pruned_at = {name: None for name, _, _ in DIMENSIONS}
+        self._lock = threading.Lock()
+
+    def _prune(self, keys, oldest):
+        while keys:
+            key, buckets = next(iter(keys.items()))
+            if buckets.last_minute is not None and buckets.last_minute >= oldest:
+                break
+            del keys[key]
+
+    def add(self, dimension, key, minute, window):
+        oldest = minute - window
+        with self._lock:
+            keys = self._keys[dimension]
+            buckets = keys.get(key)
+            if buckets is None:
+                buckets = keys[key] = MinuteBuckets()
+            else:
+                keys.move_to_end(key)
+            buckets.add(minute)
+            buckets.expire(oldest)
+            # Chaves só deixam a janela quando o minuto avança
+            if self._pruned_at[dimension] != minute:
+                self._pruned_at[dimension] = minute
+                self._prune(keys, oldest)
+
+    def count(self, dimension, key, minute, window):
+        with self._lock:
+            buckets = self._keys[dimension].get(key)
+            return buckets.expire(minute - window) if buckets is not None else 0
+
+    def replace(self, dimension, key, items, minute, window):
+        """Substitui os baldes da chave por `items`, pares (minuto, contagem) em ordem."""
+        buckets = MinuteBuckets()
+        for bucket_minute, amount in items:
+            buckets.add(bucket_minute, amount)
+        buckets.expire(minute - window)
+        with self._lock:
+            keys = self._keys[dimension]
+            keys[key] = buckets
+            keys.move_to_end(key)
+
+    def claim_rebuild(self, ttl):
+        """O estado é do processo: cada worker reconstrói o seu."""
+        return True
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._keys.values())
+
+class StoreFrequencyBackend:
+    """
+    Contadores compartilhados entre os workers via utils.security_store.
+
+    Cada chave guarda os baldes serializados como 'minuto:contagem,...' e é
+    atualizada com a operação atômica update() do backend; a expiração da
+    chave acompanha a janela. O número de baldes por chave é limitado pelo
+    próprio limite de exibições, então ler e gravar continua custando O(1).
+    """
+
+    REBUILD_KEY = 'adfreq:rebuilt'
+
+    def __init__(self, store=None):
+        self.store = store
+
+    def _store(self):
+        return self.store or get_store()
+
+    @staticmethod
+    def _key(dimension, key):
+        return f'adfreq:{dimension}:{key}'
+
+    @staticmethod
+    def _decode(value):
+        if not value:
+            return []
+        return [[int(part) for part in bucket.split(':')] for bucket in str(value).split(',')]
+
+    @staticmethod
+    def _encode(buckets):
+        return ','.join(f'{minute}:{amount}' for minute, amount in buckets)
+
+    def add(self, dimension, key, minute, window):
+        oldest = minute - window
+
+        def increment(value):
+            buckets = [bucket for bucket in self._decode(value) if bucket[0] >= oldest]
+            if buckets and buckets[-1][0] >= minute:
+                buckets[-1][1] += 1
+            else:
+                buckets.append([minute, 1])
+            return self._encode(buckets), None
+
+        self._store().update(self._key(dimension, key), increment, ttl=(window + 1) * 60)
+
+    def count(self, dimension, key, minute, window):
+        oldest = minute - window
+        value = self._store().get(self._key(dimension, key))
+        return sum(amount for bucket_minute, amount in self._decode(value) if bucket_minute >= oldest)
+
+    def replace(self, dimension, key, items, minute, window):
+        buckets = [(bucket_minute, amount) for bucket_minute, amount in items if bucket_minute >= minute - window]
+        if buckets:
+            self._store().set(self._key(dimension, key), self._encode(buckets), ttl=(window + 1) * 60)
+
+    def claim_rebuild(self, ttl):
+        """Retorna True apenas para o primeiro worker a iniciar dentro de `ttl` segundos."""
+        return self._store().update(self.REBUILD_KEY, lambda value: (1, value is None), ttl=ttl)
+
+class AdFrequencyCaps:
+    """
+    Contagem de exibições de anúncio por IP (última hora), sessão e jogador (último dia).
+
+    Substitui os COUNT(*) sobre AdDisplay a cada verificação: create_ad_display
+    registra a exibição aqui e _check_fraud_limits lê as três contagens em
+    O(1). As janelas são medidas em minutos inteiros e incluem o minuto
+    anterior ao seu início, então a contagem pode ter até um minuto a mais
+    de exibições do que a janela exata (o limite fica mais rígido, nunca mais
+    frouxo).
+
+    Com o backend local e vários workers, reconcile() soma periodicamente as
+    exibições que os outros workers gravaram em AdDisplay desde a última
+    reconciliação. As exibições já contadas (registradas por este processo ou
+    lidas antes) são reconhecidas pelo ID, então nenhuma é contada duas vezes.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else LocalFrequencyBackend()
+        # Segundos de exibições relidos a cada reconciliação; None desativa o registro dos IDs
+        self.reconcile_margin = None
+        self.reconciled_at = None
+        self.reconciled = 0
+        # ID -> minuto das exibições já contadas dentro da margem
+        self._seen = {}
+        self._seen_lock = threading.Lock()
+        self._reconciler = None
+
+    @staticmethod
+    def _keys(session_id, ip_address, player_id):
+        for (dimension, name, window), key in zip(DIMENSIONS, (ip_address, session_id, player_id)):
+            if key:
+                yield dimension, name, window, key
+
+    def _mark_seen(self, display_id, minute):
+        """Marca a exibição como contada; retorna False se ela já tinha sido contada."""
+        with self._seen_lock:
+            if display_id in self._seen:
+                return False
+            self._seen[display_id] = minute
+            return True
+
+    def record(self, session_id, ip_address, player_id=None, now=None, display_id=None):
+        """
+        Registra uma exibição.
+
+        Args:
+            session_id: ID da sessão
+            ip_address: IP da requisição
+            player_id: ID do jogador (None para visitantes sem login)
+            now: Timestamp da exibição (padrão: agora)
+            display_id: ID do AdDisplay, para que reconcile() não o conte de novo
+        """
+        minute = _minute(time.time() if now is None else now)
+        if display_id is not None and self.reconcile_margin is not None and not self._mark_seen(display_id, minute):
+            return
+        for dimension, _, window, key in self._keys(session_id, ip_address, player_id):
+            self.backend.add(dimension, key, minute, window)
+
+    def counts(self, session_id, ip_address, player_id=None, now=None):
+        """
+        Retorna as exibições recentes da sessão, do IP e do jogador.
+
+        Returns:
+            dict: 'ip_hour', 'session_day' e 'player_day' (0 para chaves ausentes)
+        """
+        minute = _minute(time.time() if now is None else now)
+        counts = {name: 0 for _, name, _ in DIMENSIONS}
+        for dimension, name, window, key in self._keys(session_id, ip_address, player_id):
+            counts[name] = self.backend.count(dimension, key, minute, window)
+        return counts
+
+    def load_from_db(self, days=1):
+        """
+        Reconstrói os contadores a partir das exibições recentes.
+
+        Deve ser chamado dentro do contexto da aplicação. Com o backend
+        compartilhado apenas o primeiro worker a iniciar no dia reconstrói;
+        exibições feitas por outros workers durante a leitura podem ficar de
+        fora da contagem.
+
+        Returns:
+            int: Número de exibições lidas (0 se outro worker já reconstruiu)
+        """
+        if not self.backend.claim_rebuild(ttl=days * 86400):
+            return 0
+        now = time.time()
+        margin_minute = _minute(now - self.reconcile_margin) if self.reconcile_margin is not None else None
+        rows = db.session.query(
+            AdDisplay.id, AdDisplay.player_id, AdDisplay.ip_address, AdDisplay.session_id, AdDisplay.displayed_at
+        ).filter(
+            # Um minuto a mais: a janela em baldes começa no minuto anterior
+            AdDisplay.displayed_at > datetime.utcnow() - timedelta(days=days, minutes=1)
+        ).yield_per(10000)
+
+        minutes = {dimension: {} for dimension, _, _ in DIMENSIONS}
+        count = 0
+        for display_id, player_id, ip_address, session_id, displayed_at in rows:
+            # displayed_at é gravado em UTC sem fuso (datetime.utcnow)
+            minute = _minute(displayed_at.replace(tzinfo=timezone.utc).timestamp())
+            if margin_minute is not None and minute >= margin_minute:
+                # Relida pela próxima reconciliação
+                self._mark_seen(display_id, minute)
+            for dimension, _, _, key in self._keys(session_id, ip_address, player_id):
+                per_key = minutes[dimension].setdefault(key, {})
+                per_key[minute] = per_key.get(minute, 0) + 1
+            count += 1
+
+        minute = _minute(now)
+        for dimension, _, window in DIMENSIONS:
+            # Em ordem do último uso, como o backend local espera
+            for key, per_key in sorted(minutes[dimension].items(), key=lambda item: max(item[1])):
+                self.backend.replace(dimension, key, sorted(per_key.items()), minute, window)
+        self.reconciled_at = now
+        return count
+
+    def reconcile(self):
+        """
+        Soma as exibições gravadas por outros workers desde a última reconciliação.
+
+        Relê as exibições dos últimos reconcile_margin segundos antes da
+        reconciliação anterior (pelo índice de displayed_at), porque uma
+        exibição só chega ao banco quando o worker que a criou grava o seu
+        lote; exibições gravadas com mais atraso que a margem não são
+        contadas. Deve ser chamado dentro do contexto da aplicação.
+
+        Returns:
+            int: Número de exibições somadas
+        """
+        now = time.time()
+        since = (self.reconciled_at if self.reconciled_at is not None else now) - self.reconcile_margin
+        rows = db.session.query(
+            AdDisplay.id, AdDisplay.player_id, AdDisplay.ip_address, AdDisplay.session_id, AdDisplay.displayed_at
+        ).filter(
+            AdDisplay.displayed_at > datetime.utcfromtimestamp(since)
+        ).all()
+        added = 0
+        for display_id, player_id, ip_address, session_id, displayed_at in rows:
+            minute = _minute(displayed_at.replace(tzinfo=timezone.utc).timestamp())
+            if not self._mark_seen(display_id, minute):
+                continue
+            for dimension, _, window, key in self._keys(session_id, ip_address, player_id):
+                self.backend.add(dimension, key, minute, window)
+            added += 1
+        # Só as exibições que a próxima reconciliação ainda relê precisam continuar marcadas
+        oldest = _minute(now - self.reconcile_margin) - 1
+        with self._seen_lock:
+            self._seen = {display_id: minute for display_id, minute in self._seen.items() if minute >= oldest}
+        self.reconciled_at = now
+        self.reconciled += added
+        return added
+
+    def start_reconciler(self, app, interval=30.0, margin=300.0):
+        """Inicia uma thread daemon que chama reconcile() a cada `interval` segundos."""
+        self.reconcile_margin = margin
+        if self._reconciler is not None:
+            return self
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with app.app_context():
+                        self.reconcile()
+                except Exception as e:
+                    print(f"AD FREQUENCY ERROR: {e}")
+
+        self._reconciler = threading.Thread(target=run, name='ad-frequency-reconcile', daemon=True)
+        self._reconciler.start()
+        return self
+
+ad_frequency = AdFrequencyCaps()
+
+def init_ad_frequency(app):
+    """
+    Escolhe o backend dos contadores e os reconstrói a partir do banco.
+
+    Lê do app.config AD_FREQUENCY_BACKEND:
+        'auto' (padrão): 'store' se utils.security_store for compartilhado
+            entre os workers (SQLite ou Redis), senão 'local'
+        'store': contadores compartilhados via utils.security_store
+        'local': contadores na memória do processo, reconciliados com as
+            exibições dos outros workers a cada AD_FREQUENCY_RECONCILE_SECONDS
+            (padrão 30), relendo AD_FREQUENCY_RECONCILE_MARGIN segundos
+            (padrão 300)
+
+    Returns:
+        int: Número de exibições lidas
+    """
+    backend = app.config.get('AD_FREQUENCY_BACKEND', 'auto')
+    if backend == 'auto':
+        backend = 'store' if isinstance(get_store(), (SQLiteBackend, RedisBackend)) else 'local'
+    if backend == 'store':
+        ad_frequency.backend = StoreFrequencyBackend()
+    elif backend == 'local':
+        ad_frequency.backend = LocalFrequencyBackend()
+        # Antes da carga, para que ela marque as exibições que a primeira reconciliação relê
+        ad_frequency.start_reconciler(
+            app,
+            interval=app.config.get('AD_FREQUENCY_RECONCILE_SECONDS', 30.0),
+            margin=app.config.get('AD_FREQUENCY_RECONCILE_MARGIN', 300.0)
+        )
+    else:
+        raise ValueError(f"Unsupported AD_FREQUENCY_BACKEND: {backend}")
+    with app.app_context():
+        return ad_frequency.load_from_db()
@@ -1,10 +1,14 @@
 from datetime import datetime, timedelta
-import json
+from sqlalchemy import and_, or_, case, false
 from models.user import db
-from models.adsense import AdSenseConfig, AdUnit, AdDisplay
+from models.adsense import AdDisplay
 from models.player import Player
 from utils.security import log_security_event
 from utils.fraud_detection import FraudDetector
+from utils.fraud_graph import fraud_graph
+from utils.ad_config_cache import ad_config_cache
+from utils.ad_frequency import ad_frequency
+from utils.ad_display_writer import ad_display_writer
 
 class AdManager:
     """Gerenciador de anúncios com controle de intervalos e proteção."""
@@ -24,8 +28,9 @@ class AdManager:
             dict: Resultado da verificação com informações sobre disponibilidade
         """
         try:
-            # Verificar se o AdSense está configurado e ativo
-            config = AdSenseConfig.query.filter_by(is_active=True).first()
+            # Configuração ativa e unidades por local, do cache em memória
+            cached = ad_config_cache.get()
+            config = cached.config
             
             if not config:
                 return {
@@ -35,7 +40,7 @@ class AdManager:
                 }
             
             # Verificar configurações de anúncios
-            ad_settings = json.loads(config.ad_settings) if config.ad_settings else {}
+            ad_settings = cached.ad_settings
             
             # Verificar se anúncios estão habilitados para este local
             if placement == 'login' and not ad_settings.get('login_ads_enabled', True):
@@ -53,11 +58,7 @@ class AdManager:
                 }
             
             # Buscar uma unidade de anúncio ativa para o local
-            ad_unit = AdUnit.query.filter_by(
-                adsense_config_id=config.id,
-                placement=placement,
-                is_active=True
-            ).first()
+            ad_unit = cached.unit_for(placement)
             
             if not ad_unit:
                 return {
@@ -66,17 +67,20 @@ class AdManager:
                     'retry_after': None
                 }
             
-            # Verificar intervalo de anúncios
+            # Exibições da unidade dentro do intervalo, em uma única consulta
             ad_interval_minutes = ad_settings.get('ad_interval_minutes', 10)
-            interval_check = AdManager._check_ad_interval(
+            displays = AdManager._recent_display_stats(
                 session_id, ip_address, player_id, ad_unit.id, ad_interval_minutes
             )
             
+            # Verificar intervalo de anúncios
+            interval_check = AdManager._check_ad_interval(displays, player_id, ad_interval_minutes)
+            
             if not interval_check['can_show']:
                 return interval_check
             
             # Verificar limites de fraude
-            fraud_check = AdManager._check_fraud_limits(session_id, ip_address, player_id)
+            fraud_check = AdManager._check_fraud_limits(displays, session_id, ip_address, player_id)
             
             if not fraud_check['can_show']:
                 return fraud_check
@@ -97,85 +101,97 @@ class AdManager:
             }
     
     @staticmethod
-    def _check_ad_interval(session_id, ip_address, player_id, ad_unit_id, interval_minutes):
-        """Verifica se o intervalo entre anúncios foi respeitado."""
+    def _recent_display_stats(session_id, ip_address, player_id, ad_unit_id, interval_minutes):
+        """
+        Consulta em uma única instrução SQL as exibições usadas pelo intervalo entre anúncios.
+        
+        Uma agregação com CASE sobre as exibições da unidade para a sessão, o
+        IP ou o jogador dentro do intervalo substitui as três consultas
+        separadas; com os índices (chave, ad_unit_id, displayed_at) de
+        utils.migrations o banco lê apenas as linhas dessas três chaves na
+        unidade. As contagens dos limites de fraude vêm de utils.ad_frequency.
+        
+        Returns:
+            dict: 'now' e primeira exibição da unidade dentro do intervalo por
+                  sessão, IP e jogador ('session_interval', 'ip_interval',
+                  'player_interval'; None se não houver); None em caso de erro
+        """
         try:
-            # Verificar por sessão (mais específico)
-            recent_display_session = AdDisplay.query.filter_by(
-                session_id=session_id,
-                ad_unit_id=ad_unit_id
-            ).filter(
-                AdDisplay.displayed_at > datetime.utcnow() - timedelta(minutes=interval_minutes)
-            ).first()
-            
-            if recent_display_session:
-                next_available = recent_display_session.displayed_at + timedelta(minutes=interval_minutes)
-                return {
-                    'can_show': False,
-                    'reason': 'Ad interval not reached (session)',
-                    'retry_after': next_available.isoformat(),
-                    'seconds_remaining': int((next_available - datetime.utcnow()).total_seconds())
-                }
-            
-            # Verificar por IP (proteção adicional)
-            recent_display_ip = AdDisplay.query.filter_by(
-                ip_address=ip_address,
-                ad_unit_id=ad_unit_id
+            now = datetime.utcnow()
+            interval_start = now - timedelta(minutes=interval_minutes)
+            
+            # Exibições deste processo ainda não gravadas; lidas antes do banco para não perder
+            # uma exibição gravada entre as duas leituras
+            pending = ad_display_writer.first_pending(session_id, ip_address, player_id, ad_unit_id, interval_start)
+            
+            by_session = AdDisplay.session_id == session_id
+            by_ip = AdDisplay.ip_address == ip_address
+            by_player = AdDisplay.player_id == player_id if player_id else false()
+            
+            def first_display(criterion):
+                # MIN equivale à linha que o .first() sem ordenação retornava (ordem de inserção)
+                return db.func.min(case((criterion, AdDisplay.displayed_at)))
+            
+            # Cada ramo do OR é uma busca em um índice (chave, ad_unit_id, displayed_at)
+            in_interval = and_(AdDisplay.ad_unit_id == ad_unit_id, AdDisplay.displayed_at > interval_start)
+            row = db.session.query(
+                first_display(by_session).label('session_interval'),
+                first_display(by_ip).label('ip_interval'),
+                first_display(by_player).label('player_interval'),
             ).filter(
-                AdDisplay.displayed_at > datetime.utcnow() - timedelta(minutes=interval_minutes)
-            ).first()
-            
-            if recent_display_ip:
-                next_available = recent_display_ip.displayed_at + timedelta(minutes=interval_minutes)
-                return {
-                    'can_show': False,
-                    'reason': 'Ad interval not reached (IP)',
-                    'retry_after': next_available.isoformat(),
-                    'seconds_remaining': int((next_available - datetime.utcnow()).total_seconds())
-                }
-            
-            # Verificar por jogador se estiver logado
-            if player_id:
-                recent_display_player = AdDisplay.query.filter_by(
-                    player_id=player_id,
-                    ad_unit_id=ad_unit_id
-                ).filter(
-                    AdDisplay.displayed_at > datetime.utcnow() - timedelta(minutes=interval_minutes)
-                ).first()
-                
-                if recent_display_player:
-                    next_available = recent_display_player.displayed_at + timedelta(minutes=interval_minutes)
-                    return {
-                        'can_show': False,
-                        'reason': 'Ad interval not reached (player)',
-                        'retry_after': next_available.isoformat(),
-                        'seconds_remaining': int((next_available - datetime.utcnow()).total_seconds())
-                    }
-            
-            return {'can_show': True}
+                or_(and_(by_session, in_interval), and_(by_ip, in_interval), and_(by_player, in_interval))
+            ).one()
+            
+            stats = row._asdict()
+            for key, displayed_at in pending.items():
+                if displayed_at is not None and (stats[key] is None or displayed_at < stats[key]):
+                    stats[key] = displayed_at
+            stats['now'] = now
+            return stats
         
         except Exception as e:
             log_security_event('ad_interval_check_error', str(e), 'error')
+            return None
+    
+    @staticmethod
+    def _check_ad_interval(displays, player_id, interval_minutes):
+        """Verifica se o intervalo entre anúncios foi respeitado."""
+        if displays is None:
             return {
                 'can_show': False,
                 'reason': 'Error checking ad interval',
                 'retry_after': None
             }
+        
+        # Verificar por sessão (mais específico), por IP (proteção adicional) e por jogador se estiver logado
+        checks = [('session_interval', 'Ad interval not reached (session)'),
+                  ('ip_interval', 'Ad interval not reached (IP)')]
+        if player_id:
+            checks.append(('player_interval', 'Ad interval not reached (player)'))
+        
+        for key, reason in checks:
+            recent_display_at = displays[key]
+            if recent_display_at:
+                next_available = recent_display_at + timedelta(minutes=interval_minutes)
+                return {
+                    'can_show': False,
+                    'reason': reason,
+                    'retry_after': next_available.isoformat(),
+                    'seconds_remaining': int((next_available - datetime.utcnow()).total_seconds())
+                }
+        
+        return {'can_show': True}
     
     @staticmethod
-    def _check_fraud_limits(session_id, ip_address, player_id):
+    def _check_fraud_limits(displays, session_id, ip_address, player_id):
         """Verifica limites de fraude para anúncios."""
         try:
-            now = datetime.utcnow()
+            now = displays['now']
+            # Exibições recentes por IP, sessão e jogador, de utils.ad_frequency
+            counts = ad_frequency.counts(session_id, ip_address, player_id)
             
             # Limite de anúncios por IP por hora (máximo 20)
-            ip_displays_hour = AdDisplay.query.filter_by(
-                ip_address=ip_address
-            ).filter(
-                AdDisplay.displayed_at > now - timedelta(hours=1)
-            ).count()
-            
-            if ip_displays_hour >= 20:
+            if counts['ip_hour'] >= 20:
                 return {
                     'can_show': False,
                     'reason': 'IP hourly limit exceeded',
@@ -183,13 +199,7 @@ class AdManager:
                 }
             
             # Limite de anúncios por sessão por dia (máximo 50)
-            session_displays_day = AdDisplay.query.filter_by(
-                session_id=session_id
-            ).filter(
-                AdDisplay.displayed_at > now - timedelta(days=1)
-            ).count()
-            
-            if session_displays_day >= 50:
+            if counts['session_day'] >= 50:
                 return {
                     'can_show': False,
                     'reason': 'Session daily limit exceeded',
@@ -199,13 +209,7 @@ class AdManager:
             # Se for um jogador logado, verificar limites específicos
             if player_id:
                 # Limite de anúncios por jogador por dia (máximo 100)
-                player_displays_day = AdDisplay.query.filter_by(
-                    player_id=player_id
-                ).filter(
-                    AdDisplay.displayed_at > now - timedelta(days=1)
-                ).count()
-                
-                if player_displays_day >= 100:
+                if counts['player_day'] >= 100:
                     return {
                         'can_show': False,
                         'reason': 'Player daily limit exceeded',
@@ -221,6 +225,15 @@ class AdManager:
                         'retry_after': None
                     }
             
+            # Risco do cluster: jogadores ligados pelo mesmo IP ou sessão (contas rotativas)
+            cluster_score = fraud_graph.cluster_risk(player_id, ip_address, session_id)
+            if cluster_score > 80:
+                return {
+                    'can_show': False,
+                    'reason': 'High cluster fraud score detected',
+                    'retry_after': None
+                }
+            
             return {'can_show': True}
         
         except Exception as e:
@@ -237,7 +250,7 @@ class AdManager:
         Cria um registro de exibição de anúncio.
         
         Args:
-            ad_unit (AdUnit): Unidade de anúncio a ser exibida
+            ad_unit (CachedRecord): Unidade de anúncio a ser exibida (ver utils.ad_config_cache)
             session_id (str): ID da sessão do usuário
             ip_address (str): IP do usuário
             user_agent (str): User agent do navegador
@@ -248,12 +261,11 @@ class AdManager:
         """
         try:
             # Obter configurações de proteção
-            config = AdSenseConfig.query.filter_by(is_active=True).first()
-            ad_settings = json.loads(config.ad_settings) if config and config.ad_settings else {}
+            ad_settings = ad_config_cache.get().ad_settings
             protection_seconds = ad_settings.get('ad_protection_seconds', 30)
             
-            # Criar registro de exibição
-            ad_display = AdDisplay(
+            # Criar registro de exibição (gravado em lote, ver utils.ad_display_writer)
+            ad_display = ad_display_writer.create(
                 ad_unit_id=ad_unit.id,
                 player_id=player_id,
                 session_id=session_id,
@@ -262,8 +274,11 @@ class AdManager:
                 protection_end_time=datetime.utcnow() + timedelta(seconds=protection_seconds)
             )
             
-            db.session.add(ad_display)
-            db.session.commit()
+            # Ligar jogador, IP e sessão no grafo de fraudes
+            fraud_graph.link(player_id, ip_address, session_id)
+            
+            # Contar a exibição nos limites por IP, sessão e jogador
+            ad_frequency.record(session_id, ip_address, player_id, display_id=ad_display.id)
             
             # Registrar para detecção de fraudes
             if player_id:
@@ -296,7 +311,7 @@ class AdManager:
             dict: Status do anúncio com informações de tempo
         """
         try:
-            ad_display = AdDisplay.query.get(display_id)
+            ad_display = ad_display_writer.get(display_id)
             
             if not ad_display:
                 return {
@@ -342,7 +357,7 @@ class AdManager:
             dict: Resultado da operação de fechamento
         """
         try:
-            ad_display = AdDisplay.query.get(display_id)
+            ad_display = ad_display_writer.get(display_id)
             
             if not ad_display:
                 return {
@@ -370,7 +385,7 @@ class AdManager:
                 }
             
             # Fechar o anúncio
-            success = ad_display.close_ad()
+            success = ad_display_writer.close_display(ad_display)
             
             if success:
                 # Registrar para detecção de fraudes
@@ -418,7 +433,7 @@ class AdManager:
             dict: Resultado da operação de clique
         """
         try:
-            ad_display = AdDisplay.query.get(display_id)
+            ad_display = ad_display_writer.get(display_id)
             
             if not ad_display:
                 return {
@@ -444,7 +459,7 @@ class AdManager:
                 }
             
             # Registrar o clique
-            success = ad_display.click_ad()
+            success = ad_display_writer.click_display(ad_display)
             
             if success:
                 # Registrar para detecção de fraudes
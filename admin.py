@@ -10,7 +10,12 @@ from models.adsense import AdSenseConfig, AdUnit, AdDisplay, AdRevenue
 from models.security_log import SecurityLog
 from models.auth import RevokedToken
 from models.item import CollectibleCard, PlayerCollectibleCard
-from utils.security import token_required, admin_required, log_security_event
+from utils.security import auth_required, log_security_event, verify_token, revoke_current_token
+from utils.revocation import revoke_token
+from utils.security_events import event_sampler, configure_event_sampling
+from utils.fraud_rules import get_rule_engine
+from utils.fraud_detection import FraudDetector, fraud_alerts
+from utils.ad_config_cache import ad_config_cache
 from decimal import Decimal
 import json
 
@@ -18,8 +23,7 @@ admin_bp = Blueprint("admin", __name__)
 
 # --- Item Management ---
 @admin_bp.route("/items", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def create_item():
     """Cria um novo item."""
     data = request.get_json()
@@ -55,8 +59,7 @@ def create_item():
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/items", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_items():
     """Retorna todos os itens com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -89,8 +92,7 @@ def get_all_items():
     })
 
 @admin_bp.route("/items/<int:item_id>", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_item(item_id):
     """Retorna um item específico pelo ID."""
     item = Item.query.get(item_id)
@@ -99,8 +101,7 @@ def get_item(item_id):
     return jsonify(item.to_dict())
 
 @admin_bp.route("/items/<int:item_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_item(item_id):
     """Atualiza um item existente."""
     item = Item.query.get(item_id)
@@ -138,8 +139,7 @@ def update_item(item_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/items/<int:item_id>", methods=["DELETE"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def delete_item(item_id):
     """Deleta um item."""
     item = Item.query.get(item_id)
@@ -161,8 +161,7 @@ def delete_item(item_id):
 
 # --- Scenario Management ---
 @admin_bp.route("/scenarios", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def create_scenario():
     """Cria um novo cenário."""
     data = request.get_json()
@@ -198,8 +197,7 @@ def create_scenario():
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/scenarios", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_scenarios():
     """Retorna todos os cenários com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -229,8 +227,7 @@ def get_all_scenarios():
     })
 
 @admin_bp.route("/scenarios/<int:scenario_id>", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_scenario_admin(scenario_id):
     """Retorna um cenário específico pelo ID."""
     scenario = Scenario.query.get(scenario_id)
@@ -239,8 +236,7 @@ def get_scenario_admin(scenario_id):
     return jsonify(scenario.to_dict())
 
 @admin_bp.route("/scenarios/<int:scenario_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_scenario(scenario_id):
     """Atualiza um cenário existente."""
     scenario = Scenario.query.get(scenario_id)
@@ -278,8 +274,7 @@ def update_scenario(scenario_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/scenarios/<int:scenario_id>", methods=["DELETE"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def delete_scenario(scenario_id):
     """Deleta um cenário."""
     scenario = Scenario.query.get(scenario_id)
@@ -298,8 +293,7 @@ def delete_scenario(scenario_id):
 
 # --- Monster Management ---
 @admin_bp.route("/monsters", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def create_monster():
     """Cria um novo monstro."""
     data = request.get_json()
@@ -332,8 +326,7 @@ def create_monster():
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/monsters", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_monsters():
     """Retorna todos os monstros com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -363,8 +356,7 @@ def get_all_monsters():
     })
 
 @admin_bp.route("/monsters/<int:monster_id>", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_monster(monster_id):
     """Retorna um monstro específico pelo ID."""
     monster = Monster.query.get(monster_id)
@@ -373,8 +365,7 @@ def get_monster(monster_id):
     return jsonify(monster.to_dict())
 
 @admin_bp.route("/monsters/<int:monster_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_monster(monster_id):
     """Atualiza um monstro existente."""
     monster = Monster.query.get(monster_id)
@@ -409,8 +400,7 @@ def update_monster(monster_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/monsters/<int:monster_id>", methods=["DELETE"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def delete_monster(monster_id):
     """Deleta um monstro."""
     monster = Monster.query.get(monster_id)
@@ -429,8 +419,7 @@ def delete_monster(monster_id):
 
 # --- Collectible Card Management ---
 @admin_bp.route("/cards", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def create_card():
     """Cria uma nova carta colecionável."""
     data = request.get_json()
@@ -461,8 +450,7 @@ def create_card():
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/cards", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_cards():
     """Retorna todas as cartas colecionáveis com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -492,8 +480,7 @@ def get_all_cards():
     })
 
 @admin_bp.route("/cards/<int:card_id>", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_card(card_id):
     """Retorna uma carta colecionável específica pelo ID."""
     card = CollectibleCard.query.get(card_id)
@@ -502,8 +489,7 @@ def get_card(card_id):
     return jsonify(card.to_dict())
 
 @admin_bp.route("/cards/<int:card_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_card(card_id):
     """Atualiza uma carta colecionável existente."""
     card = CollectibleCard.query.get(card_id)
@@ -536,8 +522,7 @@ def update_card(card_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/cards/<int:card_id>", methods=["DELETE"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def delete_card(card_id):
     """Deleta uma carta colecionável."""
     card = CollectibleCard.query.get(card_id)
@@ -556,8 +541,7 @@ def delete_card(card_id):
 
 # --- User Management ---
 @admin_bp.route("/users", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_users():
     """Retorna todos os usuários com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -581,8 +565,7 @@ def get_all_users():
     })
 
 @admin_bp.route("/users/<int:user_id>", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_user(user_id):
     """Retorna um usuário específico pelo ID."""
     user = User.query.get(user_id)
@@ -591,8 +574,7 @@ def get_user(user_id):
     return jsonify(user.to_dict())
 
 @admin_bp.route("/users/<int:user_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_user(user_id):
     """Atualiza um usuário existente."""
     user = User.query.get(user_id)
@@ -616,8 +598,7 @@ def update_user(user_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/users/<int:user_id>/ban", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def ban_user(user_id):
     """Bane um usuário (desativa a conta)."""
     user = User.query.get(user_id)
@@ -635,8 +616,7 @@ def ban_user(user_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/users/<int:user_id>/unban", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def unban_user(user_id):
     """Desbane um usuário (ativa a conta)."""
     user = User.query.get(user_id)
@@ -655,8 +635,7 @@ def unban_user(user_id):
 
 # --- General Stats/Dashboard ---
 @admin_bp.route("/dashboard", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_dashboard_stats():
     """Retorna estatísticas gerais para o dashboard administrativo."""
     try:
@@ -687,8 +666,7 @@ def get_dashboard_stats():
 
 # --- Security Logs ---
 @admin_bp.route("/security-logs", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_security_logs():
     """Retorna logs de segurança com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -711,10 +689,111 @@ def get_security_logs():
         "current_page": logs.page
     })
 
+@admin_bp.route("/security-logs/sampling", methods=["GET"])
+@auth_required(admin=True)
+def get_security_log_sampling():
+    """Retorna a configuração de amostragem dos eventos de segurança."""
+    return jsonify(event_sampler.get_config())
+
+@admin_bp.route("/security-logs/sampling", methods=["PUT"])
+@auth_required(admin=True)
+def update_security_log_sampling():
+    """Altera a amostragem e a severidade mínima dos eventos de segurança."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
+    try:
+        config = configure_event_sampling(
+            sample_rates=data.get("sample_rates"),
+            min_severity=data.get("min_severity"),
+            rollup_interval=data.get("rollup_interval")
+        )
+        log_security_event("admin_action", f"Admin updated security log sampling: {config}", "warning", user_id=request.token_payload["user_id"])
+        return jsonify(config)
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+# --- Token Revocation ---
+@admin_bp.route("/tokens/revoke", methods=["POST"])
+@auth_required(admin=True)
+def revoke_user_token():
+    """Revoga um token JWT informado (ex: token vazado de um usuário)."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("token"), str):
+        return jsonify({"error": "Request body must contain the token"}), 400
+    payload = verify_token(data["token"])
+    if payload is None:
+        return jsonify({"error": "Token is invalid, expired or already revoked"}), 400
+    try:
+        if not revoke_token(payload):
+            return jsonify({"error": "Token has no jti and cannot be revoked"}), 400
+        log_security_event("admin_action", f"Admin revoked a token of user {payload.get('user_id')}", "warning", user_id=request.token_payload["user_id"])
+        return jsonify({"message": "Token revoked successfully"}), 200
+    except Exception as e:
+        db.session.rollback()
+        log_security_event("admin_action_error", f"Error revoking token: {e}", "error", user_id=request.token_payload["user_id"])
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route("/logout", methods=["POST"])
+@auth_required(admin=True)
+def admin_logout():
+    """Encerra a sessão do administrador revogando o token da requisição."""
+    try:
+        revoke_current_token()
+        return jsonify({"message": "Logged out successfully"}), 200
+    except Exception as e:
+        db.session.rollback()
+        log_security_event("admin_action_error", f"Error revoking token on logout: {e}", "error", user_id=request.token_payload["user_id"])
+        return jsonify({"error": str(e)}), 500
+
+@admin_bp.route("/fraud/rules", methods=["GET"])
+@auth_required(admin=True)
+def get_fraud_rules():
+    """Retorna as regras de fraude ativas, os limites e o tempo de avaliação de cada regra."""
+    engine = get_rule_engine()
+    return jsonify({
+        "thresholds": engine.thresholds,
+        "rules": engine.stats()
+    })
+
+@admin_bp.route("/fraud/alerts", methods=["GET"])
+@auth_required(admin=True)
+def get_fraud_alerts():
+    """Lista alertas de fraude com paginação por cursor (before_timestamp e before_id)."""
+    reviewed = request.args.get("reviewed")
+    if reviewed is not None:
+        reviewed = reviewed.lower() == "true"
+    limit = min(request.args.get("limit", 50, type=int), 200)
+    before_timestamp = request.args.get("before_timestamp", type=float)
+    before_id = request.args.get("before_id", type=int)
+    before = (before_timestamp, before_id) if before_timestamp is not None and before_id is not None else None
+
+    alerts = FraudDetector.get_fraud_alerts(reviewed=reviewed, limit=limit, before=before)
+    next_cursor = None
+    if len(alerts) == limit:
+        next_cursor = {"before_timestamp": alerts[-1]["timestamp"], "before_id": alerts[-1]["id"]}
+    return jsonify({"alerts": alerts, "next_cursor": next_cursor})
+
+@admin_bp.route("/fraud/alerts/stats", methods=["GET"])
+@auth_required(admin=True)
+def get_fraud_alert_stats():
+    """Retorna o volume de alertas criados, agrupados e gravados."""
+    return jsonify(fraud_alerts.stats())
+
+@admin_bp.route("/fraud/alerts/<int:alert_id>/review", methods=["PUT"])
+@auth_required(admin=True)
+def review_fraud_alert(alert_id):
+    """Marca um alerta de fraude como revisado."""
+    data = request.get_json() or {}
+    admin_id = request.token_payload["user_id"]
+    if not FraudDetector.mark_alert_as_reviewed(alert_id, admin_id, data.get("action_taken")):
+        return jsonify({"error": "Alert not found"}), 404
+    log_security_event("admin_action", f"Admin reviewed fraud alert {alert_id}", "info", user_id=admin_id)
+    return jsonify({"message": "Alert marked as reviewed"})
+
 # --- AdSense Management (Admin) ---
 @admin_bp.route("/adsense/config", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_adsense_config_admin():
     """Obtém a configuração do AdSense para o admin."""
     config = AdSenseConfig.query.first()
@@ -723,8 +802,7 @@ def get_adsense_config_admin():
     return jsonify(config.to_dict())
 
 @admin_bp.route("/adsense/config", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_adsense_config_admin():
     """Atualiza a configuração do AdSense."""
     config = AdSenseConfig.query.first()
@@ -746,6 +824,7 @@ def update_adsense_config_admin():
         config.is_active = data.get("is_active", config.is_active)
 
         db.session.commit()
+        ad_config_cache.invalidate()
         log_security_event("admin_action", "Admin updated AdSense config", "info", user_id=request.token_payload["user_id"])
         return jsonify(config.to_dict())
     except Exception as e:
@@ -754,8 +833,7 @@ def update_adsense_config_admin():
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/adsense/ad-units", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def create_ad_unit_admin():
     """Cria uma nova unidade de anúncio."""
     data = request.get_json()
@@ -768,6 +846,7 @@ def create_ad_unit_admin():
         )
         db.session.add(new_ad_unit)
         db.session.commit()
+        ad_config_cache.invalidate()
         log_security_event("admin_action", f"Admin created AdSense ad unit: {new_ad_unit.name}", "info", user_id=request.token_payload["user_id"])
         return jsonify(new_ad_unit.to_dict()), 201
     except KeyError as e:
@@ -778,16 +857,14 @@ def create_ad_unit_admin():
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/adsense/ad-units", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_ad_units_admin():
     """Retorna todas as unidades de anúncio."""
     ad_units = AdUnit.query.all()
     return jsonify([au.to_dict() for au in ad_units])
 
 @admin_bp.route("/adsense/ad-units/<int:ad_unit_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_ad_unit_admin(ad_unit_id):
     """Atualiza uma unidade de anúncio existente."""
     ad_unit = AdUnit.query.get(ad_unit_id)
@@ -802,6 +879,7 @@ def update_ad_unit_admin(ad_unit_id):
         ad_unit.is_active = data.get("is_active", ad_unit.is_active)
 
         db.session.commit()
+        ad_config_cache.invalidate()
         log_security_event("admin_action", f"Admin updated AdSense ad unit: {ad_unit.name} (ID: {ad_unit.id})", "info", user_id=request.token_payload["user_id"])
         return jsonify(ad_unit.to_dict())
     except Exception as e:
@@ -810,8 +888,7 @@ def update_ad_unit_admin(ad_unit_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/adsense/ad-units/<int:ad_unit_id>", methods=["DELETE"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def delete_ad_unit_admin(ad_unit_id):
     """Deleta uma unidade de anúncio."""
     ad_unit = AdUnit.query.get(ad_unit_id)
@@ -821,6 +898,7 @@ def delete_ad_unit_admin(ad_unit_id):
     try:
         db.session.delete(ad_unit)
         db.session.commit()
+        ad_config_cache.invalidate()
         log_security_event("admin_action", f"Admin deleted AdSense ad unit: {ad_unit.name} (ID: {ad_unit.id})", "info", user_id=request.token_payload["user_id"])
         return jsonify({"message": "Ad unit deleted successfully"}), 200
     except Exception as e:
@@ -830,8 +908,7 @@ def delete_ad_unit_admin(ad_unit_id):
 
 # --- Player Management ---
 @admin_bp.route("/players", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_players():
     """Retorna todos os jogadores com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -858,8 +935,7 @@ def get_all_players():
     })
 
 @admin_bp.route("/players/<int:player_id>", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_player(player_id):
     """Retorna um jogador específico pelo ID."""
     player = Player.query.get(player_id)
@@ -868,8 +944,7 @@ def get_player(player_id):
     return jsonify(player.to_dict())
 
 @admin_bp.route("/players/<int:player_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_player(player_id):
     """Atualiza um jogador existente."""
     player = Player.query.get(player_id)
@@ -896,8 +971,7 @@ def update_player(player_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/players/<int:player_id>/give-item", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def give_item_to_player(player_id):
     """Dá um item a um jogador."""
     player = Player.query.get(player_id)
@@ -928,8 +1002,7 @@ def give_item_to_player(player_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/players/<int:player_id>/give-card", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def give_card_to_player(player_id):
     """Dá uma carta colecionável a um jogador."""
     player = Player.query.get(player_id)
@@ -960,8 +1033,7 @@ def give_card_to_player(player_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/players/<int:player_id>/remove-item", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def remove_item_from_player(player_id):
     """Remove um item do inventário de um jogador."""
     player = Player.query.get(player_id)
@@ -992,8 +1064,7 @@ def remove_item_from_player(player_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/players/<int:player_id>/remove-card", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def remove_card_from_player(player_id):
     """Remove uma carta colecionável de um jogador."""
     player = Player.query.get(player_id)
@@ -1025,8 +1096,7 @@ def remove_card_from_player(player_id):
 
 # --- Shop Item Management ---
 @admin_bp.route("/shop-items", methods=["POST"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def create_shop_item():
     """Adiciona um item à loja."""
     data = request.get_json()
@@ -1058,8 +1128,7 @@ def create_shop_item():
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/shop-items", methods=["GET"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def get_all_shop_items():
     """Retorna todos os itens da loja com paginação e filtros."""
     page = request.args.get("page", 1, type=int)
@@ -1083,8 +1152,7 @@ def get_all_shop_items():
     })
 
 @admin_bp.route("/shop-items/<int:shop_item_id>", methods=["PUT"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def update_shop_item(shop_item_id):
     """Atualiza um item da loja existente."""
     shop_item = ShopItem.query.get(shop_item_id)
@@ -1110,8 +1178,7 @@ def update_shop_item(shop_item_id):
         return jsonify({"error": str(e)}), 500
 
 @admin_bp.route("/shop-items/<int:shop_item_id>", methods=["DELETE"])
-@token_required
-@admin_required
+@auth_required(admin=True)
 def delete_shop_item(shop_item_id):
     """Remove um item da loja."""
     shop_item = ShopItem.query.get(shop_item_id)
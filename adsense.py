@@ -6,6 +6,7 @@ from models.user import db
 from models.adsense import AdSenseConfig, AdUnit, AdDisplay, AdRevenue
 from utils.security import token_required, log_security_event
 from utils.ad_manager import AdManager
+from utils.ad_config_cache import ad_config_cache
 
 adsense_bp = Blueprint('adsense', __name__)
 
@@ -73,6 +74,7 @@ def create_adsense_config():
             db.session.add(config)
         
         db.session.commit()
+        ad_config_cache.invalidate()
         
         log_security_event('adsense_config_updated', 
                           f'AdSense configuration updated for publisher {config.publisher_id}', 
@@ -162,6 +164,7 @@ def oauth_callback():
         
         config.is_active = True
         db.session.commit()
+        ad_config_cache.invalidate()
         
         log_security_event('adsense_oauth_success', 
                           f'AdSense OAuth authorization successful for publisher {config.publisher_id}', 
@@ -204,6 +207,7 @@ def refresh_access_token():
             access_token=token_info['access_token'],
             expires_in=token_info.get('expires_in', 3600)
         )
+        ad_config_cache.invalidate()
         
         log_security_event('adsense_token_refreshed', 
                           f'AdSense token refreshed for publisher {config.publisher_id}', 
@@ -263,6 +267,7 @@ def create_ad_unit():
         
         db.session.add(ad_unit)
         db.session.commit()
+        ad_config_cache.invalidate()
         
         log_security_event('adsense_ad_unit_created', 
                           f'Ad unit created: {ad_unit.unit_name} ({ad_unit.placement})', 
@@ -303,6 +308,7 @@ def update_ad_unit(unit_id):
         
         ad_unit.updated_at = datetime.utcnow()
         db.session.commit()
+        ad_config_cache.invalidate()
         
         log_security_event('adsense_ad_unit_updated', 
                           f'Ad unit updated: {ad_unit.unit_name}', 
@@ -330,6 +336,7 @@ def delete_ad_unit(unit_id):
         unit_name = ad_unit.unit_name
         db.session.delete(ad_unit)
         db.session.commit()
+        ad_config_cache.invalidate()
         
         log_security_event('adsense_ad_unit_deleted', 
                           f'Ad unit deleted: {unit_name}', 
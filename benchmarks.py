@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks dos componentes de segurança e anúncios.
+
+Uso:
+    python benchmarks.py rate_limit
+    python benchmarks.py admin_auth
+    python benchmarks.py validation
+    python benchmarks.py login_tracker
+    python benchmarks.py action_store
+    python benchmarks.py fraud_batch
+    python benchmarks.py fraud_snapshot
+    python benchmarks.py fraud_graph
+    python benchmarks.py ad_eligibility
+    python benchmarks.py ad_frequency
+    python benchmarks.py ad_display_writes
+"""
+
+import sys
+import time
+import random
+import threading
+
+def _timed(label, func, operations):
+    """Executa func e imprime o custo médio por operação."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<44} {elapsed:8.3f}s  {elapsed / operations * 1e6:8.2f} us/op")
+    return elapsed
+
+def bench_rate_limit(distinct_ips=10000, requests_per_ip=100, max_requests=100, window_seconds=60):
+    """Compara o limitador antigo (lista de timestamps) com os novos motores."""
+    from utils.rate_limiter import SlidingWindowCounter, TokenBucket
+
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(distinct_ips)]
+    traffic = ips * requests_per_ip
+    random.Random(42).shuffle(traffic)
+    operations = len(traffic)
+    print(f"{distinct_ips} IPs, {operations} requisições, limite {max_requests}/{window_seconds}s")
+
+    def list_based():
+        # Implementação anterior do decorator rate_limit
+        request_counts = {}
+        now = 1_700_000_000.0
+        for client_ip in traffic:
+            now += 0.00005
+            if client_ip not in request_counts:
+                request_counts[client_ip] = []
+            request_counts[client_ip] = [t for t in request_counts[client_ip] if now - t < window_seconds]
+            if len(request_counts[client_ip]) >= max_requests:
+                continue
+            request_counts[client_ip].append(now)
+
+    def engine(limiter_class):
+        def run():
+            limiter = limiter_class(max_requests, window_seconds)
+            now = 1_700_000_000.0
+            for client_ip in traffic:
+                now += 0.00005
+                limiter.hit(client_ip, now)
+        return run
+
+    _timed('lista de timestamps (anterior)', list_based, operations)
+    _timed('sliding_window', engine(SlidingWindowCounter), operations)
+    _timed('token_bucket', engine(TokenBucket), operations)
+
+def bench_admin_auth(requests=20000):
+    """Compara a autenticação de rotas admin antes e depois do cache de tokens."""
+    import jwt
+    from functools import wraps
+    from flask import Flask, request, jsonify
+    from utils.security import generate_token, auth_required, clear_token_cache
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'benchmark-secret'
+
+    def legacy_decorator(admin):
+        # token_required/admin_required anteriores: decodificação completa a cada camada
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                auth_header = request.headers.get('Authorization', '')
+                token = auth_header.split(' ')[1] if auth_header.startswith('Bearer ') else None
+                if not token:
+                    return jsonify({'error': 'Token is missing'}), 401
+                try:
+                    payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+                except jwt.InvalidTokenError:
+                    return jsonify({'error': 'Token is invalid or expired'}), 401
+                if admin and not payload.get('is_admin', False):
+                    return jsonify({'error': 'Admin privileges required'}), 403
+                request.token_payload = payload
+                return f(*args, **kwargs)
+            return decorated
+        return decorator
+
+    def view():
+        return request.token_payload['user_id']
+
+    legacy_view = legacy_decorator(False)(legacy_decorator(True)(view))
+    cached_view = auth_required(admin=True)(view)
+
+    with app.app_context():
+        token = generate_token(1, is_admin=True)
+    headers = {'Authorization': f'Bearer {token}'}
+    print(f"{requests} requisições a uma rota admin com o mesmo token")
+
+    def run(decorated_view):
+        def loop():
+            for _ in range(requests):
+                with app.test_request_context('/api/admin/items', headers=headers):
+                    decorated_view()
+        return loop
+
+    clear_token_cache()
+    _timed('sem autenticação (custo do contexto)', run(lambda: None), requests)
+    _timed('token_required + admin_required (anterior)', run(legacy_view), requests)
+    _timed('auth_required(admin=True) + cache', run(cached_view), requests)
+
+def bench_validation(records=200000):
+    """Compara os validadores anteriores com o módulo utils.validation."""
+    import re
+    from utils.validation import validate_records
+
+    rng = random.Random(7)
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!@#$%&*._-'
+    corpus = [
+        {
+            'username': ''.join(rng.choice(alphabet[:62] + '_-') for _ in range(rng.randint(2, 22))),
+            'email': f"user{i}@example{rng.choice(['.com', '.org', '', '.c'])}",
+            'password': ''.join(rng.choice(alphabet) for _ in range(rng.randint(6, 16))),
+            'bio': f"<b>jogador {i}</b>; 'olá'",
+        }
+        for i in range(records)
+    ]
+    print(f"{records} registros sintéticos")
+
+    def legacy():
+        # Implementações anteriores de utils.security
+        for record in corpus:
+            errors = {}
+            if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', record['email']):
+                errors['email'] = 'Invalid email'
+            if not re.match(r'^[a-zA-Z0-9_-]{3,20}$', record['username']):
+                errors['username'] = 'Invalid username'
+            password = record['password']
+            if (len(password) < 8 or not re.search(r'[A-Z]', password) or not re.search(r'[a-z]', password)
+                    or not re.search(r'[0-9]', password) or not re.search(r'[!@#$%^&*(),.?":{}|<>]', password)):
+                errors['password'] = 'Invalid password'
+            re.sub(r'[<>\'";]', '', record['bio'])
+
+    def batched():
+        validate_records(corpus, {'email': 'email', 'username': 'username', 'password': 'password'},
+                         sanitize=('bio',))
+
+    _timed('validadores anteriores', legacy, records)
+    _timed('validate_records', batched, records)
+
+def bench_login_tracker(keys=1000000, threads=4):
+    """Estresse do rastreador de logins com 1M chaves: memória por chave e custo por falha."""
+    import gc
+    import tracemalloc
+    from utils.login_tracker import LoginAttemptTracker
+    from utils.security_store import MemoryBackend
+
+    tracker = LoginAttemptTracker(store=MemoryBackend())
+    ips = [f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}" for i in range(keys)]
+    print(f"{keys} chaves, {threads} threads")
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    now = 1_700_000_000.0
+    def fill():
+        for ip in ips:
+            tracker.record_failure(f'ip:{ip}', now)
+    _timed('primeira falha de cada chave', fill, keys)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    # As strings das chaves são criadas pelo próprio benchmark e entram na conta
+    print(f"{len(tracker)} chaves rastreadas, {used / len(tracker):.0f} bytes por chave")
+
+    def hammer(offset):
+        def run():
+            for i in range(offset, keys, threads):
+                tracker.record_failure(f'ip:{ips[i]}', now + 1)
+        return run
+
+    def concurrent():
+        workers = [threading.Thread(target=hammer(t)) for t in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    _timed('segunda falha, threads concorrentes', concurrent, keys)
+
+def bench_action_store(players=100000, actions_per_player=100):
+    """Memória das ações de 100k jogadores ativos: deques de dicionários x arrays paralelos."""
+    import resource
+    from datetime import datetime
+    from collections import defaultdict, deque
+    from utils.action_store import ActionStore
+
+    action_types = ['kill_monster', 'earn_coins', 'buy_item', 'self_eliminate', 'watch_ad']
+    operations = players * actions_per_player
+    print(f"{players} jogadores, {actions_per_player} ações por jogador")
+    # tracemalloc deixaria 10M alocações lentas demais: mede-se o crescimento do pico de RSS.
+    # As duas estruturas ficam vivas até o fim para que uma não reaproveite a memória da outra.
+    kept = []
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+
+    def measure(label, fill):
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        _timed(label, lambda: kept.append(fill()), operations)
+        used = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before) * rss_unit
+        print(f"{'':<44} {used / 2**20:8.1f} MiB  {used / operations:8.1f} bytes/ação")
+
+    def legacy():
+        # Estrutura anterior de fraud_detection.player_actions
+        player_actions = defaultdict(lambda: deque(maxlen=100))
+        now = 1_700_000_000.0
+        for step in range(actions_per_player):
+            action_type = action_types[step % len(action_types)]
+            for player_id in range(players):
+                now += 0.001
+                player_actions[player_id].append({
+                    'timestamp': now,
+                    'datetime': datetime.utcfromtimestamp(now).isoformat(),
+                    'action_type': action_type,
+                    'details': {'amount': step}
+                })
+        return player_actions
+
+    def columnar():
+        store = ActionStore(capacity=100)
+        now = 1_700_000_000.0
+        for step in range(actions_per_player):
+            action_type = action_types[step % len(action_types)]
+            for player_id in range(players):
+                now += 0.001
+                store.record(player_id, action_type, now, {'amount': step})
+        return store
+
+    measure('ActionStore (arrays paralelos)', columnar)
+    measure('deque de dicionários (anterior)', legacy)
+
+def bench_fraud_batch(actions=10000000, players=100000):
+    """Reavaliação em lote de um histórico sintético com utils.fraud_batch."""
+    import numpy as np
+    from utils.fraud_batch import ActionHistory, analyze
+    from utils.action_store import intern_action_type
+
+    rng = np.random.default_rng(11)
+    action_types = ['kill_monster', 'earn_coins', 'buy_item', 'self_eliminate', 'watch_ad']
+    codes = np.array([intern_action_type(name) for name in action_types], dtype=np.int32)
+    player_ids = rng.integers(0, players, actions)
+    timestamps = 1_700_000_000.0 + np.cumsum(rng.exponential(0.01, actions))
+    type_codes = codes[rng.choice(len(codes), actions, p=[0.4, 0.3, 0.1, 0.1, 0.1])]
+    amounts = rng.random(actions) * 1e-6
+    print(f"{actions} ações, {players} jogadores")
+
+    holder = {}
+    _timed('ActionHistory (ordenação e grupos)',
+           lambda: holder.update(history=ActionHistory(player_ids, timestamps, type_codes, amounts)), actions)
+    _timed('analyze (4 regras)', lambda: holder.update(result=analyze(holder['history'])), actions)
+    result = holder['result']
+    for name, counts in result['violations'].items():
+        print(f"{name:<44} {int(counts.sum()):>10} violações  {int((counts > 0).sum()):>8} jogadores")
+
+def bench_fraud_snapshot(players=1000000, actions_per_player=10, log_actions=200000):
+    """Snapshot e restauração do estado de FraudDetector para 1M jogadores."""
+    import shutil
+    import tempfile
+    from utils.fraud_detection import FraudDetector, player_actions, player_stats
+    from utils.fraud_snapshot import FraudSnapshots
+
+    action_types = ['kill_monster', 'earn_coins', 'buy_item', 'self_eliminate', 'watch_ad']
+    print(f"{players} jogadores, {actions_per_player} ações por jogador, {log_actions} ações no log")
+    # Estado montado diretamente: analisar 10M ações levaria minutos
+    now = 1_700_000_000.0
+    for player_id in range(players):
+        stats = player_stats[player_id] = FraudDetector.new_player_stats()
+        for step in range(actions_per_player):
+            action_type = action_types[step % len(action_types)]
+            now += 0.001
+            player_actions.record(player_id, action_type, now, {'amount': step})
+            stats['action_counts'][action_type] += 1
+            stats['last_actions'][action_type] = now
+            stats['total_actions'] += 1
+
+    directory = tempfile.mkdtemp(prefix='fraud-snapshot-')
+    try:
+        snapshots = FraudSnapshots(directory)
+        snapshots.start(interval=float('inf'))
+        _timed('snapshot', snapshots.snapshot, players)
+
+        def analyze_with_log():
+            # Ações espaçadas de 1s por jogador: nenhuma regra dispara
+            for step in range(log_actions):
+                FraudDetector.analyze_action(step % players, action_types[step % len(action_types)], None, now + step)
+            snapshots.log.flush()
+        _timed('análise com log de ações', analyze_with_log, log_actions)
+        snapshots.stop()
+
+        result = {}
+        _timed('restauração (snapshot + replay do log)',
+               lambda: result.update(FraudSnapshots(directory).restore()), players)
+        print(f"{'':<44} {result['players']} jogadores, {result['replayed']} ações reaplicadas")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+def bench_fraud_graph(displays=1000000, players=300000, ips=50000, lookups=200000):
+    """Vínculos jogador/IP/sessão e consulta de risco do cluster em utils.fraud_graph."""
+    from utils.fraud_graph import FraudGraph
+
+    rng = random.Random(5)
+    graph = FraudGraph()
+    now = time.time()
+    # Cada jogador usa poucos IPs e sessões próprias; alguns IPs são compartilhados
+    traffic = []
+    for _ in range(displays):
+        player_id = rng.randrange(players)
+        ip_address = f"10.{player_id % ips // 256 % 256}.{player_id % ips % 256}.{rng.randrange(2)}"
+        traffic.append((player_id, ip_address, f"sess-{player_id}-{rng.randrange(3)}"))
+    print(f"{displays} exibições, {players} jogadores, {ips} IPs")
+
+    def link():
+        for player_id, ip_address, session_id in traffic:
+            graph.link(player_id, ip_address, session_id)
+    _timed('link (exibição de anúncio)', link, displays)
+    for player_id in range(0, players, 100):
+        graph.record_risk(player_id, 90, now)
+
+    queries = [traffic[rng.randrange(displays)] for _ in range(lookups)]
+    def lookup():
+        for player_id, ip_address, session_id in queries:
+            graph.cluster_risk(player_id, ip_address, session_id, now=now)
+    _timed('cluster_risk', lookup, lookups)
+    print(graph.stats())
+
+def _ad_app(path):
+    """Aplicação Flask mínima com o banco SQLite em `path`, para os benchmarks de anúncios."""
+    from flask import Flask
+    from models.user import db
+    import models.adsense  # noqa: F401 (registra as tabelas)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{path}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def _seed_ad_displays(rows, sessions, ips, players, hours=48):
+    """Insere exibições em ordem cronológica nas últimas `hours` horas."""
+    from datetime import datetime, timedelta
+    from models.user import db
+    from models.adsense import AdDisplay
+
+    rng = random.Random(9)
+    now = datetime.utcnow()
+    offsets = sorted((rng.random() * hours * 3600 for _ in range(rows)), reverse=True)
+    batch = []
+    for offset in offsets:
+        displayed_at = now - timedelta(seconds=offset)
+        batch.append({
+            'ad_unit_id': rng.randrange(1, 3),
+            'player_id': rng.randrange(players) if rng.random() < 0.7 else None,
+            'session_id': f"sess-{rng.randrange(sessions)}",
+            'ip_address': f"10.0.{rng.randrange(ips) // 256}.{rng.randrange(ips) % 256}",
+            'user_agent': 'bench',
+            'displayed_at': displayed_at,
+            'protection_end_time': displayed_at + timedelta(seconds=30),
+        })
+        if len(batch) == 10000:
+            db.session.execute(AdDisplay.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(AdDisplay.__table__.insert(), batch)
+    db.session.commit()
+
+def bench_ad_eligibility(rows=1000000, requests=2000):
+    """Consultas e latência por verificação de intervalo e limites de anúncio: seis consultas x uma + contadores (configuração padrão)."""
+    import os
+    import tempfile
+    from datetime import datetime, timedelta
+    from sqlalchemy import event
+    from models.user import db
+    from models.adsense import AdDisplay
+    from utils.ad_manager import AdManager
+    from utils.ad_frequency import ad_frequency, init_ad_frequency
+    from utils.migrations import ensure_indexes
+
+    path = os.path.join(tempfile.mkdtemp(prefix='ad-bench-'), 'ads.db')
+    app = _ad_app(path)
+    rng = random.Random(4)
+    sessions, ips, players = 100000, 20000, 50000
+    traffic = [(f"sess-{rng.randrange(sessions)}", f"10.0.{rng.randrange(ips) // 256}.{rng.randrange(ips) % 256}",
+                rng.randrange(players), rng.randrange(1, 3)) for _ in range(requests)]
+    print(f"{rows} exibições, {requests} verificações")
+
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+        _seed_ad_displays(rows, sessions, ips, players)
+    # Configuração padrão: AD_FREQUENCY_BACKEND 'auto' com o security_store memory://
+    init_ad_frequency(app)
+    print(f"backend de frequência: {type(ad_frequency.backend).__name__}")
+
+    with app.app_context():
+        statements = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: statements.append(1))
+
+        def legacy():
+            # Implementação anterior de _check_ad_interval + _check_fraud_limits: até seis consultas
+            for session_id, ip_address, player_id, ad_unit_id in traffic:
+                now = datetime.utcnow()
+                interval_start = now - timedelta(minutes=10)
+                if AdDisplay.query.filter_by(session_id=session_id, ad_unit_id=ad_unit_id).filter(
+                        AdDisplay.displayed_at > interval_start).first():
+                    continue
+                if AdDisplay.query.filter_by(ip_address=ip_address, ad_unit_id=ad_unit_id).filter(
+                        AdDisplay.displayed_at > interval_start).first():
+                    continue
+                if AdDisplay.query.filter_by(player_id=player_id, ad_unit_id=ad_unit_id).filter(
+                        AdDisplay.displayed_at > interval_start).first():
+                    continue
+                if AdDisplay.query.filter_by(ip_address=ip_address).filter(
+                        AdDisplay.displayed_at > now - timedelta(hours=1)).count() >= 20:
+                    continue
+                if AdDisplay.query.filter_by(session_id=session_id).filter(
+                        AdDisplay.displayed_at > now - timedelta(days=1)).count() >= 50:
+                    continue
+                AdDisplay.query.filter_by(player_id=player_id).filter(
+                    AdDisplay.displayed_at > now - timedelta(days=1)).count()
+
+        limit_statements = []
+
+        def combined():
+            for session_id, ip_address, player_id, ad_unit_id in traffic:
+                displays = AdManager._recent_display_stats(session_id, ip_address, player_id, ad_unit_id, 10)
+                if AdManager._check_ad_interval(displays, player_id, 10)['can_show']:
+                    before = len(statements)
+                    AdManager._check_fraud_limits(displays, session_id, ip_address, player_id)
+                    limit_statements.append(len(statements) - before)
+
+        for label, func in (('seis consultas (anterior)', legacy), ('consulta do intervalo + contadores', combined)):
+            statements.clear()
+            _timed(label, func, requests)
+            print(f"{'':<44} {len(statements) / requests:8.2f} consultas/verificação")
+        print(f"consultas em _check_fraud_limits: {sum(limit_statements)} em {len(limit_statements)} verificações")
+    os.remove(path)
+
+def bench_ad_frequency(rows=1000000, operations=200000):
+    """Registro e leitura dos contadores de exibição por backend e reconstrução a partir do banco."""
+    import os
+    import tempfile
+    from models.user import db
+    from utils.ad_frequency import AdFrequencyCaps, LocalFrequencyBackend, StoreFrequencyBackend
+    from utils.security_store import MemoryBackend, SQLiteBackend
+
+    rng = random.Random(6)
+    keys = [(f"sess-{rng.randrange(100000)}", f"10.0.{rng.randrange(80)}.{rng.randrange(256)}", rng.randrange(50000))
+            for _ in range(operations)]
+    directory = tempfile.mkdtemp(prefix='ad-frequency-bench-')
+    backends = (
+        ('local', LocalFrequencyBackend()),
+        ('store memory://', StoreFrequencyBackend(MemoryBackend())),
+        ('store sqlite', StoreFrequencyBackend(SQLiteBackend(os.path.join(directory, 'store.db')))),
+    )
+    for label, backend in backends:
+        caps = AdFrequencyCaps(backend)
+        count = operations if label == 'local' else operations // 10
+        start = time.time()
+
+        def record():
+            for offset, (session_id, ip_address, player_id) in enumerate(keys[:count]):
+                caps.record(session_id, ip_address, player_id, now=start + offset * 0.01)
+
+        def counts():
+            for session_id, ip_address, player_id in keys[:count]:
+                caps.counts(session_id, ip_address, player_id, now=start + count * 0.01)
+
+        _timed(f"{label}: record", record, count)
+        _timed(f"{label}: counts", counts, count)
+
+    app = _ad_app(os.path.join(directory, 'ads.db'))
+    with app.app_context():
+        db.create_all()
+        _seed_ad_displays(rows, 100000, 20000, 50000, hours=24)
+        caps = AdFrequencyCaps()
+        _timed('load_from_db (exibições)', caps.load_from_db, rows)
+    os.remove(os.path.join(directory, 'ads.db'))
+    os.remove(os.path.join(directory, 'store.db'))
+
+def bench_ad_display_writes(displays=20000):
+    """Exibições criadas (metade fechada depois) por nível de durabilidade: commit por linha x gravação em lote."""
+    import os
+    import shutil
+    import tempfile
+    from datetime import datetime, timedelta
+    from models.user import db
+    from utils.ad_display_writer import AdDisplayWriter, DURABILITY_LEVELS
+
+    print(f"{displays} exibições, {displays // 2} fechamentos")
+    for durability in DURABILITY_LEVELS:
+        directory = tempfile.mkdtemp(prefix='ad-writes-bench-')
+        app = _ad_app(os.path.join(directory, 'ads.db'))
+        with app.app_context():
+            db.create_all()
+            writer = AdDisplayWriter()
+            writer.start(app, durability=durability, journal_dir=os.path.join(directory, 'journal'))
+            count = displays if durability != 'commit' else displays // 10
+
+            def requests():
+                for i in range(count):
+                    ad_display = writer.create(
+                        ad_unit_id=1, player_id=i % 5000, session_id=f"sess-{i % 20000}",
+                        ip_address=f"10.0.{i % 80}.{i % 256}", user_agent='bench',
+                        protection_end_time=datetime.utcnow() - timedelta(seconds=1)
+                    )
+                    if i % 2:
+                        writer.close_display(ad_display)
+
+            elapsed = _timed(f"{durability}: requisições", requests, count)
+            start = time.perf_counter()
+            writer.close()
+            elapsed += time.perf_counter() - start
+            print(f"{'':<44} {count / elapsed:8.0f} exibições/s com a gravação final")
+        shutil.rmtree(directory)
+
+BENCHMARKS = {
+    'rate_limit': bench_rate_limit,
+    'admin_auth': bench_admin_auth,
+    'validation': bench_validation,
+    'login_tracker': bench_login_tracker,
+    'action_store': bench_action_store,
+    'fraud_batch': bench_fraud_batch,
+    'fraud_snapshot': bench_fraud_snapshot,
+    'fraud_graph': bench_fraud_graph,
+    'ad_eligibility': bench_ad_eligibility,
+    'ad_frequency': bench_ad_frequency,
+    'ad_display_writes': bench_ad_display_writes,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -0,0 +1,349 @@
+import json
+import time
+import atexit
+import itertools
+import threading
+from collections import deque, OrderedDict
+from datetime import datetime, timezone
+from sqlalchemy import and_, or_, bindparam
+from models.user import db
+from models.security_log import FraudAlert
+
+def _to_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+def _stored_details(alert):
+    """Detalhes gravados em FraudAlert; alertas agrupados levam a contagem e a última ocorrência."""
+    details = alert['details']
+    if alert.get('count', 1) > 1:
+        details = dict(details, occurrences=alert['count'], last_seen=_to_datetime(alert['last_seen']).isoformat())
+    return json.dumps(details, default=str)
+
+def _row_to_alert(row):
+    """Converte uma linha de FraudAlert no formato de alerta usado por FraudDetector."""
+    timestamp = row.timestamp.replace(tzinfo=timezone.utc).timestamp()
+    details = json.loads(row.details) if row.details else {}
+    count = details.pop('occurrences', 1)
+    last_seen = details.pop('last_seen', None)
+    alert = {
+        'id': row.id,
+        'timestamp': timestamp,
+        'datetime': row.timestamp.isoformat(),
+        'player_id': row.player_id,
+        'alert_type': row.alert_type,
+        'details': details,
+        'reviewed': bool(row.reviewed),
+        'count': count,
+        'last_seen': datetime.fromisoformat(last_seen).replace(tzinfo=timezone.utc).timestamp() if last_seen else timestamp,
+    }
+    if row.reviewed_by is not None:
+        alert['reviewed_by'] = row.reviewed_by
+    if row.review_time is not None:
+        alert['review_time'] = row.review_time.replace(tzinfo=timezone.utc).timestamp()
+        alert['review_datetime'] = row.review_time.isoformat()
+    if row.action_taken:
+        alert['action_taken'] = row.action_taken
+    return alert
+
+class FraudAlertStore:
+    """
+    Armazenamento dos alertas de fraude.
+
+    Os alertas recentes ficam em uma camada quente limitada (deque) e, após
+    start_persistence(app), são gravados na tabela FraudAlert em lotes; o id
+    de cada alerta é preenchido quando o lote é gravado. A listagem usa
+    paginação por chave (timestamp, id) sobre o índice (reviewed, timestamp)
+    criado em utils.migrations, então o custo de uma página não depende do
+    total de alertas históricos.
+
+    Sem start_persistence (scripts e testes) os alertas existem apenas na
+    camada quente e recebem ids sequenciais na criação.
+
+    Com coalesce_seconds > 0, um alerta do mesmo (player_id, alert_type) de
+    um alerta aberto (não revisado e com última ocorrência dentro da janela)
+    não cria uma nova linha: o alerta aberto recebe os detalhes mais
+    recentes, incrementa 'count' e atualiza 'last_seen'. Alertas já gravados
+    são atualizados no próximo lote, uma vez por lote, não importa quantas
+    ocorrências tenham sido agrupadas. Um alerta revisado deixa de estar
+    aberto: mark_reviewed o fecha neste processo e cada lote fecha os alertas
+    agrupados cuja linha já foi revisada (por outro worker, por exemplo), sem
+    alterar a linha revisada; a próxima ocorrência cria um novo alerta.
+    """
+
+    def __init__(self, hot_size=1000):
+        self._hot = deque(maxlen=hot_size)
+        self._pending = []
+        # Alertas abertos para agrupamento, ordenados pela última ocorrência
+        self._open = OrderedDict()
+        # Alertas agrupados cuja linha precisa ser atualizada
+        self._dirty = {}
+        self._lock = threading.Lock()
+        # Serializa persist_pending entre a thread de gravação e as requisições
+        self._persist_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._persister = None
+        self.app = None
+        self.created = 0
+        self.coalesced = 0
+        self.rows_inserted = 0
+        self.rows_updated = 0
+
+    def add(self, alert, coalesce_seconds=0):
+        """
+        Adiciona um alerta à camada quente e à fila de gravação, ou o agrupa em um alerta aberto.
+
+        Returns:
+            tuple: (alerta criado ou alerta aberto atualizado, True se um novo alerta foi criado)
+        """
+        key = (alert['player_id'], alert['alert_type'])
+        timestamp = alert['timestamp']
+        with self._lock:
+            if coalesce_seconds > 0:
+                self._close_expired(timestamp, coalesce_seconds)
+                open_alert = self._open.get(key)
+                if open_alert is not None and not open_alert['reviewed']:
+                    open_alert['count'] += 1
+                    open_alert['last_seen'] = timestamp
+                    open_alert['details'] = alert['details']
+                    self._open.move_to_end(key)
+                    if self.app is not None:
+                        self._dirty[id(open_alert)] = open_alert
+                    self.coalesced += 1
+                    return open_alert, False
+
+            alert['count'] = 1
+            alert['last_seen'] = timestamp
+            if self.app is None:
+                alert['id'] = next(self._ids)
+            else:
+                self._pending.append(alert)
+            self._hot.append(alert)
+            if coalesce_seconds > 0:
+                self._open[key] = alert
+                self._open.move_to_end(key)
+            self.created += 1
+        return alert, True
+
+    def _close(self, alert):
+        """Remove o alerta dos alertas abertos (chamado com _lock)."""
+        key = (alert['player_id'], alert['alert_type'])
+        if self._open.get(key) is alert:
+            del self._open[key]
+
+    def _close_expired(self, now, coalesce_seconds):
+        """Fecha os alertas abertos cuja última ocorrência saiu da janela."""
+        while self._open:
+            key, alert = next(iter(self._open.items()))
+            if now - alert['last_seen'] <= coalesce_seconds:
+                return
+            del self._open[key]
+
+    def recent(self, limit=None):
+        """Retorna os alertas da camada quente, do mais recente para o mais antigo."""
+        with self._lock:
+            alerts = list(reversed(self._hot))
+        return alerts[:limit] if limit is not None else alerts
+
+    def persist_pending(self):
+        """
+        Grava os alertas pendentes e as atualizações dos alertas agrupados em uma única transação.
+
+        Uma chamada por vez: um alerta agrupado que ainda não tem id está no
+        lote em gravação ou no próximo, e quando retorna, tudo o que estava
+        pendente na chamada já está no banco (list_alerts e mark_reviewed
+        dependem disso).
+
+        Returns:
+            int: Número de linhas inseridas ou atualizadas
+        """
+        with self._persist_lock:
+            return self._persist_pending()
+
+    def _persist_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+            dirty, self._dirty = self._dirty, {}
+        if not pending and not dirty:
+            return 0
+        with self.app.app_context():
+            rows = [
+                FraudAlert(
+                    player_id=alert['player_id'],
+                    alert_type=alert['alert_type'],
+                    details=_stored_details(alert),
+                    timestamp=_to_datetime(alert['timestamp']),
+                    reviewed=alert['reviewed'],
+                )
+                for alert in pending
+            ]
+            try:
+                db.session.add_all(rows)
+                db.session.flush()
+                # Os ids gerados pelo banco passam a identificar os alertas da camada quente
+                for alert, row in zip(pending, rows):
+                    alert['id'] = row.id
+                # Linhas já revisadas não recebem as novas ocorrências; os alertas são fechados abaixo
+                dirty_ids = [alert['id'] for alert in dirty.values() if 'id' in alert]
+                reviewed_ids = set()
+                if dirty_ids:
+                    reviewed_ids = {
+                        row.id for row in db.session.query(FraudAlert.id).filter(
+                            FraudAlert.id.in_(dirty_ids), FraudAlert.reviewed == True  # noqa: E712
+                        )
+                    }
+                # Alertas agrupados ainda sem id estão neste lote ou no próximo e saem com os detalhes atuais
+                updates = [
+                    {'alert_id': alert['id'], 'new_details': _stored_details(alert)}
+                    for alert in dirty.values() if 'id' in alert and alert['id'] not in reviewed_ids
+                ]
+                if updates:
+                    table = FraudAlert.__table__
+                    db.session.execute(
+                        table.update().where(table.c.id == bindparam('alert_id')).values(details=bindparam('new_details')),
+                        updates
+                    )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                for alert in pending:
+                    alert.pop('id', None)
+                # Devolver os alertas para a próxima rodada
+                with self._lock:
+                    self._pending[:0] = pending
+                    for key, alert in dirty.items():
+                        self._dirty.setdefault(key, alert)
+                raise
+        if reviewed_ids:
+            with self._lock:
+                for alert in dirty.values():
+                    if alert.get('id') in reviewed_ids:
+                        alert['reviewed'] = True
+                        self._close(alert)
+        self.rows_inserted += len(rows)
+        self.rows_updated += len(updates)
+        return len(rows) + len(updates)
+
+    def start_persistence(self, app, interval=1.0):
+        """Passa a gravar os alertas em FraudAlert a cada `interval` segundos (thread daemon)."""
+        if self._persister is not None:
+            return self
+        self.app = app
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.persist_pending()
+                except Exception as e:
+                    print(f"FRAUD ALERT PERSISTENCE ERROR: {e}")
+
+        self._persister = threading.Thread(target=run, name='fraud-alert-persister', daemon=True)
+        self._persister.start()
+        atexit.register(self._persist_at_exit)
+        return self
+
+    def _persist_at_exit(self):
+        try:
+            self.persist_pending()
+        except Exception as e:
+            print(f"FRAUD ALERT PERSISTENCE ERROR: {e}")
+
+    def stats(self):
+        """
+        Retorna métricas de volume dos alertas.
+
+        Returns:
+            dict: Alertas criados, ocorrências agrupadas, linhas inseridas e
+                  atualizadas e gravações evitadas pelo agrupamento
+        """
+        with self._lock:
+            return {
+                'created': self.created,
+                'coalesced': self.coalesced,
+                'open_alerts': len(self._open),
+                'rows_inserted': self.rows_inserted,
+                'rows_updated': self.rows_updated,
+                'writes_avoided': self.coalesced - self.rows_updated,
+            }
+
+    def list_alerts(self, reviewed=None, limit=50, before=None):
+        """
+        Lista alertas do mais recente para o mais antigo.
+
+        Args:
+            reviewed: True/False filtra pelo estado de revisão; None retorna todos
+            limit: Número máximo de alertas
+            before: Cursor (timestamp, id) do último alerta da página anterior
+
+        Returns:
+            list: Alertas da página
+        """
+        if self.app is None:
+            alerts = self.recent()
+            if reviewed is not None:
+                alerts = [alert for alert in alerts if alert['reviewed'] == reviewed]
+            if before is not None:
+                alerts = [alert for alert in alerts if (alert['timestamp'], alert['id']) < tuple(before)]
+            return alerts[:limit]
+
+        # Alertas ainda pendentes deste processo também devem aparecer
+        self.persist_pending()
+        with self.app.app_context():
+            query = FraudAlert.query
+            if reviewed is not None:
+                query = query.filter(FraudAlert.reviewed == reviewed)
+            if before is not None:
+                before_time, before_id = _to_datetime(before[0]), before[1]
+                query = query.filter(or_(
+                    FraudAlert.timestamp < before_time,
+                    and_(FraudAlert.timestamp == before_time, FraudAlert.id < before_id)
+                ))
+            rows = query.order_by(FraudAlert.timestamp.desc(), FraudAlert.id.desc()).limit(limit).all()
+            return [_row_to_alert(row) for row in rows]
+
+    def mark_reviewed(self, alert_id, admin_id, action_taken=None):
+        """
+        Marca um alerta como revisado.
+
+        Returns:
+            bool: True se o alerta foi encontrado e marcado, False caso contrário
+        """
+        now = time.time()
+        review = {
+            'reviewed': True,
+            'reviewed_by': admin_id,
+            'review_time': now,
+            'review_datetime': _to_datetime(now).isoformat(),
+        }
+        if action_taken:
+            review['action_taken'] = action_taken
+
+        found = False
+        with self._lock:
+            for alert in self._hot:
+                if alert.get('id') == alert_id:
+                    alert.update(review)
+                    found = True
+                    break
+            # O alerta aberto pode já ter saído da camada quente e ainda receber ocorrências
+            for alert in list(self._open.values()):
+                if alert.get('id') == alert_id:
+                    alert.update(review)
+                    self._close(alert)
+                    found = True
+                    break
+        if self.app is None:
+            return found
+
+        self.persist_pending()
+        with self.app.app_context():
+            values = {
+                'reviewed': True,
+                'reviewed_by': admin_id,
+                'review_time': _to_datetime(now),
+            }
+            if action_taken:
+                values['action_taken'] = action_taken
+            updated = FraudAlert.query.filter_by(id=alert_id).update(values)
+            db.session.commit()
+        return updated > 0
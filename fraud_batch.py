@@ -0,0 +1,230 @@
+import numpy as np
+from utils.action_store import ACTION_CAPACITY, action_type_code, intern_action_type
+from utils.fraud_rules import get_rule_engine
+
+def _codes(action_types):
+    """Converte uma lista de nomes de tipos de ação em códigos; arrays de inteiros passam direto."""
+    action_types = np.asarray(action_types)
+    if action_types.dtype.kind in 'iu':
+        return action_types.astype(np.int32, copy=False)
+    names, inverse = np.unique(action_types, return_inverse=True)
+    lookup = np.array([intern_action_type(str(name)) for name in names], dtype=np.int32)
+    return lookup[inverse]
+
+def _type_mask(codes, action_type):
+    code = action_type_code(action_type)
+    if code is None:
+        return np.zeros(len(codes), dtype=bool)
+    return codes == code
+
+class ActionHistory:
+    """
+    Histórico de ações em arrays NumPy, ordenado por jogador e timestamp.
+
+    Além das colunas, guarda para cada ação o índice da primeira ação do seu
+    jogador (`group_start`) e a posição dela no histórico do jogador
+    (`position`), que permitem calcular as janelas das regras sem laços em
+    Python.
+    """
+
+    def __init__(self, player_ids, timestamps, action_types, amounts=None, refs=None):
+        player_ids = np.asarray(player_ids, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        codes = _codes(action_types)
+        amounts = np.full(len(player_ids), np.nan) if amounts is None else np.asarray(amounts, dtype=np.float64)
+        refs = np.full(len(player_ids), -1, dtype=np.int64) if refs is None else np.asarray(refs, dtype=np.int64)
+
+        # Ordem estável: ações com o mesmo timestamp mantêm a ordem de registro
+        order = np.lexsort((timestamps, player_ids))
+        self.player_ids = player_ids[order]
+        self.timestamps = timestamps[order]
+        self.codes = codes[order]
+        self.amounts = amounts[order]
+        self.refs = refs[order]
+
+        size = len(order)
+        boundaries = np.flatnonzero(np.diff(self.player_ids)) + 1
+        self.starts = np.concatenate(([0], boundaries)) if size else np.zeros(0, dtype=np.int64)
+        self.players = self.player_ids[self.starts]
+        lengths = np.diff(np.append(self.starts, size))
+        self.group = np.repeat(np.arange(len(self.starts)), lengths)
+        self.group_start = self.starts[self.group]
+        self.position = np.arange(size) - self.group_start
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def group_cumsum(self, values):
+        """Soma acumulada de `values` dentro de cada jogador (inclui a ação atual)."""
+        total = np.cumsum(values, dtype=np.float64)
+        before_group = np.concatenate(([0.0], total))[self.group_start]
+        return total - before_group
+
+def _bot_activity(history, params, capacity):
+    sample_size = params['sample_size']
+    intervals = sample_size - 1
+    size = len(history)
+    if sample_size > capacity or intervals < 1 or size == 0:
+        return np.zeros(size, dtype=bool)
+    diffs = np.zeros(size)
+    diffs[1:] = np.diff(history.timestamps)
+    # A janela tem poucos intervalos: somas por deslocamento, na mesma ordem da regra em
+    # Python, evitam o erro de arredondamento de somas acumuladas sobre todo o histórico
+    shifted = [np.concatenate((np.zeros(offset), diffs[:size - offset])) for offset in range(intervals - 1, -1, -1)]
+    total = np.zeros(size)
+    for window_diffs in shifted:
+        total += window_diffs
+    mean = total / intervals
+    squares = np.zeros(size)
+    for window_diffs in shifted:
+        squares += (window_diffs - mean) ** 2
+    std_dev = np.sqrt(squares / intervals)
+    return (
+        (history.position >= sample_size - 1)
+        & (mean < params['max_avg_interval'])
+        & (std_dev < params['max_std_dev'])
+    )
+
+def _excessive_self_elimination(history, params, capacity):
+    count = history.group_cumsum(_type_mask(history.codes, 'self_eliminate'))
+    total = history.position + 1
+    return (count > params['min_count']) & (count / total > params['min_ratio'])
+
+def _window_occurrences(history, mask, capacity):
+    """
+    Para cada ação, localiza as ocorrências do tipo dentro do buffer (as últimas `capacity` ações).
+
+    Returns:
+        tuple: (índices das ocorrências, índice em `occurrences` da primeira ocorrência
+                na janela, índice da última ocorrência até a ação, contagem na janela)
+    """
+    occurrences = np.flatnonzero(mask)
+    index = np.arange(len(history))
+    window_start = np.maximum(history.group_start, index - capacity + 1)
+    first = np.searchsorted(occurrences, window_start, side='left')
+    last = np.searchsorted(occurrences, index, side='right') - 1
+    return occurrences, first, last, last - first + 1
+
+def _abnormal_coin_gain(history, params, capacity):
+    mask = _type_mask(history.codes, 'earn_coins')
+    if not mask.any():
+        return np.zeros(len(history), dtype=bool)
+    occurrences, first, last, count = _window_occurrences(history, mask, capacity)
+    amounts = np.where(np.isnan(history.amounts[occurrences]), 0.0, history.amounts[occurrences])
+    cumulative = np.concatenate(([0.0], np.cumsum(amounts)))
+    valid = count >= max(params['min_window_earns'], 1)
+    first_safe = np.clip(first, 0, len(occurrences) - 1)
+    last_safe = np.clip(last, 0, len(occurrences) - 1)
+    total_coins = cumulative[last_safe + 1] - cumulative[first_safe]
+    time_span = history.timestamps[occurrences[last_safe]] - history.timestamps[occurrences[first_safe]]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rate = np.where(time_span > 0, total_coins / time_span, 0.0)
+    lifetime = history.group_cumsum(mask)
+    return valid & (lifetime > params['min_total_earns']) & (time_span > 0) & (rate > params['max_coins_per_second'])
+
+def _rapid_purchases(history, params, capacity):
+    mask = _type_mask(history.codes, 'buy_item')
+    if not mask.any():
+        return np.zeros(len(history), dtype=bool)
+    occurrences, first, last, count = _window_occurrences(history, mask, capacity)
+    # Par rápido: compra a menos de min_interval da compra anterior do mesmo jogador
+    previous_gap = np.full(len(occurrences), np.inf)
+    same_player = history.group[occurrences[1:]] == history.group[occurrences[:-1]]
+    gaps = np.diff(history.timestamps[occurrences])
+    previous_gap[1:] = np.where(same_player, gaps, np.inf)
+    rapid = np.concatenate(([0], np.cumsum(previous_gap < params['min_interval'])))
+    first_safe = np.clip(first, 0, len(occurrences) - 1)
+    last_safe = np.clip(last, 0, len(occurrences) - 1)
+    # Pares cuja compra anterior também está na janela: exclui o par da primeira compra da janela
+    rapid_pairs = np.where(count > 0, rapid[last_safe + 1] - rapid[first_safe + 1], 0)
+    lifetime = history.group_cumsum(mask)
+    return (count >= params['min_window_buys']) & (rapid_pairs > 0) & (lifetime > params['min_total_buys'])
+
+# Versões vetorizadas das regras de utils.fraud_rules, pelo tipo da regra
+VECTORIZED_RULES = {
+    'bot_activity': _bot_activity,
+    'excessive_self_elimination': _excessive_self_elimination,
+    'abnormal_coin_gain': _abnormal_coin_gain,
+    'rapid_purchases': _rapid_purchases,
+}
+
+def analyze(history, engine=None, capacity=ACTION_CAPACITY, now=None):
+    """
+    Reavalia todo o histórico com as regras ativas do motor de regras.
+
+    Cada regra é calculada para todas as ações de uma vez, com as mesmas
+    janelas usadas por FraudDetector (buffer de `capacity` ações, contagens
+    acumuladas por jogador) e apenas nas ações dos tipos que a regra assina.
+
+    Args:
+        history: ActionHistory com as ações
+        engine: RuleEngine (padrão: get_rule_engine()), para reavaliar com outros limites
+        capacity: Tamanho do buffer de ações por jogador
+        now: Referência para o decaimento da pontuação de risco (padrão: última ação)
+
+    Returns:
+        dict: 'players' (ids), 'violations' (regra -> violações por jogador),
+              'suspicious_activity' (soma das pontuações), 'risk_score'
+              (pontuação com decaimento em `now`) e 'alerts' (um alerta
+              agrupado por jogador e regra)
+    """
+    engine = engine or get_rule_engine()
+    players = len(history.starts)
+    if now is None:
+        now = float(history.timestamps.max()) if len(history) else 0.0
+    half_life = engine.scoring['half_life_seconds']
+    decay = 0.5 ** ((now - history.timestamps) / half_life)
+
+    violations = {}
+    suspicious_activity = np.zeros(players)
+    risk_score = np.zeros(players)
+    alerts = []
+    for rule in engine.stats():
+        compute = VECTORIZED_RULES.get(rule['type'])
+        if compute is None:
+            continue
+        hits = compute(history, rule['params'], capacity)
+        if rule['action_types'] is not None:
+            subscribed = np.zeros(len(history), dtype=bool)
+            for action_type in rule['action_types']:
+                subscribed |= _type_mask(history.codes, action_type)
+            hits &= subscribed
+
+        counts = np.bincount(history.group[hits], minlength=players)
+        violations[rule['name']] = counts
+        suspicious_activity += counts * rule['score']
+        risk_score += np.bincount(history.group[hits], weights=decay[hits] * rule['score'], minlength=players)
+
+        hit_index = np.flatnonzero(hits)
+        if len(hit_index):
+            groups = history.group[hit_index]
+            first = np.concatenate(([0], np.flatnonzero(np.diff(groups)) + 1))
+            last = np.append(first[1:], len(hit_index)) - 1
+            for start, end in zip(first, last):
+                alerts.append({
+                    'player_id': int(history.player_ids[hit_index[start]]),
+                    'alert_type': rule['name'],
+                    'timestamp': float(history.timestamps[hit_index[start]]),
+                    'last_seen': float(history.timestamps[hit_index[end]]),
+                    'count': int(end - start + 1),
+                })
+
+    return {
+        'players': history.players,
+        'violations': violations,
+        'suspicious_activity': suspicious_activity,
+        'risk_score': np.minimum(risk_score, engine.scoring['max_score']),
+        'alerts': alerts,
+    }
+
+def history_from_store(store):
+    """Monta um ActionHistory com as ações em memória de um ActionStore."""
+    player_ids, timestamps, codes, amounts, refs = [], [], [], [], []
+    for player_id, actions in store.players():
+        for timestamp, code, amount, ref in actions.chronological():
+            player_ids.append(player_id)
+            timestamps.append(timestamp)
+            codes.append(code)
+            amounts.append(amount)
+            refs.append(ref)
+    return ActionHistory(player_ids, timestamps, np.array(codes, dtype=np.int32), amounts, refs)
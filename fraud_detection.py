@@ -1,15 +1,23 @@
 import time
-import math
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
-from flask import current_app
+from datetime import datetime
+from collections import defaultdict
+from utils.action_store import ActionStore, TypeWindow, encode_details, intern_action_type
+from utils.fraud_rules import EARN_COINS, BUY_ITEM, RapidPurchasesRule, get_rule_engine
+from utils.fraud_workers import ShardedWorkerPool
+from utils.fraud_alert_store import FraudAlertStore
+from utils.fraud_graph import fraud_graph
+from utils.security import log_security_event
 
-# Dicionário para armazenar ações dos jogadores para análise de padrões
-player_actions = defaultdict(lambda: deque(maxlen=100))
+# Últimas 100 ações de cada jogador em buffers circulares de arrays paralelos
+player_actions = ActionStore(capacity=100)
 # Dicionário para armazenar estatísticas de jogadores
 player_stats = {}
-# Dicionário para armazenar alertas de fraude
-fraud_alerts = []
+# Alertas de fraude: camada quente em memória e, após start_persistence(app), tabela FraudAlert
+fraud_alerts = FraudAlertStore(hot_size=1000)
+# Pool de análise assíncrona; None executa a análise na própria thread (modo síncrono)
+_analysis_pool = None
+# Log de ações entre snapshots (utils.fraud_snapshot); None desativa o registro
+_action_log = None
 
 class FraudDetector:
     """Classe para detecção de fraudes no jogo."""
@@ -22,39 +30,175 @@ class FraudDetector:
         Args:
             player_id: ID do jogador
             action_type: Tipo de ação (ex: 'kill_monster', 'self_eliminate', 'buy_item')
-            details: Detalhes adicionais sobre a ação (opcional)
+            details: Detalhes adicionais sobre a ação (opcional); apenas 'amount'
+                     ou 'price' e 'item_id' são guardados (ver encode_details)
+        
+        No modo assíncrono (init_fraud_analysis) a ação é apenas enfileirada
+        com o horário atual e analisada por um worker.
         """
-        action = {
-            'timestamp': time.time(),
-            'datetime': datetime.utcnow().isoformat(),
-            'action_type': action_type,
-            'details': details or {}
+        now = time.time()
+        pool = _analysis_pool
+        if pool is not None:
+            pool.submit(player_id, (player_id, action_type, details, now))
+            return
+        FraudDetector.analyze_action(player_id, action_type, details, now)
+    
+    @staticmethod
+    def analyze_action(player_id, action_type, details, now):
+        """
+        Atualiza o histórico e o estado do jogador e verifica os padrões suspeitos.
+        
+        Args:
+            player_id: ID do jogador
+            action_type: Tipo de ação
+            details: Detalhes adicionais sobre a ação
+            now: Timestamp em que a ação ocorreu
+        """
+        amount, ref = encode_details(details)
+        FraudDetector.apply_action(player_id, action_type, amount, ref, now)
+    
+    @staticmethod
+    def apply_action(player_id, action_type, amount, ref, now, raise_alerts=True):
+        """
+        Aplica uma ação já codificada (ver utils.action_store.encode_details).
+        
+        stats['version'] fica ímpar enquanto o estado do jogador está sendo
+        alterado, o que permite a utils.fraud_snapshot copiar o estado de cada
+        jogador sem bloquear a análise.
+        
+        Args:
+            player_id: ID do jogador
+            action_type: Tipo de ação
+            amount: Valor da ação (NaN se ausente)
+            ref: Referência da ação (-1 se ausente)
+            now: Timestamp em que a ação ocorreu
+            raise_alerts: False reaplica a ação sem criar alertas (replay do log de ações)
+        """
+        stats = player_stats.get(player_id)
+        if stats is None:
+            stats = player_stats[player_id] = FraudDetector.new_player_stats()
+        
+        stats['version'] += 1
+        try:
+            code = intern_action_type(action_type)
+            log = _action_log
+            if log is not None:
+                actions = player_actions.get(player_id)
+                log.append(player_id, (actions.appended if actions else 0) + 1, now, action_type, code, amount, ref)
+            evicted = player_actions.append(player_id, code, now, amount, ref)
+            
+            # Atualizar estatísticas do jogador
+            FraudDetector._update_windows(stats, player_actions.get(player_id), evicted, now)
+            stats['action_counts'][action_type] += 1
+            stats['total_actions'] += 1
+            stats['last_actions'][action_type] = now
+            
+            # Verificar se há padrões suspeitos após registrar a ação
+            FraudDetector.check_for_suspicious_patterns(player_id, action_type, now, raise_alerts)
+        finally:
+            stats['version'] += 1
+    
+    @staticmethod
+    def new_player_stats():
+        """Retorna as estatísticas iniciais de um jogador."""
+        return {
+            'action_counts': defaultdict(int),
+            'last_actions': {},
+            'suspicious_activity': 0,  # Pontuação de suspeita
+            'warnings_issued': 0,
+            'total_actions': 0,
+            'earn_window': TypeWindow(EARN_COINS),
+            'buy_window': TypeWindow(BUY_ITEM),
+            'rapid_buy_pairs': 0,  # Compras consecutivas no buffer com menos de 0.5s entre si
+            'rapid_interval': None,  # Intervalo de RapidPurchasesRule com que os pares foram contados
+            'rules_version': None,  # Versão das regras em que rapid_interval foi verificado
+            'version': 0  # Par quando o estado está consistente
         }
+    
+    @staticmethod
+    def _update_windows(stats, actions, evicted, now):
+        """
+        Atualiza o estado incremental após uma ação entrar no buffer.
         
-        player_actions[player_id].append(action)
+        Deve ser chamado antes de last_actions ser atualizado com a nova ação.
         
-        # Atualizar estatísticas do jogador
-        if player_id not in player_stats:
-            player_stats[player_id] = {
-                'action_counts': defaultdict(int),
-                'last_actions': {},
-                'suspicious_activity': 0,  # Pontuação de suspeita
-                'warnings_issued': 0
-            }
-        
-        player_stats[player_id]['action_counts'][action_type] += 1
-        player_stats[player_id]['last_actions'][action_type] = time.time()
-        
-        # Verificar se há padrões suspeitos após registrar a ação
-        FraudDetector.check_for_suspicious_patterns(player_id)
+        Args:
+            stats: Estatísticas do jogador
+            actions: PlayerActions do jogador, já com a nova ação
+            evicted: Ação que saiu do buffer (timestamp, código, valor, referência) ou None
+            now: Timestamp da nova ação
+        """
+        engine = get_rule_engine()
+        if stats.get('rules_version') != engine.version:
+            # Regras recarregadas (ou estado restaurado de um snapshot): recontar os pares se o intervalo mudou
+            stats['rules_version'] = engine.version
+            rapid_interval = engine.type_param(RapidPurchasesRule, 'min_interval', RapidPurchasesRule.defaults['min_interval'])
+            if stats.get('rapid_interval') != rapid_interval:
+                stats['rapid_interval'] = rapid_interval
+                FraudDetector._count_rapid_pairs(stats, actions, evicted, now)
+                return
+        rapid_interval = stats['rapid_interval']
+        if evicted is not None:
+            timestamp, code, amount, _ = evicted
+            if code == EARN_COINS:
+                stats['earn_window'].remove(actions, actions.first_sequence - 1, amount)
+            elif code == BUY_ITEM:
+                window = stats['buy_window']
+                window.remove(actions, actions.first_sequence - 1, amount)
+                if window.count and actions.timestamp_at(window.oldest) - timestamp < rapid_interval:
+                    stats['rapid_buy_pairs'] -= 1
+        
+        sequence = actions.appended - 1
+        code = actions.type_at(sequence)
+        if code == EARN_COINS:
+            stats['earn_window'].add(sequence, actions.amounts[sequence % len(actions)])
+        elif code == BUY_ITEM:
+            window = stats['buy_window']
+            if window.count and now - stats['last_actions']['buy_item'] < rapid_interval:
+                stats['rapid_buy_pairs'] += 1
+            window.add(sequence, actions.amounts[sequence % len(actions)])
     
     @staticmethod
-    def check_for_suspicious_patterns(player_id):
+    def _count_rapid_pairs(stats, actions, evicted, now):
+        """Recalcula as janelas após a nova ação e reconta os pares rápidos com stats['rapid_interval']."""
+        if evicted is not None:
+            _, code, amount, _ = evicted
+            if code == EARN_COINS:
+                stats['earn_window'].remove(actions, actions.first_sequence - 1, amount)
+            elif code == BUY_ITEM:
+                stats['buy_window'].remove(actions, actions.first_sequence - 1, amount)
+        sequence = actions.appended - 1
+        code = actions.type_at(sequence)
+        if code == EARN_COINS:
+            stats['earn_window'].add(sequence, actions.amounts[sequence % len(actions)])
+        elif code == BUY_ITEM:
+            stats['buy_window'].add(sequence, actions.amounts[sequence % len(actions)])
+
+        pairs = 0
+        previous = None
+        for sequence in range(actions.first_sequence, actions.appended):
+            if actions.type_at(sequence) != BUY_ITEM:
+                continue
+            timestamp = actions.timestamp_at(sequence)
+            if previous is not None and timestamp - previous < stats['rapid_interval']:
+                pairs += 1
+            previous = timestamp
+        stats['rapid_buy_pairs'] = pairs
+
+    @staticmethod
+    def check_for_suspicious_patterns(player_id, action_type=None, now=None, raise_alerts=True):
         """
         Verifica se há padrões suspeitos nas ações do jogador.
         
+        Avalia as regras de utils.fraud_rules que assinam o tipo da nova ação.
+        As regras usam as últimas ações do buffer e o estado incremental
+        mantido por record_player_action, então o custo não depende do histórico.
+        
         Args:
             player_id: ID do jogador a ser verificado
+            action_type: Tipo da ação recém-registrada (None avalia todas as regras)
+            now: Timestamp da ação (padrão: agora)
+            raise_alerts: False atualiza as pontuações sem criar alertas nem advertências
         
         Returns:
             bool: True se padrões suspeitos foram detectados, False caso contrário
@@ -62,105 +206,56 @@ class FraudDetector:
         if player_id not in player_stats:
             return False
         
-        suspicious = False
         stats = player_stats[player_id]
-        actions = list(player_actions[player_id])
-        
-        # Verificar frequência muito alta de ações (possível bot)
-        if len(actions) >= 5:
-            # Calcular o tempo médio entre as últimas 5 ações
-            recent_actions = actions[-5:]
-            timestamps = [a['timestamp'] for a in recent_actions]
-            
-            if len(timestamps) >= 2:
-                time_diffs = [timestamps[i] - timestamps[i-1] for i in range(1, len(timestamps))]
-                avg_time_diff = sum(time_diffs) / len(time_diffs)
-                
-                # Se o tempo médio entre ações for muito pequeno (menos de 1 segundo)
-                # e consistente (baixo desvio padrão), pode ser um bot
-                if avg_time_diff < 1.0:
-                    std_dev = math.sqrt(sum((x - avg_time_diff) ** 2 for x in time_diffs) / len(time_diffs))
-                    if std_dev < 0.2:  # Tempo muito consistente
-                        suspicious = True
-                        stats['suspicious_activity'] += 10
-                        FraudDetector.create_fraud_alert(player_id, 'bot_activity', {
-                            'avg_time_between_actions': avg_time_diff,
-                            'std_dev': std_dev,
-                            'action_types': [a['action_type'] for a in recent_actions]
-                        })
-        
-        # Verificar padrões específicos de fraude para diferentes tipos de ações
-        
-        # 1. Auto-eliminações muito frequentes
-        if stats['action_counts'].get('self_eliminate', 0) > 50:
-            # Verificar se as auto-eliminações são a maioria das ações
-            total_actions = sum(stats['action_counts'].values())
-            if stats['action_counts']['self_eliminate'] / total_actions > 0.8:
-                suspicious = True
-                stats['suspicious_activity'] += 5
-                FraudDetector.create_fraud_alert(player_id, 'excessive_self_elimination', {
-                    'count': stats['action_counts']['self_eliminate'],
-                    'percentage': stats['action_counts']['self_eliminate'] / total_actions
-                })
-        
-        # 2. Ganho de moedas muito rápido
-        if 'earn_coins' in stats['action_counts'] and stats['action_counts']['earn_coins'] > 20:
-            coin_actions = [a for a in actions if a['action_type'] == 'earn_coins']
-            if len(coin_actions) >= 10:
-                # Calcular a taxa de ganho de moedas
-                total_coins = sum(a['details'].get('amount', 0) for a in coin_actions)
-                time_span = coin_actions[-1]['timestamp'] - coin_actions[0]['timestamp']
-                if time_span > 0:
-                    coins_per_second = total_coins / time_span
-                    # Definir um limite razoável com base na mecânica do jogo
-                    if coins_per_second > 0.0000000001:  # Ajustar conforme necessário
-                        suspicious = True
-                        stats['suspicious_activity'] += 15
-                        FraudDetector.create_fraud_alert(player_id, 'abnormal_coin_gain', {
-                            'coins_per_second': coins_per_second,
-                            'total_coins': total_coins,
-                            'time_span_seconds': time_span
-                        })
-        
-        # 3. Padrão de compras suspeito
-        if 'buy_item' in stats['action_counts'] and stats['action_counts']['buy_item'] > 5:
-            buy_actions = [a for a in actions if a['action_type'] == 'buy_item']
-            if len(buy_actions) >= 5:
-                # Verificar compras em sequência muito rápida
-                buy_timestamps = [a['timestamp'] for a in buy_actions]
-                for i in range(1, len(buy_timestamps)):
-                    if buy_timestamps[i] - buy_timestamps[i-1] < 0.5:  # Menos de meio segundo entre compras
-                        suspicious = True
-                        stats['suspicious_activity'] += 8
-                        FraudDetector.create_fraud_alert(player_id, 'rapid_purchases', {
-                            'purchases': [(a['details'].get('item_id'), a['details'].get('price')) for a in buy_actions[-5:]]
-                        })
-                        break
+        engine = get_rule_engine()
+        violations = engine.evaluate(player_id, action_type, stats, player_actions.get(player_id))
+        for rule, details in violations:
+            stats['suspicious_activity'] += rule.score
+            if raise_alerts:
+                FraudDetector.create_fraud_alert(player_id, rule.alert_type, details)
+        if violations:
+            FraudDetector._add_risk(stats, sum(rule.score for rule, _ in violations),
+                                    now if now is not None else time.time(), engine.scoring)
+            # Propagar a nova pontuação para o cluster do jogador (IPs e sessões compartilhados)
+            fraud_graph.record_risk(player_id, *stats['risk'])
+        
+        if not raise_alerts:
+            if stats['suspicious_activity'] >= engine.thresholds['warning']:
+                stats['warnings_issued'] = max(stats['warnings_issued'], 1)
+            return bool(violations)
         
         # Tomar ações com base na pontuação de suspeita
-        if stats['suspicious_activity'] >= 20 and stats['warnings_issued'] == 0:
+        thresholds = engine.thresholds
+        if stats['suspicious_activity'] >= thresholds['warning'] and stats['warnings_issued'] == 0:
             # Primeira advertência
             stats['warnings_issued'] += 1
             # Em um sistema real, você poderia enviar uma mensagem ao jogador
             print(f"WARNING: Player {player_id} has been flagged for suspicious activity.")
         
-        if stats['suspicious_activity'] >= 50:
+        if stats['suspicious_activity'] >= thresholds['critical']:
             # Considerar ações mais severas, como suspensão temporária
             print(f"CRITICAL: Player {player_id} has exceeded the fraud threshold and may be suspended.")
             # Em um sistema real, você poderia suspender a conta automaticamente
             # ou notificar um administrador para revisão manual
         
-        return suspicious
+        return bool(violations)
     
     @staticmethod
     def create_fraud_alert(player_id, alert_type, details):
         """
         Cria um alerta de fraude para revisão por administradores.
         
+        Alertas repetidos do mesmo jogador e tipo dentro da janela
+        'coalesce_seconds' (configuração 'alerts' de utils.fraud_rules) apenas
+        atualizam a contagem e a última ocorrência do alerta aberto.
+        
         Args:
             player_id: ID do jogador
             alert_type: Tipo de alerta (ex: 'bot_activity', 'excessive_self_elimination')
             details: Detalhes específicos do alerta
+        
+        Returns:
+            dict: Alerta criado ou alerta aberto atualizado
         """
         alert = {
             'timestamp': time.time(),
@@ -171,14 +266,53 @@ class FraudDetector:
             'reviewed': False
         }
         
-        fraud_alerts.append(alert)
+        alert, created = fraud_alerts.add(alert, get_rule_engine().alerts['coalesce_seconds'])
         
-        # Em um ambiente de produção, você poderia salvar isso em um banco de dados
-        # e possivelmente enviar notificações para administradores
-        print(f"FRAUD ALERT: {alert}")
+        if created:
+            # Em um ambiente de produção, você poderia enviar notificações para administradores
+            print(f"FRAUD ALERT: {alert}")
         
         return alert
     
+    @staticmethod
+    def _add_risk(stats, points, now, scoring):
+        """
+        Soma pontos à pontuação de risco com decaimento exponencial do jogador.
+        
+        A pontuação é guardada como uma tupla (valor, momento da última
+        atualização) trocada de uma vez, para que leituras de outras threads
+        nunca vejam um valor e um momento de atualizações diferentes.
+        """
+        value, updated_at = stats.get('risk', (0.0, now))
+        value *= 0.5 ** (max(now - updated_at, 0.0) / scoring['half_life_seconds'])
+        stats['risk'] = (min(value + points, scoring['max_score']), now)
+    
+    @staticmethod
+    def calculate_fraud_score(player_id, now=None):
+        """
+        Retorna a pontuação de risco atual do jogador, com decaimento exponencial.
+        
+        Cada violação de regra soma a pontuação da regra; sem novas violações a
+        pontuação cai pela metade a cada 'half_life_seconds' (configuração
+        'scoring' de utils.fraud_rules). A leitura é O(1): apenas o valor
+        guardado na última violação e o tempo decorrido desde então.
+        
+        Args:
+            player_id: ID do jogador
+            now: Timestamp de referência (padrão: agora)
+        
+        Returns:
+            float: Pontuação de risco (0 a max_score, padrão 100)
+        """
+        stats = player_stats.get(player_id)
+        if stats is None or 'risk' not in stats:
+            return 0.0
+        value, updated_at = stats['risk']
+        if now is None:
+            now = time.time()
+        half_life = get_rule_engine().scoring['half_life_seconds']
+        return value * 0.5 ** (max(now - updated_at, 0.0) / half_life)
+    
     @staticmethod
     def get_player_risk_score(player_id):
         """
@@ -201,8 +335,10 @@ class FraudDetector:
         # Considerar outros fatores que podem aumentar ou diminuir o risco
         
         # Fator 1: Tempo de jogo (jogadores mais antigos são geralmente mais confiáveis)
-        if player_actions[player_id]:
-            first_action_time = min(a['timestamp'] for a in player_actions[player_id])
+        actions = player_actions.get(player_id)
+        if actions:
+            # O buffer está em ordem cronológica: a posição 0 é a ação mais antiga
+            first_action_time = actions.timestamp(0)
             account_age_days = (time.time() - first_action_time) / (24 * 3600)
             if account_age_days > 30:  # Conta com mais de 30 dias
                 risk_score -= 10
@@ -220,7 +356,7 @@ class FraudDetector:
         return max(0, min(100, risk_score))
     
     @staticmethod
-    def get_fraud_alerts(reviewed=None, limit=50):
+    def get_fraud_alerts(reviewed=None, limit=50, before=None):
         """
         Obtém alertas de fraude para revisão.
         
@@ -228,15 +364,12 @@ class FraudDetector:
             reviewed: Se True, retorna apenas alertas revisados. Se False, apenas não revisados.
                      Se None, retorna todos os alertas.
             limit: Número máximo de alertas a retornar
+            before: Cursor (timestamp, id) do último alerta da página anterior (opcional)
         
         Returns:
-            list: Lista de alertas de fraude
+            list: Lista de alertas de fraude, do mais recente para o mais antigo
         """
-        if reviewed is None:
-            return sorted(fraud_alerts, key=lambda x: x['timestamp'], reverse=True)[:limit]
-        else:
-            return sorted([a for a in fraud_alerts if a['reviewed'] == reviewed], 
-                         key=lambda x: x['timestamp'], reverse=True)[:limit]
+        return fraud_alerts.list_alerts(reviewed=reviewed, limit=limit, before=before)
     
     @staticmethod
     def mark_alert_as_reviewed(alert_id, admin_id, action_taken=None):
@@ -244,23 +377,57 @@ class FraudDetector:
         Marca um alerta como revisado por um administrador.
         
         Args:
-            alert_id: ID do alerta (índice na lista fraud_alerts)
+            alert_id: ID do alerta (campo 'id' do alerta)
             admin_id: ID do administrador que revisou
             action_taken: Descrição da ação tomada (opcional)
         
         Returns:
             bool: True se o alerta foi encontrado e marcado, False caso contrário
         """
-        if 0 <= alert_id < len(fraud_alerts):
-            fraud_alerts[alert_id]['reviewed'] = True
-            fraud_alerts[alert_id]['reviewed_by'] = admin_id
-            fraud_alerts[alert_id]['review_time'] = time.time()
-            fraud_alerts[alert_id]['review_datetime'] = datetime.utcnow().isoformat()
-            
-            if action_taken:
-                fraud_alerts[alert_id]['action_taken'] = action_taken
-            
-            return True
-        
-        return False
+        return fraud_alerts.mark_reviewed(alert_id, admin_id, action_taken)
+
+def _report_dropped_actions(count):
+    log_security_event('fraud_analysis_dropped',
+                       f'{count} player actions dropped without fraud analysis (analysis queue full)', 'warning')
+
+def init_fraud_analysis(app):
+    """
+    Configura o modo de análise de fraudes.
+    
+    Lê do app.config: FRAUD_ANALYSIS_MODE ('async', padrão, ou 'sync'),
+    FRAUD_ANALYSIS_WORKERS (padrão 4), FRAUD_ANALYSIS_QUEUE_SIZE (padrão
+    10000 por worker) e FRAUD_ANALYSIS_SUBMIT_TIMEOUT (segundos que uma
+    requisição espera por espaço na fila cheia, padrão 0.05). No modo
+    assíncrono as ações de um mesmo jogador são sempre analisadas pelo mesmo
+    worker, na ordem em que foram registradas; ações descartadas com a fila
+    cheia geram o evento de segurança 'fraud_analysis_dropped'.
+    """
+    global _analysis_pool
+    stop_fraud_analysis()
+    if app.config.get('FRAUD_ANALYSIS_MODE', 'async') == 'async':
+        _analysis_pool = ShardedWorkerPool(
+            FraudDetector.analyze_action,
+            workers=app.config.get('FRAUD_ANALYSIS_WORKERS', 4),
+            max_queue=app.config.get('FRAUD_ANALYSIS_QUEUE_SIZE', 10000),
+            name='fraud-analysis',
+            submit_timeout=app.config.get('FRAUD_ANALYSIS_SUBMIT_TIMEOUT', 0.05),
+            on_drop=_report_dropped_actions
+        )
+    return _analysis_pool
+
+def set_action_log(log):
+    """Define o log que recebe cada ação aplicada (None desativa)."""
+    global _action_log
+    _action_log = log
+
+def flush_fraud_analysis():
+    """Espera as ações já enfileiradas serem analisadas (sem efeito no modo síncrono)."""
+    if _analysis_pool is not None:
+        _analysis_pool.flush()
 
+def stop_fraud_analysis(timeout=5.0):
+    """Analisa as ações pendentes, encerra os workers e volta ao modo síncrono."""
+    global _analysis_pool
+    pool, _analysis_pool = _analysis_pool, None
+    if pool is not None:
+        pool.shutdown(timeout)
@@ -0,0 +1,337 @@
+import math
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from models.user import db
+from models.adsense import AdDisplay
+from utils.fraud_rules import get_rule_engine
+
+# Tipos de nó do grafo
+PLAYER = 'player'
+IP = 'ip'
+SESSION = 'session'
+
+class FraudGraph:
+    """
+    Grafo de vínculos entre jogadores, IPs e sessões.
+
+    Cada exibição de anúncio liga o jogador ao IP e à sessão (ou o IP à
+    sessão, sem jogador logado). Os vínculos ficam em um índice de
+    adjacência e os componentes são mantidos com union-find (união por
+    tamanho e compressão de caminho), então descobrir o cluster de um nó
+    custa O(α(n)).
+
+    A pontuação de risco do cluster é a maior pontuação com decaimento entre
+    os seus jogadores. Com decaimento exponencial, a ordem entre duas
+    pontuações não muda com o tempo: cada jogador é representado pela chave
+    log2(valor) + (atualizado_em - epoch) / meia-vida, e a raiz guarda a maior chave
+    do cluster. Como uma nova violação sempre aumenta a chave do jogador, o
+    máximo nunca precisa ser recalculado e a leitura é O(α(n)).
+
+    IPs e sessões com mais de `max_shared_degree` vínculos (NAT de
+    operadoras, redes públicas) continuam no índice, mas deixam de unir
+    clusters; sem esse limite um único IP compartilhado juntaria jogadores
+    sem relação. Uniões já feitas não são desfeitas.
+
+    Como nós e uniões nunca saem do grafo, rebuild() troca periodicamente o
+    grafo por um novo carregado com as exibições dos últimos dias (uma nova
+    geração); as pontuações de risco dos jogadores que continuam no grafo
+    são mantidas.
+    """
+
+    def __init__(self, max_shared_degree=50):
+        self.max_shared_degree = max_shared_degree
+        self.generation = 0
+        self.rebuilt_at = None
+        self._rebuilder = None
+        self._nodes = {}
+        self._labels = []
+        self._parent = []
+        self._size = []
+        self._neighbors = []
+        # Maior chave de risco do cluster, válida apenas nas raízes
+        self._risk_key = []
+        # Maior chave de risco de cada jogador, levada para a próxima geração
+        self._player_risk = {}
+        # Origem dos tempos das chaves, para que elas fiquem pequenas e precisas
+        self._epoch = time.time()
+        # Vínculos feitos enquanto rebuild() carrega a próxima geração (None fora dela)
+        self._pending_links = None
+        self._lock = threading.Lock()
+        self.links = 0
+        self.unions = 0
+        self.skipped_unions = 0
+
+    def _node(self, kind, value):
+        label = (kind, value)
+        node = self._nodes.get(label)
+        if node is None:
+            node = self._nodes[label] = len(self._labels)
+            self._labels.append(label)
+            self._parent.append(node)
+            self._size.append(1)
+            self._neighbors.append(set())
+            self._risk_key.append(-math.inf)
+        return node
+
+    def _find(self, node):
+        parent = self._parent
+        while parent[node] != node:
+            # Compressão por divisão ao meio: cada nó passa a apontar para o avô
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _union(self, a, b):
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return a
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self._risk_key[a] = max(self._risk_key[a], self._risk_key[b])
+        self.unions += 1
+        return a
+
+    def _connect(self, node, shared):
+        """Liga `node` a um IP ou sessão; une os clusters se o nó compartilhado não excedeu o limite."""
+        neighbors = self._neighbors[shared]
+        if node in neighbors:
+            return
+        neighbors.add(node)
+        self._neighbors[node].add(shared)
+        self.links += 1
+        if len(neighbors) > self.max_shared_degree:
+            self.skipped_unions += 1
+            return
+        self._union(node, shared)
+
+    def link(self, player_id=None, ip_address=None, session_id=None):
+        """
+        Registra que o jogador (ou visitante anônimo) usou o IP e a sessão.
+
+        Args:
+            player_id: ID do jogador (None para visitantes sem login)
+            ip_address: IP da requisição
+            session_id: ID da sessão
+        """
+        with self._lock:
+            if self._pending_links is not None:
+                self._pending_links.append((player_id, ip_address, session_id))
+            ip = self._node(IP, ip_address) if ip_address else None
+            session = self._node(SESSION, session_id) if session_id else None
+            if player_id is not None:
+                player = self._node(PLAYER, player_id)
+                for shared in (ip, session):
+                    if shared is not None:
+                        self._connect(player, shared)
+            elif ip is not None and session is not None:
+                self._connect(session, ip)
+
+    def record_risk(self, player_id, value, updated_at):
+        """
+        Atualiza a pontuação de risco de um jogador no seu cluster.
+
+        Args:
+            player_id: ID do jogador
+            value: Pontuação no momento `updated_at` (ver FraudDetector.calculate_fraud_score)
+            updated_at: Timestamp da pontuação
+        """
+        if value <= 0:
+            return
+        key = math.log2(value) + (updated_at - self._epoch) / get_rule_engine().scoring['half_life_seconds']
+        with self._lock:
+            if key > self._player_risk.get(player_id, -math.inf):
+                self._player_risk[player_id] = key
+            self._raise_risk(self._node(PLAYER, player_id), key)
+
+    def _raise_risk(self, node, key):
+        root = self._find(node)
+        if key > self._risk_key[root]:
+            self._risk_key[root] = key
+
+    def _roots(self, player_id, ip_address, session_id):
+        nodes = self._nodes
+        for label in ((PLAYER, player_id), (IP, ip_address), (SESSION, session_id)):
+            node = nodes.get(label)
+            if node is not None:
+                yield self._find(node)
+
+    def cluster_risk(self, player_id=None, ip_address=None, session_id=None, now=None):
+        """
+        Retorna a maior pontuação de risco atual entre os clusters dos nós informados.
+
+        Args:
+            player_id: ID do jogador (opcional)
+            ip_address: IP (opcional)
+            session_id: ID da sessão (opcional)
+            now: Timestamp de referência (padrão: agora)
+
+        Returns:
+            float: Pontuação de risco (0 a max_score); 0 para nós desconhecidos
+        """
+        with self._lock:
+            key = max((self._risk_key[root] for root in self._roots(player_id, ip_address, session_id)),
+                      default=-math.inf)
+        if key == -math.inf:
+            return 0.0
+        if now is None:
+            now = time.time()
+        scoring = get_rule_engine().scoring
+        # A chave da raiz é o máximo de todos os jogadores; o tempo decorrido só desloca a escala
+        return min(2.0 ** (key - (now - self._epoch) / scoring['half_life_seconds']), scoring['max_score'])
+
+    def neighbors(self, kind, value):
+        """Retorna os nós ligados diretamente ao nó, como tuplas (tipo, valor)."""
+        with self._lock:
+            node = self._nodes.get((kind, value))
+            if node is None:
+                return []
+            return [self._labels[neighbor] for neighbor in self._neighbors[node]]
+
+    def cluster(self, kind, value, limit=1000):
+        """
+        Retorna os nós do cluster do nó, até `limit`, como tuplas (tipo, valor).
+
+        Percorre o índice de adjacência a partir do nó sem sair do componente
+        do union-find (vínculos por IPs compartilhados demais são ignorados).
+        """
+        with self._lock:
+            start = self._nodes.get((kind, value))
+            if start is None:
+                return []
+            root = self._find(start)
+            seen = {start}
+            queue = deque([start])
+            while queue and len(seen) < limit:
+                node = queue.popleft()
+                for neighbor in self._neighbors[node]:
+                    if neighbor not in seen and self._find(neighbor) == root:
+                        seen.add(neighbor)
+                        queue.append(neighbor)
+                        if len(seen) >= limit:
+                            break
+            return [self._labels[node] for node in seen]
+
+    def cluster_size(self, kind, value):
+        """Retorna o número de nós no cluster do nó (0 para nós desconhecidos)."""
+        with self._lock:
+            node = self._nodes.get((kind, value))
+            return self._size[self._find(node)] if node is not None else 0
+
+    def load_from_db(self, days=1):
+        """
+        Reconstrói os vínculos a partir das exibições de anúncio recentes.
+
+        Deve ser chamado dentro do contexto da aplicação.
+
+        Returns:
+            int: Número de exibições lidas
+        """
+        rows = db.session.query(AdDisplay.player_id, AdDisplay.ip_address, AdDisplay.session_id).filter(
+            AdDisplay.displayed_at > datetime.utcnow() - timedelta(days=days)
+        ).yield_per(10000)
+        count = 0
+        for player_id, ip_address, session_id in rows:
+            self.link(player_id, ip_address, session_id)
+            count += 1
+        return count
+
+    def rebuild(self, days=1):
+        """
+        Substitui o grafo por uma nova geração com as exibições dos últimos `days` dias.
+
+        A nova geração é carregada sem segurar o lock; os vínculos feitos
+        enquanto isso são reaplicados nela antes da troca. Deve ser chamado
+        dentro do contexto da aplicação.
+
+        Returns:
+            int: Número de exibições lidas
+        """
+        graph = FraudGraph(self.max_shared_degree)
+        # A mesma origem mantém as chaves de risco comparáveis entre gerações
+        graph._epoch = self._epoch
+        with self._lock:
+            self._pending_links = []
+        try:
+            count = graph.load_from_db(days)
+        except Exception:
+            with self._lock:
+                self._pending_links = None
+            raise
+        with self._lock:
+            for player_id, ip_address, session_id in self._pending_links:
+                graph.link(player_id, ip_address, session_id)
+            for player_id, key in self._player_risk.items():
+                node = graph._nodes.get((PLAYER, player_id))
+                # Jogadores sem exibições no período saem do grafo com a sua pontuação
+                if node is not None:
+                    graph._player_risk[player_id] = key
+                    graph._raise_risk(node, key)
+            self._nodes, self._labels, self._parent = graph._nodes, graph._labels, graph._parent
+            self._size, self._neighbors, self._risk_key = graph._size, graph._neighbors, graph._risk_key
+            self._player_risk = graph._player_risk
+            self.links, self.unions, self.skipped_unions = graph.links, graph.unions, graph.skipped_unions
+            self._pending_links = None
+            self.generation += 1
+            self.rebuilt_at = time.time()
+        return count
+
+    def start_rebuilder(self, app, interval=3600.0, days=1):
+        """Inicia uma thread daemon que chama rebuild(days) a cada `interval` segundos."""
+        if self._rebuilder is not None:
+            return self
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    with app.app_context():
+                        self.rebuild(days)
+                except Exception as e:
+                    print(f"FRAUD GRAPH ERROR: {e}")
+
+        self._rebuilder = threading.Thread(target=run, name='fraud-graph-rebuild', daemon=True)
+        self._rebuilder.start()
+        return self
+
+    def stats(self):
+        """
+        Retorna métricas do grafo.
+
+        Returns:
+            dict: Geração e momento da última reconstrução, nós, vínculos,
+                  uniões feitas e uniões evitadas por nós compartilhados demais
+        """
+        with self._lock:
+            return {
+                'generation': self.generation,
+                'rebuilt_at': self.rebuilt_at,
+                'nodes': len(self._labels),
+                'links': self.links,
+                'unions': self.unions,
+                'skipped_unions': self.skipped_unions,
+            }
+
+    def __len__(self):
+        return len(self._labels)
+
+fraud_graph = FraudGraph()
+
+def init_fraud_graph(app):
+    """
+    Carrega o grafo das exibições recentes e passa a reconstruí-lo periodicamente.
+
+    Lê do app.config FRAUD_GRAPH_DAYS (padrão 1) e
+    FRAUD_GRAPH_REBUILD_SECONDS (padrão 3600).
+
+    Returns:
+        int: Número de exibições lidas
+    """
+    days = app.config.get('FRAUD_GRAPH_DAYS', 1)
+    with app.app_context():
+        count = fraud_graph.rebuild(days)
+    fraud_graph.start_rebuilder(app, interval=app.config.get('FRAUD_GRAPH_REBUILD_SECONDS', 3600.0), days=days)
+    return count
@@ -0,0 +1,379 @@
+import os
+import json
+import math
+import time
+import threading
+from utils.action_store import intern_action_type, action_type_name
+
+EARN_COINS = intern_action_type('earn_coins')
+BUY_ITEM = intern_action_type('buy_item')
+
+# Configuração usada quando nenhum arquivo é informado. Cada regra pode
+# definir 'type' (classe em RULE_TYPES, padrão: o próprio nome), 'enabled',
+# 'score', 'action_types' (substitui as assinaturas da classe) e os
+# parâmetros específicos da regra.
+DEFAULT_RULES_CONFIG = {
+    'thresholds': {
+        'warning': 20,
+        'critical': 50,
+    },
+    # Pontuação de risco usada por FraudDetector.calculate_fraud_score: cada
+    # violação soma a pontuação da regra e o total cai pela metade a cada
+    # half_life_seconds sem novas violações
+    'scoring': {
+        'half_life_seconds': 3600,
+        'max_score': 100,
+    },
+    # Alertas repetidos do mesmo (jogador, tipo) dentro da janela são
+    # agrupados no alerta aberto; 0 desativa o agrupamento
+    'alerts': {
+        'coalesce_seconds': 300,
+    },
+    'rules': {
+        'bot_activity': {'score': 10, 'sample_size': 5, 'max_avg_interval': 1.0, 'max_std_dev': 0.2},
+        'excessive_self_elimination': {'score': 5, 'min_count': 50, 'min_ratio': 0.8},
+        'abnormal_coin_gain': {'score': 15, 'min_total_earns': 20, 'min_window_earns': 10,
+                               'max_coins_per_second': 0.0000000001},
+        'rapid_purchases': {'score': 8, 'min_total_buys': 5, 'min_window_buys': 5, 'min_interval': 0.5},
+    },
+}
+
+# Regras disponíveis: nome do tipo -> classe
+RULE_TYPES = {}
+
+def register_rule(rule_class):
+    """Decorator que adiciona a classe de regra a RULE_TYPES."""
+    RULE_TYPES[rule_class.name] = rule_class
+    return rule_class
+
+def _purchase(ref, price):
+    """Converte a referência e o valor armazenados de volta em (item_id, price)."""
+    return (ref if ref >= 0 else None, price if price == price else None)
+
+class FraudRule:
+    """
+    Regra de detecção de fraude.
+
+    Subclasses definem `name`, `action_types` (tipos de ação que disparam a
+    avaliação; None para todos), `defaults` e evaluate(). Os parâmetros da
+    configuração ficam em self.params.
+    """
+    name = None
+    action_types = None
+    defaults = {}
+
+    def __init__(self, name, config):
+        params = dict(self.defaults)
+        params.update(config)
+        self.alert_type = name
+        self.enabled = params.pop('enabled', True)
+        if 'score' not in params:
+            raise ValueError(f"Fraud rule {name} has no score")
+        self.score = params.pop('score')
+        action_types = params.pop('action_types', self.action_types)
+        self.action_types = tuple(action_types) if action_types is not None else None
+        params.pop('type', None)
+        self.params = params
+        self.evaluations = 0
+        self.matches = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def evaluate(self, player_id, stats, actions):
+        """
+        Avalia a regra após uma nova ação do jogador.
+
+        Returns:
+            dict ou None: Detalhes do alerta, se a regra foi violada
+        """
+        raise NotImplementedError
+
+@register_rule
+class BotActivityRule(FraudRule):
+    """Intervalos curtos e muito regulares entre as últimas ações (possível bot)."""
+    name = 'bot_activity'
+    defaults = {'sample_size': 5, 'max_avg_interval': 1.0, 'max_std_dev': 0.2}
+
+    def evaluate(self, player_id, stats, actions):
+        sample_size = self.params['sample_size']
+        if len(actions) < sample_size:
+            return None
+        timestamps = [actions.timestamp(i) for i in range(-sample_size, 0)]
+        time_diffs = [timestamps[i] - timestamps[i-1] for i in range(1, len(timestamps))]
+        avg_time_diff = sum(time_diffs) / len(time_diffs)
+        if avg_time_diff >= self.params['max_avg_interval']:
+            return None
+        std_dev = math.sqrt(sum((x - avg_time_diff) ** 2 for x in time_diffs) / len(time_diffs))
+        if std_dev >= self.params['max_std_dev']:
+            return None
+        return {
+            'avg_time_between_actions': avg_time_diff,
+            'std_dev': std_dev,
+            'action_types': [action_type_name(actions.type_code(i)) for i in range(-sample_size, 0)]
+        }
+
+@register_rule
+class ExcessiveSelfEliminationRule(FraudRule):
+    """Auto-eliminações frequentes que são a maioria das ações do jogador."""
+    name = 'excessive_self_elimination'
+    action_types = ('self_eliminate',)
+    defaults = {'min_count': 50, 'min_ratio': 0.8}
+
+    def evaluate(self, player_id, stats, actions):
+        count = stats['action_counts'].get('self_eliminate', 0)
+        if count <= self.params['min_count']:
+            return None
+        percentage = count / stats['total_actions']
+        if percentage <= self.params['min_ratio']:
+            return None
+        return {'count': count, 'percentage': percentage}
+
+@register_rule
+class AbnormalCoinGainRule(FraudRule):
+    """Taxa de ganho de moedas acima do esperado nas ações do buffer."""
+    name = 'abnormal_coin_gain'
+    action_types = ('earn_coins',)
+    defaults = {'min_total_earns': 20, 'min_window_earns': 10, 'max_coins_per_second': 0.0000000001}
+
+    def evaluate(self, player_id, stats, actions):
+        if stats['action_counts'].get('earn_coins', 0) <= self.params['min_total_earns']:
+            return None
+        earn_window = stats['earn_window']
+        if earn_window.count < self.params['min_window_earns']:
+            return None
+        total_coins = earn_window.amount
+        time_span = stats['last_actions']['earn_coins'] - actions.timestamp_at(earn_window.oldest)
+        if time_span <= 0:
+            return None
+        coins_per_second = total_coins / time_span
+        if coins_per_second <= self.params['max_coins_per_second']:
+            return None
+        return {
+            'coins_per_second': coins_per_second,
+            'total_coins': total_coins,
+            'time_span_seconds': time_span
+        }
+
+@register_rule
+class RapidPurchasesRule(FraudRule):
+    """
+    Compras consecutivas em intervalo muito curto.
+
+    O número de pares rápidos no buffer é mantido por FraudDetector com o
+    'min_interval' desta regra; depois de uma recarga das regras os pares de
+    cada jogador são recontados com o novo intervalo na sua próxima ação.
+    """
+    name = 'rapid_purchases'
+    action_types = ('buy_item',)
+    defaults = {'min_total_buys': 5, 'min_window_buys': 5, 'min_interval': 0.5}
+
+    def evaluate(self, player_id, stats, actions):
+        if stats['action_counts'].get('buy_item', 0) <= self.params['min_total_buys']:
+            return None
+        if stats['buy_window'].count < self.params['min_window_buys'] or stats['rapid_buy_pairs'] <= 0:
+            return None
+        purchases = []
+        for position in range(-1, -len(actions) - 1, -1):
+            if actions.type_code(position) == BUY_ITEM:
+                purchases.append(_purchase(actions.ref(position), actions.amount(position)))
+                if len(purchases) == 5:
+                    break
+        purchases.reverse()
+        return {'purchases': purchases}
+
+class RuleEngine:
+    """
+    Registro das regras ativas e roteamento por tipo de ação.
+
+    As regras são agrupadas pelos tipos de ação que assinam; uma nova ação
+    avalia apenas as regras do seu tipo e as que assinam todos os tipos.
+    A configuração vem de um arquivo JSON recarregado quando sua data de
+    modificação muda. O novo conjunto de regras é montado à parte e
+    substitui o anterior de uma vez, como em IPBlacklist.
+    """
+
+    def __init__(self, path=None, config=None):
+        self.path = path
+        self._mtime = None
+        self._watcher = None
+        # Incrementada a cada carga, para quem guarda estado derivado dos parâmetros
+        self.version = 0
+        self._load(config or DEFAULT_RULES_CONFIG)
+        if path:
+            self.reload_if_changed()
+
+    def _load(self, config):
+        rules = []
+        for name, rule_config in config.get('rules', {}).items():
+            rule_type = rule_config.get('type', name)
+            if rule_type not in RULE_TYPES:
+                raise ValueError(f"Unknown fraud rule type: {rule_type}")
+            rule = RULE_TYPES[rule_type](name, rule_config)
+            if rule.enabled:
+                rules.append(rule)
+
+        # Cada lista mantém a ordem da configuração entre regras específicas e curingas
+        wildcard = [rule for rule in rules if rule.action_types is None]
+        subscribed = {action_type for rule in rules for action_type in rule.action_types or ()}
+        by_type = {
+            action_type: [rule for rule in rules if rule.action_types is None or action_type in rule.action_types]
+            for action_type in subscribed
+        }
+
+        # Seções gerais: valores ausentes no arquivo vêm de DEFAULT_RULES_CONFIG
+        settings = {}
+        for section in ('thresholds', 'scoring', 'alerts'):
+            settings[section] = dict(DEFAULT_RULES_CONFIG[section])
+            settings[section].update(config.get(section, {}))
+        if settings['scoring']['half_life_seconds'] <= 0:
+            raise ValueError(f"Invalid half_life_seconds: {settings['scoring']['half_life_seconds']}")
+        # Primeira regra ativa de cada tipo (classe), para parâmetros usados fora da regra
+        by_rule_type = {}
+        for rule in rules:
+            by_rule_type.setdefault(type(rule), rule)
+
+        # Troca atômica: avaliações em andamento continuam com o conjunto anterior
+        self._state = (rules, by_type, wildcard, {rule.alert_type: rule for rule in rules}, settings, by_rule_type)
+        self.version += 1
+
+    def load(self, config):
+        """Substitui as regras pela configuração informada."""
+        self._load(config)
+
+    def reload_if_changed(self):
+        """
+        Recarrega o arquivo se ele mudou desde a última leitura.
+
+        Returns:
+            bool: True se as regras foram recarregadas
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with open(self.path) as config_file:
+            self._load(json.load(config_file))
+        self._mtime = mtime
+        return True
+
+    def start_watcher(self, interval=30):
+        """Inicia uma thread daemon que verifica o arquivo a cada `interval` segundos."""
+        if self._watcher is not None or not self.path:
+            return self
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception as e:
+                    # Arquivo inválido ou em escrita: manter as regras atuais
+                    print(f"FRAUD RULES RELOAD ERROR: {e}")
+
+        self._watcher = threading.Thread(target=run, name='fraud-rules-watcher', daemon=True)
+        self._watcher.start()
+        return self
+
+    @property
+    def thresholds(self):
+        return self._state[4]['thresholds']
+
+    @property
+    def scoring(self):
+        return self._state[4]['scoring']
+
+    @property
+    def alerts(self):
+        return self._state[4]['alerts']
+
+    def param(self, rule_name, key, default=None):
+        """Retorna um parâmetro da regra ativa com o nome informado (ou `default`)."""
+        rule = self._state[3].get(rule_name)
+        if rule is None:
+            return default
+        return rule.params.get(key, default)
+
+    def type_param(self, rule_type, key, default=None):
+        """Retorna um parâmetro da primeira regra ativa da classe `rule_type`, qualquer que seja o seu nome."""
+        rule = self._state[5].get(rule_type)
+        if rule is None:
+            return default
+        return rule.params.get(key, default)
+
+    def evaluate(self, player_id, action_type, stats, actions):
+        """
+        Avalia as regras relevantes para o tipo de ação.
+
+        Args:
+            player_id: ID do jogador
+            action_type: Tipo da nova ação; None avalia todas as regras
+            stats: Estatísticas do jogador em player_stats
+            actions: PlayerActions do jogador
+
+        Returns:
+            list: (regra, detalhes) de cada regra violada, na ordem da configuração
+        """
+        rules, by_type, wildcard = self._state[:3]
+        if action_type is not None:
+            rules = by_type.get(action_type, wildcard)
+        violations = []
+        for rule in rules:
+            start = time.perf_counter()
+            details = rule.evaluate(player_id, stats, actions)
+            elapsed = time.perf_counter() - start
+            rule.evaluations += 1
+            rule.total_time += elapsed
+            if elapsed > rule.max_time:
+                rule.max_time = elapsed
+            if details is not None:
+                rule.matches += 1
+                violations.append((rule, details))
+        return violations
+
+    def stats(self):
+        """
+        Retorna métricas de cada regra ativa.
+
+        Returns:
+            list: Dicionários com nome, tipos assinados, pontuação, avaliações,
+                  violações e tempo médio e máximo de avaliação em microssegundos
+        """
+        return [
+            {
+                'name': rule.alert_type,
+                'type': rule.name,
+                'action_types': list(rule.action_types) if rule.action_types is not None else None,
+                'score': rule.score,
+                'params': dict(rule.params),
+                'evaluations': rule.evaluations,
+                'matches': rule.matches,
+                'avg_time_us': rule.total_time / rule.evaluations * 1e6 if rule.evaluations else 0.0,
+                'max_time_us': rule.max_time * 1e6,
+            }
+            for rule in self._state[0]
+        ]
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_rule_engine():
+    """
+    Retorna o motor de regras do processo.
+
+    Na primeira chamada as regras são carregadas do arquivo JSON indicado por
+    FRAUD_RULES_FILE (verificado a cada FRAUD_RULES_RELOAD_SECONDS, padrão 30)
+    ou, sem ele, de DEFAULT_RULES_CONFIG.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                path = os.environ.get('FRAUD_RULES_FILE')
+                if path:
+                    interval = float(os.environ.get('FRAUD_RULES_RELOAD_SECONDS', 30))
+                    _engine = RuleEngine(path=path).start_watcher(interval)
+                else:
+                    _engine = RuleEngine()
+    return _engine
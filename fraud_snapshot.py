@@ -0,0 +1,572 @@
+import os
+import sys
+import gc
+import json
+import math
+import time
+import fcntl
+import atexit
+import shutil
+import struct
+import threading
+import numpy as np
+from array import array
+from collections import defaultdict
+from utils.action_store import PlayerActions, TypeWindow, intern_action_type, action_type_names
+from utils.fraud_rules import EARN_COINS, BUY_ITEM
+from utils.fraud_graph import fraud_graph
+from utils.fraud_detection import FraudDetector, player_actions, player_stats, set_action_log
+
+SNAPSHOT_FORMAT = 1
+
+# Registro de ação no log: player_id, sequência (appended após a ação), timestamp, código, valor, referência
+_ACTION_RECORD = struct.Struct('<qqdHdq')
+# Definição de tipo no log: código e tamanho do nome em UTF-8 (seguido do nome)
+_TYPE_RECORD = struct.Struct('<HH')
+_ACTION_TAG = b'A'
+_TYPE_TAG = b'T'
+
+# Colunas do snapshot: nome do arquivo -> typecode do array
+# Por jogador: id, buffer circular (tamanho, head, appended), estatísticas e janelas
+# Por ação no buffer (layout bruto do buffer, não cronológico): timestamps, tipos, valores, referências
+# Por (jogador, tipo): índice do jogador, código, contagem e última ocorrência
+COLUMNS = {
+    'players': 'q',
+    'ring_length': 'H',
+    'ring_head': 'H',
+    'appended': 'q',
+    'timestamps': 'd',
+    'types': 'H',
+    'amounts': 'd',
+    'refs': 'q',
+    'suspicious_activity': 'd',
+    'warnings_issued': 'i',
+    'total_actions': 'q',
+    'rapid_buy_pairs': 'i',
+    'risk_value': 'd',
+    'risk_time': 'd',
+    'earn_count': 'i',
+    'earn_oldest': 'q',
+    'earn_total': 'd',
+    'earn_compensation': 'd',
+    'buy_count': 'i',
+    'buy_oldest': 'q',
+    'buy_total': 'd',
+    'buy_compensation': 'd',
+    'count_player': 'q',
+    'count_type': 'H',
+    'count_value': 'q',
+    'count_last': 'd',
+}
+
+# Colunas com um valor por jogador, na ordem em que _collect_state as preenche
+PLAYER_COLUMNS = (
+    'players', 'ring_length', 'ring_head', 'appended',
+    'suspicious_activity', 'warnings_issued', 'total_actions', 'rapid_buy_pairs',
+    'risk_value', 'risk_time',
+    'earn_count', 'earn_oldest', 'earn_total', 'earn_compensation',
+    'buy_count', 'buy_oldest', 'buy_total', 'buy_compensation',
+)
+
+def _write_file(path, write):
+    with open(path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+class ActionLog:
+    """
+    Log binário das ações aplicadas desde o último snapshot.
+
+    Cada ação é um registro de tamanho fixo (_ACTION_RECORD); o nome de cada
+    tipo de ação é gravado uma vez por arquivo, antes do primeiro registro
+    que usa o código, porque os códigos só valem dentro do processo. A
+    escrita é bufferizada: flush() é chamado periodicamente por
+    FraudSnapshots, então uma queda perde no máximo o último intervalo.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = None
+        self._types = set()
+        self.path = None
+        self.records = 0
+        self.open(path)
+
+    def open(self, path):
+        """Fecha o arquivo atual e passa a gravar em `path`."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, 'ab')
+            self._types = set()
+            self.path = path
+
+    def append(self, player_id, sequence, timestamp, action_type, code, amount, ref):
+        with self._lock:
+            if code not in self._types:
+                name = action_type.encode('utf-8')
+                self._file.write(_TYPE_TAG + _TYPE_RECORD.pack(code, len(name)) + name)
+                self._types.add(code)
+            self._file.write(_ACTION_TAG + _ACTION_RECORD.pack(player_id, sequence, timestamp, code, amount, ref))
+            self.records += 1
+
+    def flush(self, sync=False):
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def read_action_log(path):
+    """
+    Lê um log de ações.
+
+    Um registro incompleto no fim do arquivo (queda durante a escrita) encerra a leitura.
+
+    Yields:
+        tuple: (player_id, sequência, timestamp, nome do tipo, valor, referência)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    names = {}
+    offset, size = 0, len(data)
+    action_size, type_size = _ACTION_RECORD.size, _TYPE_RECORD.size
+    while offset < size:
+        tag = data[offset:offset + 1]
+        offset += 1
+        if tag == _ACTION_TAG:
+            if offset + action_size > size:
+                return
+            player_id, sequence, timestamp, code, amount, ref = _ACTION_RECORD.unpack_from(data, offset)
+            offset += action_size
+            yield player_id, sequence, timestamp, names[code], amount, ref
+        elif tag == _TYPE_TAG:
+            if offset + type_size > size:
+                return
+            code, length = _TYPE_RECORD.unpack_from(data, offset)
+            offset += type_size
+            if offset + length > size:
+                return
+            names[code] = data[offset:offset + length].decode('utf-8')
+            offset += length
+        else:
+            raise ValueError(f"Corrupted action log {path} at offset {offset - 1}")
+
+class FraudSnapshots:
+    """
+    Snapshots do estado de FraudDetector para reinícios rápidos.
+
+    O diretório guarda snapshots numerados (uma pasta com um arquivo binário
+    por coluna de COLUMNS e um meta.json), o arquivo CURRENT com o número do
+    último snapshot completo e logs de ações numerados. O snapshot N é
+    tirado depois de o log passar para actions-N.log, então na restauração
+    bastam o snapshot N e os logs a partir de N.
+
+    O snapshot não pausa a análise: o estado de cada jogador é copiado
+    quando stats['version'] está par e copiado de novo se a versão mudou
+    durante a cópia. Uma ação gravada no log já pode estar no snapshot; na
+    restauração ela é ignorada pela sequência (appended do jogador).
+
+    O diretório pertence a um único processo (ver claim_worker_directory).
+    """
+
+    def __init__(self, directory, lock=None):
+        self.directory = directory
+        # Arquivo com o flock que reserva o diretório, aberto enquanto o processo o usa
+        self.lock = lock
+        self.generation = 0
+        self.log = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _snapshot_path(self, generation):
+        return os.path.join(self.directory, f'snapshot-{generation}')
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, f'actions-{generation}.log')
+
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                return int(f.read().strip())
+        except FileNotFoundError:
+            return 0
+
+    def _log_generations(self):
+        generations = []
+        for name in os.listdir(self.directory):
+            if name.startswith('actions-') and name.endswith('.log'):
+                try:
+                    generations.append(int(name[len('actions-'):-len('.log')]))
+                except ValueError:
+                    continue
+        return sorted(generations)
+
+    def snapshot(self):
+        """
+        Grava um snapshot do estado atual e descarta os snapshots e logs anteriores.
+
+        Returns:
+            dict: Número do snapshot, jogadores, ações e segundos gastos
+        """
+        with self._lock:
+            start = time.perf_counter()
+            generation = max(self.generation, self._current_generation(), *self._log_generations(), 0) + 1
+            if self.log is not None:
+                # Ações a partir daqui vão para o novo log; as anteriores estarão no snapshot
+                self.log.flush()
+                self.log.open(self._log_path(generation))
+
+            columns, action_types = _without_gc(_collect_state)
+            path = self._snapshot_path(generation)
+            tmp_path = path + '.tmp'
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            os.makedirs(tmp_path)
+            for name, values in columns.items():
+                _write_file(os.path.join(tmp_path, name + '.bin'), values.tofile)
+            meta = {
+                'format': SNAPSHOT_FORMAT,
+                'generation': generation,
+                'created_at': time.time(),
+                'byteorder': sys.byteorder,
+                'capacity': player_actions.capacity,
+                'action_types': action_types,
+                'columns': COLUMNS,
+                'players': len(columns['players']),
+                'actions': len(columns['timestamps']),
+            }
+            _write_file(os.path.join(tmp_path, 'meta.json'), lambda f: f.write(json.dumps(meta).encode('utf-8')))
+            os.replace(tmp_path, path)
+
+            current_tmp = os.path.join(self.directory, 'CURRENT.tmp')
+            _write_file(current_tmp, lambda f: f.write(str(generation).encode('ascii')))
+            os.replace(current_tmp, os.path.join(self.directory, 'CURRENT'))
+            self.generation = generation
+            self._discard_before(generation)
+            return {
+                'generation': generation,
+                'players': meta['players'],
+                'actions': meta['actions'],
+                'seconds': time.perf_counter() - start,
+            }
+
+    def _discard_before(self, generation):
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('snapshot-'):
+                number = name[len('snapshot-'):].split('.')[0]
+                if number.isdigit() and int(number) < generation:
+                    shutil.rmtree(path, ignore_errors=True)
+        for number in self._log_generations():
+            if number < generation:
+                os.remove(self._log_path(number))
+
+    def restore(self):
+        """
+        Substitui o estado de FraudDetector pelo último snapshot e reaplica os logs seguintes.
+
+        As ações do log são reaplicadas sem criar alertas: os alertas delas
+        já foram criados antes do reinício.
+
+        Returns:
+            dict: Número do snapshot, jogadores restaurados, ações reaplicadas e segundos gastos
+        """
+        with self._lock:
+            start = time.perf_counter()
+            player_actions.clear()
+            player_stats.clear()
+            generation = self._current_generation()
+            players = 0
+            if generation and os.path.isdir(self._snapshot_path(generation)):
+                players = _without_gc(lambda: _load_state(self._snapshot_path(generation)))
+
+            replayed = 0
+            logs = [number for number in self._log_generations() if number >= generation]
+            for number in logs:
+                for player_id, sequence, timestamp, action_type, amount, ref in read_action_log(self._log_path(number)):
+                    actions = player_actions.get(player_id)
+                    if actions is not None and sequence <= actions.appended:
+                        continue
+                    FraudDetector.apply_action(player_id, action_type, amount, ref, timestamp, raise_alerts=False)
+                    replayed += 1
+            self.generation = max([generation] + logs)
+            return {
+                'generation': generation,
+                'players': players,
+                'replayed': replayed,
+                'seconds': time.perf_counter() - start,
+            }
+
+    def start(self, interval=300.0, flush_interval=1.0):
+        """
+        Passa a registrar as ações no log e a gravar snapshots a cada `interval` segundos (thread daemon).
+
+        Deve ser chamado depois de restore() e antes de a análise começar.
+        """
+        if self._thread is not None:
+            return self
+        # Um novo log por execução: o último log pode terminar em um registro incompleto
+        self.generation += 1
+        self.log = ActionLog(self._log_path(self.generation))
+        set_action_log(self.log)
+
+        def run():
+            last_snapshot = time.monotonic()
+            while True:
+                time.sleep(flush_interval)
+                if self._stopped:
+                    return
+                try:
+                    self.log.flush()
+                    if time.monotonic() - last_snapshot >= interval:
+                        self.snapshot()
+                        last_snapshot = time.monotonic()
+                except Exception as e:
+                    print(f"FRAUD SNAPSHOT ERROR: {e}")
+
+        self._thread = threading.Thread(target=run, name='fraud-snapshot', daemon=True)
+        self._thread.start()
+        atexit.register(self._snapshot_at_exit)
+        return self
+
+    def _snapshot_at_exit(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        try:
+            self.snapshot()
+        except Exception as e:
+            print(f"FRAUD SNAPSHOT ERROR: {e}")
+            self.log.flush(sync=True)
+
+    def stop(self):
+        """Para de registrar ações e de gravar snapshots, sem gravar um snapshot final."""
+        self._stopped = True
+        set_action_log(None)
+        if self.log is not None:
+            self.log.close()
+
+# Arquivos de snapshot e log de FraudSnapshots, usados ao mover um diretório sem subdiretórios de worker
+_STATE_PREFIXES = ('snapshot-', 'actions-', 'CURRENT')
+
+def claim_worker_directory(directory):
+    """
+    Reserva para este processo um subdiretório worker-N de `directory`.
+
+    O estado de FraudDetector é de cada worker do servidor, então cada um
+    grava seus snapshots e logs em um subdiretório próprio, reservado com um
+    flock no arquivo LOCK enquanto o processo viver. No reinício cada worker
+    retoma o primeiro subdiretório livre e restaura o estado que estava lá.
+
+    Args:
+        directory: Diretório de FRAUD_SNAPSHOT_DIR
+
+    Returns:
+        tuple: (caminho do subdiretório, arquivo LOCK aberto; fechá-lo libera a reserva)
+    """
+    os.makedirs(directory, exist_ok=True)
+    slot = 0
+    while True:
+        path = os.path.join(directory, f'worker-{slot}')
+        os.makedirs(path, exist_ok=True)
+        lock = open(os.path.join(path, 'LOCK'), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            slot += 1
+            continue
+        if slot == 0 and not os.path.exists(os.path.join(path, 'CURRENT')):
+            # Snapshots gravados antes dos subdiretórios por worker ficam com o primeiro worker
+            for name in os.listdir(directory):
+                if name.startswith(_STATE_PREFIXES):
+                    os.replace(os.path.join(directory, name), os.path.join(path, name))
+        return path, lock
+
+def _collect_state():
+    """
+    Copia o estado de todos os jogadores para as colunas do snapshot.
+
+    Returns:
+        tuple: (colunas, nomes dos tipos de ação na ordem dos códigos usados nas colunas)
+    """
+    c = {name: array(typecode) for name, typecode in COLUMNS.items()}
+    append = {name: values.append for name, values in c.items()}
+    timestamps, types, amounts, refs = c['timestamps'], c['types'], c['amounts'], c['refs']
+    for player_id, stats in list(player_stats.items()):
+        while True:
+            version = stats['version']
+            if version & 1:
+                # Ação do jogador em andamento em outro worker
+                time.sleep(0)
+                continue
+            mark = len(timestamps)
+            actions = player_actions.get(player_id)
+            if actions is None:
+                # Jogador recém-criado em apply_action, antes da primeira ação
+                # (que irá para o log novo), ou sem ações no buffer
+                if stats['version'] == version:
+                    break
+                continue
+            timestamps.extend(actions.timestamps)
+            types.extend(actions.types)
+            amounts.extend(actions.amounts)
+            refs.extend(actions.refs)
+            head, appended = actions.head, actions.appended
+            counts = list(stats['action_counts'].items())
+            last_actions = dict(stats['last_actions'])
+            earn, buy = stats['earn_window'], stats['buy_window']
+            earn_state = (earn.count, earn.oldest, earn.total, earn._compensation)
+            buy_state = (buy.count, buy.oldest, buy.total, buy._compensation)
+            risk = stats.get('risk', (math.nan, math.nan))
+            scalars = (stats['suspicious_activity'], stats['warnings_issued'],
+                       stats['total_actions'], stats['rapid_buy_pairs'])
+            if stats['version'] == version:
+                break
+            # O jogador mudou durante a cópia: descartar e copiar de novo
+            for values in (timestamps, types, amounts, refs):
+                del values[mark:]
+        if actions is None:
+            continue
+
+        index = len(c['players'])
+        for name, value in zip(PLAYER_COLUMNS, (
+                player_id, len(timestamps) - mark, head, appended, *scalars, *risk, *earn_state, *buy_state)):
+            append[name](value)
+        for name, value in counts:
+            append['count_player'](index)
+            append['count_type'](intern_action_type(name))
+            append['count_value'](value)
+            append['count_last'](last_actions.get(name, math.nan))
+    # Os códigos só crescem: a lista lida no fim cobre todos os códigos copiados
+    return c, action_type_names()
+
+def _read_columns(path, meta):
+    columns = {}
+    for name, typecode in meta['columns'].items():
+        values = array(typecode)
+        with open(os.path.join(path, name + '.bin'), 'rb') as f:
+            values.frombytes(f.read())
+        if meta['byteorder'] != sys.byteorder:
+            values.byteswap()
+        columns[name] = values
+    return columns
+
+def _remap_types(types, lookup):
+    """Traduz os códigos do snapshot para os códigos deste processo."""
+    if all(old == new for old, new in enumerate(lookup)):
+        return types
+    remapped = np.asarray(lookup, dtype=np.uint16)[np.frombuffer(types, dtype=np.uint16)]
+    return array('H', remapped.tobytes())
+
+def _without_gc(func):
+    """
+    Executa func com o coletor de ciclos pausado.
+
+    Carregar ou copiar milhões de dicionários e arrays dispara coletas
+    completas repetidas que percorrem todos esses objetos sem liberar nada.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return func()
+    finally:
+        if enabled:
+            gc.enable()
+
+def _load_state(path):
+    """Carrega um snapshot em player_actions e player_stats. Retorna o número de jogadores."""
+    with open(os.path.join(path, 'meta.json'), 'rb') as f:
+        meta = json.loads(f.read())
+    if meta['format'] != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported fraud snapshot format: {meta['format']}")
+    c = _read_columns(path, meta)
+    names = meta['action_types']
+    lookup = [intern_action_type(name) for name in names]
+    types = _remap_types(c['types'], lookup)
+    timestamps, amounts, refs = c['timestamps'], c['amounts'], c['refs']
+
+    # Contagens por tipo, gravadas em ordem de jogador: (índice do jogador, nome, contagem, última ocorrência)
+    counts = iter(zip(c['count_player'], (names[code] for code in c['count_type']), c['count_value'], c['count_last']))
+    pending_count = next(counts, None)
+
+    new_actions = PlayerActions.__new__
+    new_window = TypeWindow.__new__
+    put = player_actions.put
+    offset = 0
+    rows = zip(*(c[name] for name in PLAYER_COLUMNS))
+    for index, row in enumerate(rows):
+        (player_id, length, head, appended, suspicious, warnings, total, rapid_pairs,
+         risk_value, risk_time, earn_count, earn_oldest, earn_total, earn_compensation,
+         buy_count, buy_oldest, buy_total, buy_compensation) = row
+        end = offset + length
+        actions = new_actions(PlayerActions)
+        actions.timestamps = timestamps[offset:end]
+        actions.types = types[offset:end]
+        actions.amounts = amounts[offset:end]
+        actions.refs = refs[offset:end]
+        actions.head = head
+        actions.appended = appended
+        offset = end
+        put(player_id, actions)
+
+        action_counts = defaultdict(int)
+        last_actions = {}
+        while pending_count is not None and pending_count[0] == index:
+            _, name, value, last = pending_count
+            action_counts[name] = value
+            if last == last:
+                last_actions[name] = last
+            pending_count = next(counts, None)
+
+        earn = new_window(TypeWindow)
+        earn.code, earn.count, earn.oldest, earn.total, earn._compensation = (
+            EARN_COINS, earn_count, earn_oldest, earn_total, earn_compensation)
+        buy = new_window(TypeWindow)
+        buy.code, buy.count, buy.oldest, buy.total, buy._compensation = (
+            BUY_ITEM, buy_count, buy_oldest, buy_total, buy_compensation)
+
+        stats = {
+            'action_counts': action_counts,
+            'last_actions': last_actions,
+            'suspicious_activity': suspicious,
+            'warnings_issued': warnings,
+            'total_actions': total,
+            'earn_window': earn,
+            'buy_window': buy,
+            'rapid_buy_pairs': rapid_pairs,
+            'version': 0,
+        }
+        if risk_value == risk_value:
+            stats['risk'] = (risk_value, risk_time)
+            fraud_graph.record_risk(player_id, risk_value, risk_time)
+        player_stats[player_id] = stats
+    return len(c['players'])
+
+def init_fraud_snapshots(app):
+    """
+    Restaura o estado de FraudDetector e passa a gravar snapshots.
+
+    Lê do app.config: FRAUD_SNAPSHOT_DIR (sem ele os snapshots ficam
+    desativados; cada worker usa um subdiretório worker-N) e
+    FRAUD_SNAPSHOT_INTERVAL (padrão 300 segundos). Deve ser chamado antes de
+    init_fraud_analysis.
+    """
+    directory = app.config.get('FRAUD_SNAPSHOT_DIR')
+    if not directory:
+        return None
+    snapshots = FraudSnapshots(*claim_worker_directory(directory))
+    result = snapshots.restore()
+    print(f"FRAUD SNAPSHOT: restored {result['players']} players and replayed "
+          f"{result['replayed']} actions in {result['seconds']:.2f}s")
+    return snapshots.start(interval=app.config.get('FRAUD_SNAPSHOT_INTERVAL', 300.0))
@@ -0,0 +1,120 @@
+import time
+import queue
+import atexit
+import threading
+
+class ShardedWorkerPool:
+    """
+    Pool de threads com uma fila por worker, particionado por chave.
+
+    Todas as tarefas de uma mesma chave (ex: player_id) vão para a mesma
+    fila e são executadas por um único worker, na ordem de envio; assim o
+    estado de cada chave só é alterado por uma thread. Com a fila do worker
+    cheia, submit() espera até submit_timeout segundos por espaço; se a fila
+    continuar cheia a tarefa é descartada e contada, e on_drop(descartadas)
+    é chamado com as tarefas descartadas desde o último aviso, no máximo uma
+    vez a cada drop_report_interval segundos. A tarefa não é executada na
+    thread de quem envia, o que quebraria a garantia de um worker por chave.
+    """
+
+    def __init__(self, handler, workers=4, max_queue=10000, name='sharded-worker',
+                 submit_timeout=0.05, on_drop=None, drop_report_interval=60.0):
+        self.handler = handler
+        self.name = name
+        self.submit_timeout = submit_timeout
+        self.on_drop = on_drop
+        self.drop_report_interval = drop_report_interval
+        self._queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self._threads = []
+        self._closed = False
+        self._drop_lock = threading.Lock()
+        self._unreported_drops = 0
+        self._drop_reported_at = None
+        self.submitted = 0
+        self.dropped = 0
+        self.errors = 0
+        for index, task_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(task_queue,), name=f'{name}-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.shutdown)
+
+    def submit(self, key, args):
+        """
+        Enfileira handler(*args) no worker responsável pela chave.
+
+        Returns:
+            bool: True se a tarefa foi aceita, False se foi descartada
+        """
+        if self._closed:
+            return False
+        task_queue = self._queues[hash(key) % len(self._queues)]
+        try:
+            if self.submit_timeout:
+                task_queue.put(args, timeout=self.submit_timeout)
+            else:
+                task_queue.put_nowait(args)
+        except queue.Full:
+            self._record_drop()
+            return False
+        self.submitted += 1
+        return True
+
+    def _record_drop(self):
+        now = time.monotonic()
+        with self._drop_lock:
+            self.dropped += 1
+            self._unreported_drops += 1
+            if self._drop_reported_at is not None and now - self._drop_reported_at < self.drop_report_interval:
+                return
+            self._drop_reported_at = now
+            count, self._unreported_drops = self._unreported_drops, 0
+        try:
+            if self.on_drop is not None:
+                self.on_drop(count)
+            else:
+                print(f"WORKER POOL WARNING: {self.name} dropped {count} tasks (queue full)")
+        except Exception as e:
+            print(f"WORKER POOL ERROR: {e}")
+
+    def _run(self, task_queue):
+        while True:
+            args = task_queue.get()
+            try:
+                if args is None:
+                    return
+                self.handler(*args)
+            except Exception as e:
+                self.errors += 1
+                print(f"WORKER POOL ERROR: {e}")
+            finally:
+                task_queue.task_done()
+
+    def flush(self):
+        """Espera todas as tarefas já enfileiradas terminarem."""
+        for task_queue in self._queues:
+            task_queue.join()
+
+    def shutdown(self, timeout=5.0):
+        """Processa as tarefas pendentes e encerra os workers."""
+        if self._closed:
+            return
+        self._closed = True
+        for task_queue in self._queues:
+            task_queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def stats(self):
+        """
+        Retorna métricas do pool.
+
+        Returns:
+            dict: Profundidade de cada fila, tarefas aceitas, descartadas e com erro
+        """
+        return {
+            'queue_depths': [task_queue.qsize() for task_queue in self._queues],
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'errors': self.errors,
+        }
@@ -0,0 +1,188 @@
+import os
+import time
+import socket
+import ipaddress
+import threading
+
+# IPs conhecidos por atividades maliciosas usados quando nenhum arquivo é configurado
+DEFAULT_BLACKLIST = [
+    '1.2.3.4',
+    '5.6.7.8',
+]
+
+# Prefixo dos endereços IPv6 que representam IPv4 (::ffff:a.b.c.d)
+IPV4_MAPPED_PREFIX = b'\x00' * 10 + b'\xff\xff'
+
+class _Node:
+    """Nó da trie: um filho por byte e um bitmap de 256 bits dos bytes totalmente bloqueados."""
+    __slots__ = ('children', 'covered')
+
+    def __init__(self):
+        self.children = {}
+        self.covered = 0
+
+class PrefixTrie:
+    """
+    Trie de prefixos com passo de 8 bits.
+
+    Cada nível consome um byte do endereço. Prefixos que não terminam em
+    fronteira de byte são expandidos no último nível (ex: um /20 marca 16
+    bytes no bitmap do terceiro nível). A consulta percorre no máximo um nó
+    por byte do endereço: 4 para IPv4 e 16 para IPv6.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.matches_all = False
+        self.size = 0
+
+    def insert(self, network):
+        """Adiciona uma rede (ipaddress.IPv4Network ou IPv6Network)."""
+        self.size += 1
+        prefix_length = network.prefixlen
+        if prefix_length == 0:
+            self.matches_all = True
+            return
+
+        address = network.network_address.packed
+        full_bytes, remaining_bits = divmod(prefix_length, 8)
+        if remaining_bits == 0:
+            # O prefixo cobre todo o byte final: marcar no nível anterior
+            full_bytes -= 1
+            first, count = address[full_bytes], 1
+        else:
+            first, count = address[full_bytes], 1 << (8 - remaining_bits)
+
+        node = self.root
+        for byte in address[:full_bytes]:
+            child = node.children.get(byte)
+            if child is None:
+                child = node.children[byte] = _Node()
+            node = child
+        node.covered |= ((1 << count) - 1) << first
+
+    def contains(self, packed_address):
+        """Verifica se o endereço (bytes) está em alguma rede da trie."""
+        if self.matches_all:
+            return True
+        node = self.root
+        for byte in packed_address:
+            if (node.covered >> byte) & 1:
+                return True
+            node = node.children.get(byte)
+            if node is None:
+                return False
+        return False
+
+class IPBlacklist:
+    """
+    Lista negra de IPs e redes CIDR (IPv4 e IPv6).
+
+    As entradas vêm de um arquivo com um IP ou rede por linha (linhas vazias
+    e comentários com '#' são ignorados). O arquivo é recarregado quando sua
+    data de modificação muda; a nova trie é montada à parte e substitui a
+    anterior de uma vez, então as consultas nunca veem uma lista incompleta.
+    """
+
+    def __init__(self, path=None, entries=None):
+        self.path = path
+        self._mtime = None
+        self._watcher = None
+        self._tries = self._build(entries or [])
+        if path:
+            self.reload_if_changed()
+
+    @staticmethod
+    def _build(entries):
+        tries = {4: PrefixTrie(), 6: PrefixTrie()}
+        for entry in entries:
+            entry = entry.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                continue
+            tries[network.version].insert(network)
+        return tries
+
+    def load(self, entries):
+        """Substitui o conteúdo da lista pelas entradas informadas."""
+        self._tries = self._build(entries)
+
+    def reload_if_changed(self):
+        """
+        Recarrega o arquivo se ele mudou desde a última leitura.
+
+        Returns:
+            bool: True se a lista foi recarregada
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        with open(self.path) as blacklist_file:
+            self._tries = self._build(blacklist_file)
+        self._mtime = mtime
+        return True
+
+    def start_watcher(self, interval=30):
+        """Inicia uma thread daemon que verifica o arquivo a cada `interval` segundos."""
+        if self._watcher is not None or not self.path:
+            return self
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.reload_if_changed()
+                except Exception:
+                    # Arquivo inválido ou em escrita: manter a lista atual
+                    pass
+
+        self._watcher = threading.Thread(target=run, name='ip-blacklist-watcher', daemon=True)
+        self._watcher.start()
+        return self
+
+    def contains(self, ip_address):
+        """Verifica se o IP está na lista negra. IPs inválidos nunca estão."""
+        # inet_pton é bem mais barato que ipaddress.ip_address no caminho crítico
+        try:
+            return self._tries[4].contains(socket.inet_pton(socket.AF_INET, ip_address))
+        except (OSError, TypeError):
+            pass
+        try:
+            packed = socket.inet_pton(socket.AF_INET6, ip_address)
+        except (OSError, TypeError):
+            return False
+        if packed.startswith(IPV4_MAPPED_PREFIX):
+            return self._tries[4].contains(packed[12:])
+        return self._tries[6].contains(packed)
+
+    def __len__(self):
+        return self._tries[4].size + self._tries[6].size
+
+_blacklist = None
+_blacklist_lock = threading.Lock()
+
+def get_blacklist():
+    """
+    Retorna a lista negra do processo.
+
+    Na primeira chamada a lista é carregada do arquivo indicado por
+    IP_BLACKLIST_FILE (verificado a cada IP_BLACKLIST_RELOAD_SECONDS, padrão
+    30) ou, sem ele, de DEFAULT_BLACKLIST.
+    """
+    global _blacklist
+    if _blacklist is None:
+        with _blacklist_lock:
+            if _blacklist is None:
+                path = os.environ.get('IP_BLACKLIST_FILE')
+                if path:
+                    interval = float(os.environ.get('IP_BLACKLIST_RELOAD_SECONDS', 30))
+                    _blacklist = IPBlacklist(path=path).start_watcher(interval)
+                else:
+                    _blacklist = IPBlacklist(entries=DEFAULT_BLACKLIST)
+    return _blacklist
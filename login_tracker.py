@@ -0,0 +1,211 @@
+import time
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+from models.user import db
+from models.security_log import LoginAttempt
+from utils.security_store import get_store
+
+class LoginAttemptTracker:
+    """
+    Rastreia falhas de login por IP e por nome de usuário.
+
+    As falhas de cada chave ('ip:<ip>' ou 'user:<nome>') são contadas no
+    backend de get_store(), em contadores por janela (login_fail:<chave>:<janela>)
+    incrementados atomicamente com incr_window e expirados pelo TTL. Como no
+    utils.rate_limiter, a contagem na janela deslizante pondera a janela
+    anterior pela fração que ainda se sobrepõe ao intervalo; ao atingir
+    max_attempts a chave é bloqueada (login_block:<chave>). Com o backend
+    compartilhado (SQLite ou Redis), as falhas de todos os workers somam no
+    mesmo contador e o bloqueio vale para todos.
+
+    Cada processo mantém também um cache das suas próprias falhas: um único
+    array('d') de max_attempts + 1 posições por chave, em que a posição 0 é o
+    índice de escrita e as demais formam um buffer circular com os
+    timestamps das últimas falhas. O cache só decide quando o backend está
+    indisponível: record_failure retorna True (login recusado) se o próprio
+    processo registrou max_attempts falhas da chave na janela. O custo por falha é O(1) e a memória do cache por chave é
+    constante: com max_attempts=5, cerca de 300 bytes (array de 112 bytes, a
+    string da chave e a entrada no dicionário), medido com
+    `benchmarks.py login_tracker`.
+    Chaves sem falhas recentes são removidas do cache incrementalmente a cada
+    registro.
+
+    As tentativas só são enfileiradas para LoginAttempt depois de
+    start_persistence(); a fila guarda no máximo max_pending tentativas e,
+    com o banco indisponível, as mais antigas são descartadas.
+    """
+
+    def __init__(self, max_attempts=5, window_seconds=900, block_seconds=1800, store=None, max_pending=100000):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+        self.block_seconds = block_seconds
+        self.store = store
+        # Ordenado pela última falha: as chaves mais antigas ficam no início
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_pending = max_pending
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._persister = None
+        self.dropped_attempts = 0
+
+    def _store(self):
+        return self.store or get_store()
+
+    def blocked_for(self, key, now=None):
+        """Retorna quantos segundos faltam para a chave ser desbloqueada (0 se não bloqueada)."""
+        if now is None:
+            now = time.time()
+        blocked_until = self._store().get(f'login_block:{key}')
+        if blocked_until and now < blocked_until:
+            return blocked_until - now
+        return 0
+
+    def _window_keys(self, key, now):
+        window_index = int(now // self.window_seconds)
+        return f'login_fail:{key}:{window_index}', f'login_fail:{key}:{window_index - 1}'
+
+    def record_failure(self, key, now=None):
+        """
+        Registra uma falha de login para a chave.
+
+        Returns:
+            bool: True se a falha fez a chave ser bloqueada
+        """
+        if now is None:
+            now = time.time()
+        cached_block = self._cache_failure(key, now)
+        window = self.window_seconds
+        current_key, previous_key = self._window_keys(key, now)
+        store = self._store()
+        try:
+            previous, current = store.incr_window(current_key, previous_key, ttl=2 * window)
+        except Exception as e:
+            # Backend indisponível: o processo limita apenas as próprias falhas
+            print(f"LOGIN TRACKER ERROR: {e}")
+            return cached_block
+        weight = (window - (now - (now // window) * window)) / window
+        should_block = previous * weight + current >= self.max_attempts
+
+        if should_block:
+            with self._lock:
+                self._buffers.pop(key, None)
+            store.set(f'login_block:{key}', now + self.block_seconds, ttl=self.block_seconds)
+            # Depois do bloqueio a contagem recomeça do zero
+            store.delete(current_key)
+            store.delete(previous_key)
+        return should_block
+
+    def _cache_failure(self, key, now):
+        """Registra a falha no cache local; retorna True se ela completou max_attempts falhas na janela."""
+        size = self.max_attempts
+        with self._lock:
+            ring = self._buffers.get(key)
+            if ring is None:
+                ring = self._buffers[key] = array('d', bytes(8 * (size + 1)))
+            else:
+                self._buffers.move_to_end(key)
+            position = int(ring[0])
+            ring[position + 1] = now
+            position = (position + 1) % size
+            ring[0] = position
+            # Após a escrita, a posição atual aponta para a falha mais antiga do buffer
+            oldest = ring[position + 1]
+            should_block = oldest > 0 and now - oldest < self.window_seconds
+            if should_block:
+                del self._buffers[key]
+            self._evict_stale(now)
+        return should_block
+
+    def record_success(self, key, now=None):
+        """Limpa as falhas registradas para a chave."""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            self._buffers.pop(key, None)
+        store = self._store()
+        for window_key in self._window_keys(key, now):
+            store.delete(window_key)
+
+    def _evict_stale(self, now, limit=2):
+        """Remove até `limit` chaves do início cuja última falha já saiu da janela."""
+        size = self.max_attempts
+        for _ in range(limit):
+            if not self._buffers:
+                return
+            key = next(iter(self._buffers))
+            ring = self._buffers[key]
+            newest = ring[(int(ring[0]) - 1) % size + 1]
+            if now - newest < self.window_seconds:
+                return
+            del self._buffers[key]
+
+    def queue_attempt(self, ip_address, username, success, now=None):
+        """Enfileira a tentativa para ser gravada em LoginAttempt no próximo lote (apenas com a gravação iniciada)."""
+        if self._persister is None:
+            return
+        attempt = {
+            'ip_address': ip_address,
+            'username': username,
+            'success': success,
+            'timestamp': datetime.utcfromtimestamp(now if now is not None else time.time()),
+        }
+        with self._pending_lock:
+            self._pending.append(attempt)
+            self._trim_pending()
+
+    def _trim_pending(self):
+        # Chamado com _pending_lock: descarta as tentativas mais antigas acima de max_pending
+        excess = len(self._pending) - self.max_pending
+        if excess > 0:
+            del self._pending[:excess]
+            self.dropped_attempts += excess
+
+    def persist_pending(self, app):
+        """
+        Grava as tentativas pendentes em LoginAttempt com um único INSERT em lote.
+
+        Returns:
+            int: Número de tentativas gravadas
+        """
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        with app.app_context():
+            try:
+                db.session.execute(LoginAttempt.__table__.insert(), pending)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Devolver as tentativas para a próxima rodada
+                with self._pending_lock:
+                    self._pending[:0] = pending
+                    self._trim_pending()
+                raise
+        return len(pending)
+
+    def start_persistence(self, app, interval=5.0):
+        """Inicia uma thread daemon que grava as tentativas pendentes a cada `interval` segundos."""
+        if self._persister is not None:
+            return self
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.persist_pending(app)
+                except Exception as e:
+                    print(f"LOGIN ATTEMPT PERSISTENCE ERROR: {e}")
+
+        self._persister = threading.Thread(target=run, name='login-attempt-persister', daemon=True)
+        self._persister.start()
+        return self
+
+    def __len__(self):
+        return len(self._buffers)
+
+# Rastreador compartilhado pelo processo
+login_tracker = LoginAttemptTracker()
@@ -12,6 +12,15 @@ from routes.ad_status import ad_status_bp
 from routes.level import level_bp
 from routes.scenario import scenario_bp
 from routes.admin import admin_bp
+from utils.revocation import revocation_index
+from utils.security_events import init_event_sink
+from utils.login_tracker import login_tracker
+from utils.fraud_detection import init_fraud_analysis, fraud_alerts
+from utils.fraud_snapshot import init_fraud_snapshots
+from utils.fraud_graph import init_fraud_graph
+from utils.ad_frequency import init_ad_frequency
+from utils.ad_display_writer import init_ad_display_writer
+from utils.migrations import ensure_indexes
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'dooficoin-frontend', 'dist'), static_url_path='/')
 
@@ -30,6 +39,8 @@ app.register_blueprint(scenario_bp, url_prefix="/api/scenarios")
 app.register_blueprint(admin_bp, url_prefix="/api/admin")
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['FRAUD_SNAPSHOT_DIR'] = os.path.join(os.path.dirname(__file__), 'database', 'fraud_state')
+app.config['AD_DISPLAY_JOURNAL_DIR'] = os.path.join(os.path.dirname(__file__), 'database', 'ad_display_journal')
 db.init_app(app)
 
 # Importar todos os modelos para garantir que sejam registrados
@@ -44,6 +55,27 @@ from models.scenario import Scenario, Monster, ScenarioReward, PlayerScenarioPro
 
 with app.app_context():
     db.create_all()
+    # Índices adicionados depois da criação das tabelas
+    ensure_indexes()
+    # Gravar as exibições de anúncio em lote, recuperando o journal de uma execução anterior
+    init_ad_display_writer(app)
+    # Carregar os tokens revogados ainda válidos para o índice em memória
+    revocation_index.refresh()
+    # Reconstruir os vínculos entre jogadores, IPs e sessões das exibições recentes, e renová-los periodicamente
+    init_fraud_graph(app)
+
+# Gravar eventos de segurança em lote, fora do caminho das requisições
+init_event_sink(app)
+# Gravar as tentativas de login em LoginAttempt em lotes
+login_tracker.start_persistence(app)
+# Gravar os alertas de fraude em FraudAlert em lotes
+fraud_alerts.start_persistence(app)
+# Restaurar o estado do detector de fraudes do último snapshot e do log de ações
+init_fraud_snapshots(app)
+# Analisar as ações dos jogadores em workers, fora da thread da requisição
+init_fraud_analysis(app)
+# Reconstruir as contagens de exibições por IP, sessão e jogador dos limites de anúncios
+init_ad_frequency(app)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -0,0 +1,52 @@
+from sqlalchemy import Index
+from models.user import db
+from models.security_log import FraudAlert
+from models.adsense import AdDisplay
+
+# Índices criados fora do modelo, em bancos já existentes: (modelo, nome, colunas)
+INDEXES = [
+    (FraudAlert, 'ix_fraud_alert_reviewed_timestamp', ('reviewed', 'timestamp')),
+    (FraudAlert, 'ix_fraud_alert_player_id', ('player_id',)),
+    # Verificação de intervalo entre anúncios (AdManager._recent_display_stats): a
+    # consulta filtra chave, unidade e período, então cada busca lê só as exibições da unidade
+    (AdDisplay, 'ix_ad_display_session_unit_displayed_at', ('session_id', 'ad_unit_id', 'displayed_at')),
+    (AdDisplay, 'ix_ad_display_ip_unit_displayed_at', ('ip_address', 'ad_unit_id', 'displayed_at')),
+    (AdDisplay, 'ix_ad_display_player_unit_displayed_at', ('player_id', 'ad_unit_id', 'displayed_at')),
+    # Relatórios por período e reconstrução do grafo de fraudes
+    (AdDisplay, 'ix_ad_display_displayed_at', ('displayed_at',)),
+]
+
+# Índices substituídos por outros de INDEXES, removidos de bancos existentes: (modelo, nome, colunas)
+OBSOLETE_INDEXES = [
+    (AdDisplay, 'ix_ad_display_session_displayed_at', ('session_id', 'displayed_at')),
+    (AdDisplay, 'ix_ad_display_ip_displayed_at', ('ip_address', 'displayed_at')),
+    (AdDisplay, 'ix_ad_display_player_displayed_at', ('player_id', 'displayed_at')),
+]
+
+def ensure_indexes(bind=None):
+    """
+    Cria os índices de INDEXES que ainda não existem e remove os de OBSOLETE_INDEXES.
+
+    db.create_all() não altera tabelas que já existem, então os índices
+    adicionados depois da criação do banco são aplicados aqui. A operação é
+    idempotente e deve ser chamada dentro do contexto da aplicação.
+
+    Returns:
+        list: Nomes dos índices verificados
+    """
+    bind = bind or db.engine
+    names = []
+    for model, name, columns in INDEXES:
+        table = model.__table__
+        index = next((existing for existing in table.indexes if existing.name == name), None)
+        if index is None:
+            index = Index(name, *(table.c[column] for column in columns))
+        index.create(bind, checkfirst=True)
+        names.append(name)
+    for model, name, columns in OBSOLETE_INDEXES:
+        table = model.__table__
+        index = Index(name, *(table.c[column] for column in columns))
+        # Index() se registra na tabela; o índice obsoleto não deve voltar com create_all
+        table.indexes.discard(index)
+        index.drop(bind, checkfirst=True)
+    return names
@@ -0,0 +1,127 @@
+import time
+from utils.security_store import get_store
+
+class SlidingWindowCounter:
+    """
+    Limitador por janela deslizante aproximada.
+
+    Para cada chave mantém apenas dois contadores: o da janela fixa atual e o
+    da janela anterior. A contagem na janela deslizante é estimada ponderando
+    a janela anterior pela fração que ainda se sobrepõe ao intervalo, então
+    cada requisição custa O(1), independentemente de max_requests, e uma
+    única operação no backend (incr_window).
+    """
+
+    def __init__(self, max_requests, window_seconds, store=None):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.store = store
+
+    def hit(self, key, now=None):
+        """
+        Registra uma requisição para a chave e verifica o limite.
+
+        Requisições recusadas também são contadas, o que mantém o cliente
+        bloqueado enquanto ele continuar insistindo.
+
+        Args:
+            key: Chave limitada (ex: IP do cliente)
+            now: Timestamp atual (opcional, usado em testes e benchmarks)
+
+        Returns:
+            tuple: (permitido, segundos até a próxima requisição ser aceita)
+        """
+        if now is None:
+            now = time.time()
+        store = self.store or get_store()
+        window = self.window_seconds
+        window_index = int(now // window)
+        elapsed = now - window_index * window
+
+        previous, current = store.incr_window(
+            f'rl:{key}:{window_index}', f'rl:{key}:{window_index - 1}', ttl=2 * window
+        )
+
+        weight = (window - elapsed) / window
+        if previous * weight + current > self.max_requests:
+            return False, self._retry_after(previous, current - 1, elapsed)
+        return True, 0
+
+    def _retry_after(self, previous, current, elapsed):
+        """Calcula quanto tempo falta para a estimativa ficar abaixo do limite."""
+        window = self.window_seconds
+        if current >= self.max_requests or previous == 0:
+            return window - elapsed
+        # previous * (window - t) / window + current < max_requests
+        release_at = window * (1 - (self.max_requests - current) / previous)
+        return max(0.0, release_at - elapsed)
+
+class TokenBucket:
+    """
+    Limitador por balde de fichas.
+
+    O balde comporta max_requests fichas e é reabastecido continuamente à taxa
+    de max_requests / window_seconds fichas por segundo. Cada chave guarda
+    apenas 'fichas:timestamp' e é atualizada com uma operação atômica do
+    backend (update).
+    """
+
+    def __init__(self, max_requests, window_seconds, store=None):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.refill_rate = max_requests / window_seconds
+        self.store = store
+
+    def hit(self, key, now=None):
+        """
+        Consome uma ficha da chave, se houver alguma disponível.
+
+        Args:
+            key: Chave limitada (ex: IP do cliente)
+            now: Timestamp atual (opcional, usado em testes e benchmarks)
+
+        Returns:
+            tuple: (permitido, segundos até a próxima requisição ser aceita)
+        """
+        if now is None:
+            now = time.time()
+        store = self.store or get_store()
+
+        def consume(value):
+            if value is None:
+                tokens = self.max_requests
+            else:
+                tokens, last = (float(part) for part in value.split(':'))
+                tokens = min(self.max_requests, tokens + max(0.0, now - last) * self.refill_rate)
+
+            if tokens < 1:
+                return f'{tokens}:{now}', (False, (1 - tokens) / self.refill_rate)
+            return f'{tokens - 1}:{now}', (True, 0)
+
+        # Um balde parado por uma janela inteira está cheio de novo, então pode expirar
+        return store.update(f'tb:{key}', consume, ttl=self.window_seconds)
+
+# Algoritmos disponíveis para o decorator rate_limit
+LIMITERS = {
+    'sliding_window': SlidingWindowCounter,
+    'token_bucket': TokenBucket,
+}
+
+def create_limiter(algorithm, max_requests, window_seconds, store=None):
+    """
+    Cria um limitador a partir do nome do algoritmo.
+
+    Args:
+        algorithm: Nome do algoritmo ('sliding_window' ou 'token_bucket')
+        max_requests: Número máximo de requisições por janela
+        window_seconds: Duração da janela em segundos
+        store: Backend de estado (opcional; padrão: get_store())
+
+    Returns:
+        Limitador com o método hit(key, now=None)
+    """
+    try:
+        limiter_class = LIMITERS[algorithm]
+    except KeyError:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+    return limiter_class(max_requests, window_seconds, store)
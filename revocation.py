@@ -0,0 +1,133 @@
+import time
+import heapq
+import hashlib
+import threading
+from datetime import datetime
+from sqlalchemy import or_
+from models.user import db
+from models.auth import RevokedToken
+
+class RevocationIndex:
+    """
+    Índice em memória dos tokens JWT revogados.
+
+    Guarda apenas os 8 primeiros bytes do SHA-256 do jti (como inteiro) e a
+    expiração original do token, então verify_token consulta a revogação sem
+    ir ao banco. Entradas cujo token já expirou são descartadas, já que o
+    próprio JWT deixaria de ser aceito.
+
+    Novas revogações feitas por outros workers são lidas de forma incremental
+    (apenas linhas com id maior que a última vista) no máximo a cada
+    refresh_interval segundos.
+    """
+
+    def __init__(self, refresh_interval=30):
+        self.refresh_interval = refresh_interval
+        self._entries = {}
+        self._expiry_heap = []
+        self._last_id = 0
+        self._last_refresh = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(jti):
+        return int.from_bytes(hashlib.sha256(jti.encode()).digest()[:8], 'big')
+
+    @staticmethod
+    def _timestamp(value):
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return (value - datetime(1970, 1, 1)).total_seconds()
+        return float(value)
+
+    def add(self, jti, expires_at=None):
+        """
+        Marca um jti como revogado.
+
+        Args:
+            jti: Identificador do token
+            expires_at: Expiração original do token (datetime UTC ou timestamp);
+                        sem ela a entrada nunca é podada
+        """
+        key = self._key(jti)
+        expires_at = self._timestamp(expires_at)
+        with self._lock:
+            self._entries[key] = expires_at
+            if expires_at is not None:
+                heapq.heappush(self._expiry_heap, (expires_at, key))
+
+    def is_revoked(self, jti):
+        """Verifica se o jti foi revogado."""
+        if time.time() - self._last_refresh > self.refresh_interval:
+            try:
+                self.refresh()
+            except Exception:
+                # Banco indisponível: seguir com o índice atual até o próximo intervalo
+                pass
+        return self._key(jti) in self._entries
+
+    def prune(self, now=None):
+        """
+        Remove entradas de tokens que já expiraram.
+
+        Returns:
+            int: Número de entradas removidas
+        """
+        if now is None:
+            now = time.time()
+        removed = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                expires_at, key = heapq.heappop(self._expiry_heap)
+                # A entrada pode ter sido regravada com outra expiração
+                if self._entries.get(key) == expires_at:
+                    del self._entries[key]
+                    removed += 1
+        return removed
+
+    def refresh(self):
+        """
+        Carrega revogações novas do banco e poda as entradas expiradas.
+
+        Na primeira chamada carrega todos os tokens revogados ainda válidos;
+        linhas de tokens já expirados são filtradas pelo banco. Precisa de um
+        contexto de aplicação ativo.
+        """
+        self._last_refresh = time.time()
+        rows = RevokedToken.query.filter(
+            RevokedToken.id > self._last_id,
+            or_(RevokedToken.expires_at.is_(None), RevokedToken.expires_at > datetime.utcnow())
+        ).order_by(RevokedToken.id).all()
+        for row in rows:
+            self.add(row.jti, row.expires_at)
+            self._last_id = row.id
+        self.prune()
+
+    def __len__(self):
+        return len(self._entries)
+
+# Índice compartilhado pelo processo
+revocation_index = RevocationIndex()
+
+def revoke_token(payload):
+    """
+    Revoga um token a partir do seu payload decodificado.
+
+    Grava o RevokedToken no banco e atualiza o índice local imediatamente;
+    os demais workers recebem a revogação no próximo refresh.
+
+    Args:
+        payload: Payload do token (precisa conter 'jti')
+
+    Returns:
+        bool: True se o token foi revogado, False se não tiver jti
+    """
+    jti = payload.get('jti')
+    if not jti:
+        return False
+    expires_at = datetime.utcfromtimestamp(payload['exp']) if payload.get('exp') else None
+    db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+    db.session.commit()
+    revocation_index.add(jti, expires_at)
+    return True
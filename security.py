@@ -1,243 +1,298 @@
-import re
 import time
+import threading
 import hashlib
-import ipaddress
+import uuid
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify, current_app
-
-# Dicionário para armazenar tentativas de login por IP
-login_attempts = {}
-# Dicionário para armazenar IPs bloqueados
-blocked_ips = {}
-# Dicionário para armazenar contagem de requisições por IP (para rate limiting)
-request_counts = {}
-
-def is_valid_email(email):
-    """Valida se o email está em um formato correto."""
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
-
-def is_valid_username(username):
-    """Valida se o nome de usuário contém apenas caracteres permitidos."""
-    pattern = r'^[a-zA-Z0-9_-]{3,20}$'
-    return bool(re.match(pattern, username))
-
-def is_valid_password(password):
-    """
-    Valida se a senha atende aos requisitos mínimos de segurança:
-    - Pelo menos 8 caracteres
-    - Pelo menos uma letra maiúscula
-    - Pelo menos uma letra minúscula
-    - Pelo menos um número
-    - Pelo menos um caractere especial
-    """
-    if len(password) < 8:
-        return False
-    if not re.search(r'[A-Z]', password):
-        return False
-    if not re.search(r'[a-z]', password):
-        return False
-    if not re.search(r'[0-9]', password):
-        return False
-    if not re.search(r'[!@#$%^&*(),.?":{}|<>]', password):
-        return False
-    return True
+from collections import OrderedDict
+from flask import request, jsonify, current_app, g, has_request_context
+from utils.rate_limiter import create_limiter
+from utils.security_store import get_store
+from utils.login_tracker import login_tracker
+from utils.revocation import revocation_index, revoke_token
+from utils.ip_blacklist import get_blacklist
+from utils.security_events import get_event_sink, event_sampler
+# Validadores reexportados para manter os imports existentes de utils.security
+from utils.validation import is_valid_email, is_valid_username, is_valid_password, sanitize_input
 
-def sanitize_input(input_str):
-    """Sanitiza a entrada do usuário para prevenir injeções."""
-    if input_str is None:
-        return None
-    # Remove caracteres potencialmente perigosos
-    sanitized = re.sub(r'[<>\'";]', '', input_str)
-    return sanitized
+# Tentativas de login, IPs bloqueados e contadores de rate limiting ficam no
+# backend retornado por get_store(), compartilhado entre os workers quando
+# SECURITY_STORE_URL aponta para SQLite ou Redis. Prefixos das chaves:
+#   login_fail:ip:<ip>:<janela> / login_fail:user:<nome>:<janela>
+#                     falhas de login na janela (ver utils.login_tracker)
+#   login_block:ip:<ip> / login_block:user:<nome>
+#                     timestamp até o qual o login está bloqueado (ver utils.login_tracker)
+#   blocked:<ip>      timestamp até o qual o IP está bloqueado pelo rate limiting
+#   rl:/tb:           estado dos limitadores (ver utils.rate_limiter)
+
+# Cache LRU de tokens já verificados: SHA-256 do token -> payload decodificado
+TOKEN_CACHE_SIZE = 10000
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
 
 def generate_token(user_id, is_admin=False, expiration_hours=24):
     """Gera um token JWT para autenticação."""
     payload = {
         'user_id': user_id,
         'is_admin': is_admin,
-        'exp': datetime.utcnow() + timedelta(hours=expiration_hours)
+        'exp': datetime.utcnow() + timedelta(hours=expiration_hours),
+        'jti': uuid.uuid4().hex
     }
     return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
 
 def verify_token(token):
-    """Verifica se um token JWT é válido."""
+    """
+    Verifica se um token JWT é válido.
+
+    Tokens já verificados ficam em um cache LRU indexado pelo SHA-256 do
+    token, então requisições repetidas com o mesmo token não refazem a
+    verificação HS256. A expiração ('exp') continua sendo respeitada e a
+    revogação é consultada no índice em memória a cada chamada.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    
+    with _token_cache_lock:
+        payload = _token_cache.get(digest)
+        if payload is not None:
+            exp = payload.get('exp')
+            if exp is None or now < exp:
+                _token_cache.move_to_end(digest)
+            else:
+                del _token_cache[digest]
+                return None
+    
+    if payload is not None:
+        return None if _is_revoked(payload) else payload
+    
     try:
         payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    
+    if _is_revoked(payload):
+        return None
+    
+    with _token_cache_lock:
+        _token_cache[digest] = payload
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    
+    return payload
 
-def token_required(f):
-    """Decorator para rotas que requerem autenticação por token."""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Verificar se o token está no header Authorization
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        payload = verify_token(token)
-        if not payload:
-            return jsonify({'error': 'Token is invalid or expired'}), 401
-        
-        # Adicionar o payload do token ao request para uso na função decorada
-        request.token_payload = payload
+def _is_revoked(payload):
+    """Consulta o índice de revogação pelo jti do token, sem acessar o banco."""
+    jti = payload.get('jti')
+    return bool(jti) and revocation_index.is_revoked(jti)
+
+def revoke_current_token():
+    """
+    Revoga o token da requisição atual (logout).
+
+    Deve ser chamada em uma rota com auth_required. A revogação vale
+    imediatamente neste processo e nos demais workers no próximo refresh do
+    índice de utils.revocation.
+
+    Returns:
+        bool: True se o token foi revogado, False se ele não tiver jti
+    """
+    payload = g.token_payload
+    if not revoke_token(payload):
+        return False
+    log_security_event('token_revoked', f"Token revoked by its owner (user {payload.get('user_id')})", 'info',
+                       user_id=payload.get('user_id'))
+    return True
+
+def clear_token_cache():
+    """Esvazia o cache de tokens verificados (ex: após trocar a SECRET_KEY)."""
+    with _token_cache_lock:
+        _token_cache.clear()
+
+def _authenticate():
+    """
+    Autentica a requisição atual uma única vez.
+
+    O payload fica em flask.g, então decorators empilhados não decodificam o
+    mesmo token de novo.
+
+    Returns:
+        tuple: (payload, None) em caso de sucesso ou (None, resposta de erro)
+    """
+    payload = g.get('token_payload')
+    if payload is not None:
+        return payload, None
+    
+    token = None
+    
+    # Verificar se o token está no header Authorization
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+    
+    if not token:
+        return None, (jsonify({'error': 'Token is missing'}), 401)
+    
+    payload = verify_token(token)
+    if not payload:
+        return None, (jsonify({'error': 'Token is invalid or expired'}), 401)
+    
+    # Adicionar o payload do token ao request para uso na função decorada
+    g.token_payload = payload
+    request.token_payload = payload
+    
+    return payload, None
+
+def auth_required(admin=False):
+    """
+    Decorator para rotas que requerem autenticação por token.
+
+    Com admin=True também exige privilégios de administrador. O token é
+    decodificado uma vez por requisição e o payload fica em g.token_payload
+    (e em request.token_payload, por compatibilidade).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            payload, error = _authenticate()
+            if error:
+                return error
+            
+            # Verificar se o usuário é um administrador
+            if admin and not payload.get('is_admin', False):
+                return jsonify({'error': 'Admin privileges required'}), 403
+            
+            return f(*args, **kwargs)
         
-        return f(*args, **kwargs)
+        return decorated
     
-    return decorated
+    return decorator
+
+def token_required(f):
+    """Decorator para rotas que requerem autenticação por token."""
+    return auth_required()(f)
 
 def admin_required(f):
     """Decorator para rotas que requerem privilégios de administrador."""
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        
-        # Verificar se o token está no header Authorization
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header.startswith('Bearer '):
-                token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
-        
-        payload = verify_token(token)
-        if not payload:
-            return jsonify({'error': 'Token is invalid or expired'}), 401
-        
-        # Verificar se o usuário é um administrador
-        if not payload.get('is_admin', False):
-            return jsonify({'error': 'Admin privileges required'}), 403
-        
-        # Adicionar o payload do token ao request para uso na função decorada
-        request.token_payload = payload
-        
-        return f(*args, **kwargs)
-    
-    return decorated
+    return auth_required(admin=True)(f)
 
-def rate_limit(max_requests=10, window_seconds=60):
+def rate_limit(max_requests=10, window_seconds=60, algorithm='sliding_window', per_route=False):
     """
     Decorator para limitar o número de requisições por IP em um período de tempo.
     Por padrão, limita a 10 requisições por minuto.
+
+    O algoritmo pode ser 'sliding_window' (janela deslizante aproximada) ou
+    'token_bucket' (balde de fichas). Ambos mantêm estado de tamanho constante
+    por IP e custam O(1) por requisição.
+
+    Por padrão a contagem do IP é compartilhada por todas as rotas
+    decoradas. Com per_route=True cada rota ganha uma janela própria.
     """
+    limiter = create_limiter(algorithm, max_requests, window_seconds)
+
     def decorator(f):
+        # Janela única por IP, ou uma janela por rota se per_route=True
+        scope = f'{f.__module__}.{f.__name__}' if per_route else 'ip'
+
         @wraps(f)
         def decorated(*args, **kwargs):
             # Obter o IP do cliente
             client_ip = request.remote_addr
             
-            # Verificar se o IP está bloqueado
-            if client_ip in blocked_ips:
-                block_until = blocked_ips[client_ip]
-                if time.time() < block_until:
-                    return jsonify({'error': 'Too many requests. Try again later.'}), 429
-                else:
-                    # Remover o IP da lista de bloqueados se o tempo expirou
-                    del blocked_ips[client_ip]
+            store = get_store()
             
-            # Inicializar contagem para este IP se não existir
-            if client_ip not in request_counts:
-                request_counts[client_ip] = []
-            
-            # Remover timestamps antigos
-            current_time = time.time()
-            request_counts[client_ip] = [t for t in request_counts[client_ip] if current_time - t < window_seconds]
+            # Verificar se o IP está bloqueado (a chave expira sozinha ao fim do bloqueio)
+            if store.get(f'blocked:{client_ip}') is not None:
+                return jsonify({'error': 'Too many requests. Try again later.'}), 429
             
             # Verificar se o limite foi atingido
-            if len(request_counts[client_ip]) >= max_requests:
+            allowed, _ = limiter.hit(f'{scope}:{client_ip}')
+            if not allowed:
                 # Bloquear o IP por 5 minutos
-                blocked_ips[client_ip] = current_time + 300  # 5 minutos em segundos
+                store.set(f'blocked:{client_ip}', time.time() + 300, ttl=300)  # 5 minutos em segundos
                 return jsonify({'error': 'Rate limit exceeded. Try again later.'}), 429
             
-            # Adicionar o timestamp atual
-            request_counts[client_ip].append(current_time)
-            
             return f(*args, **kwargs)
         
         return decorated
     
     return decorator
 
-def check_login_attempts(ip_address, success=False):
+def check_login_attempts(ip_address, success=False, username=None):
     """
-    Verifica e registra tentativas de login por IP.
-    Bloqueia o IP após 5 tentativas falhas em 15 minutos.
+    Verifica e registra tentativas de login por IP e por nome de usuário.
+    Bloqueia o IP (e o usuário, se informado) após 5 tentativas falhas em
+    15 minutos. Ver utils.login_tracker.
     """
     current_time = time.time()
+    keys = [f'ip:{ip_address}']
+    if username:
+        keys.append(f'user:{username}')
     
-    # Inicializar registro para este IP se não existir
-    if ip_address not in login_attempts:
-        login_attempts[ip_address] = {'attempts': [], 'blocked_until': None}
+    # Verificar se o IP ou o usuário está bloqueado
+    wait = max(login_tracker.blocked_for(key, current_time) for key in keys)
+    if wait:
+        return False, wait
     
-    # Verificar se o IP está bloqueado
-    if login_attempts[ip_address]['blocked_until'] and current_time < login_attempts[ip_address]['blocked_until']:
-        return False, login_attempts[ip_address]['blocked_until'] - current_time
-    
-    # Limpar o bloqueio se expirou
-    if login_attempts[ip_address]['blocked_until'] and current_time >= login_attempts[ip_address]['blocked_until']:
-        login_attempts[ip_address]['blocked_until'] = None
+    login_tracker.queue_attempt(ip_address, username, success, current_time)
     
     # Se o login foi bem-sucedido, limpar as tentativas
     if success:
-        login_attempts[ip_address]['attempts'] = []
+        for key in keys:
+            login_tracker.record_success(key, current_time)
         return True, 0
     
-    # Remover tentativas antigas (mais de 15 minutos)
-    login_attempts[ip_address]['attempts'] = [t for t in login_attempts[ip_address]['attempts'] if current_time - t < 900]
-    
-    # Adicionar nova tentativa
-    login_attempts[ip_address]['attempts'].append(current_time)
-    
-    # Verificar se atingiu o limite de tentativas
-    if len(login_attempts[ip_address]['attempts']) >= 5:
-        # Bloquear por 30 minutos
-        block_time = 1800  # 30 minutos em segundos
-        login_attempts[ip_address]['blocked_until'] = current_time + block_time
-        login_attempts[ip_address]['attempts'] = []
-        return False, block_time
+    # Registrar a falha e verificar se atingiu o limite de tentativas
+    blocked = [login_tracker.record_failure(key, current_time) for key in keys]
+    if any(blocked):
+        return False, login_tracker.block_seconds
     
     return True, 0
 
 def is_ip_in_blacklist(ip_address):
-    """Verifica se um IP está em uma lista negra (simulada)."""
-    # Lista de IPs conhecidos por atividades maliciosas (simulada)
-    blacklist = [
-        '1.2.3.4',
-        '5.6.7.8',
-        # Adicionar mais IPs conforme necessário
-    ]
-    
-    return ip_address in blacklist
+    """
+    Verifica se um IP está na lista negra.
 
-def log_security_event(event_type, details, severity='info'):
+    A lista aceita IPs e redes CIDR (IPv4 e IPv6) e é consultada em uma trie
+    de prefixos (ver utils.ip_blacklist).
+    """
+    return get_blacklist().contains(ip_address)
+
+def log_security_event(event_type, details, severity='info', user_id=None):
     """
     Registra eventos de segurança para análise posterior.
     Severidade pode ser: 'info', 'warning', 'error', 'critical'
+
+    Quando init_event_sink foi chamado, o evento apenas entra na fila do
+    destino assíncrono (ver utils.security_events) e a requisição não espera
+    a escrita. Sem destino configurado, o evento é impresso como antes.
+    Eventos suprimidos pela amostragem (ver configure_event_sampling) só
+    entram nas contagens agregadas.
     """
-    # Em um ambiente de produção, isso seria salvo em um banco de dados ou sistema de log
+    sampled = event_sampler.should_log(event_type, severity)
+    
     event = {
         'timestamp': datetime.utcnow().isoformat(),
         'event_type': event_type,
         'details': details,
         'severity': severity,
-        'ip_address': request.remote_addr if request else 'unknown'
+        'ip_address': request.remote_addr if has_request_context() else 'unknown',
+        'user_id': user_id
     }
     
-    # Por enquanto, apenas imprimimos o evento
-    print(f"SECURITY EVENT: {event}")
+    sink = get_event_sink()
+    if sink is not None:
+        # A thread de escrita do destino grava os registros agregados da amostragem
+        if sampled:
+            sink.emit(event)
+    else:
+        if sampled:
+            print(f"SECURITY EVENT: {event}")
+        rollup = event_sampler.take_rollup()
+        if rollup is not None:
+            print(f"SECURITY EVENT: {rollup}")
     
     # Em um ambiente real, você poderia enviar alertas para eventos críticos
     if severity == 'critical':
@@ -245,4 +300,3 @@ def log_security_event(event_type, details, severity='info'):
         pass
     
     return event
-
@@ -0,0 +1,351 @@
+import json
+import time
+import atexit
+import random
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from models.user import db
+from models.security_log import SecurityLog
+
+# Ordem de prioridade: eventos de menor nível são descartados primeiro
+SEVERITY_LEVELS = {'info': 0, 'warning': 1, 'error': 2, 'critical': 3}
+
+class SecurityEventSink:
+    """
+    Fila limitada e thread de escrita para eventos de segurança.
+
+    log_security_event apenas enfileira o evento; a thread de escrita grava
+    os eventos em lote na tabela SecurityLog e/ou em um arquivo JSON lines
+    rotativo. Com a fila cheia, um evento novo descarta o evento mais antigo
+    de nível inferior (info primeiro, depois warning, depois error). Sem
+    nenhum evento inferior para descartar, o novo evento é descartado, exceto
+    eventos 'critical', que são sempre aceitos mesmo acima da capacidade.
+
+    Se o banco falhar, os eventos 'error' e 'critical' do lote voltam para
+    uma fila de nova tentativa (limitada a max_queue, exceto os 'critical')
+    e são gravados de novo apenas no banco; os demais são contados como
+    descartados, um a um.
+    """
+
+    def __init__(self, app=None, log_path=None, write_db=True, max_queue=10000,
+                 batch_size=500, flush_interval=1.0, max_bytes=50 * 1024 * 1024, backup_count=5):
+        self.app = app
+        self.write_db = write_db and app is not None
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queues = {severity: deque() for severity in SEVERITY_LEVELS}
+        self._size = 0
+        # Eventos já gravados no arquivo que aguardam nova tentativa no banco
+        self._retry = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._in_flight = 0
+        self.enqueued = 0
+        self.written = 0
+        self.write_errors = 0
+        self.retried = 0
+        self.dropped = {severity: 0 for severity in SEVERITY_LEVELS}
+
+        self._file_logger = None
+        if log_path:
+            handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backup_count)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._file_logger = logging.getLogger(f'security_events.{id(self)}')
+            self._file_logger.propagate = False
+            self._file_logger.setLevel(logging.INFO)
+            self._file_logger.addHandler(handler)
+
+        self._writer = threading.Thread(target=self._run, name='security-event-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def emit(self, event):
+        """
+        Enfileira um evento sem bloquear.
+
+        Returns:
+            bool: True se o evento foi aceito, False se foi descartado
+        """
+        severity = event['severity'] if event['severity'] in SEVERITY_LEVELS else 'info'
+        level = SEVERITY_LEVELS[severity]
+        with self._condition:
+            if self._size >= self.max_queue and not self._make_room(level):
+                if severity != 'critical':
+                    self.dropped[severity] += 1
+                    return False
+            self._queues[severity].append(event)
+            self._size += 1
+            self.enqueued += 1
+            if self._size >= self.batch_size:
+                self._condition.notify()
+        return True
+
+    def _make_room(self, level):
+        """Descarta o evento mais antigo de nível inferior a `level`, se houver."""
+        for severity, severity_level in SEVERITY_LEVELS.items():
+            if severity_level >= level:
+                return False
+            if self._queues[severity]:
+                self._queues[severity].popleft()
+                self._size -= 1
+                self.dropped[severity] += 1
+                return True
+        return False
+
+    def _take_batch(self):
+        batch = []
+        # Eventos mais graves saem primeiro
+        for severity in reversed(list(SEVERITY_LEVELS)):
+            queue = self._queues[severity]
+            while queue and len(batch) < self.batch_size:
+                batch.append(queue.popleft())
+        self._size -= len(batch)
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._size < self.batch_size and not self._closed:
+                    self._condition.wait(self.flush_interval)
+                batch = self._take_batch()
+                drained = self._closed and not batch
+                retry = [self._retry.popleft() for _ in range(min(len(self._retry), self.batch_size))]
+                self._in_flight = len(batch)
+            # Contagens suprimidas pela amostragem viram um registro agregado
+            rollup = event_sampler.take_rollup(force=drained)
+            if rollup is not None:
+                batch.append(rollup)
+            if batch or retry:
+                self._write(batch, retry, final=drained)
+            with self._condition:
+                self._in_flight = 0
+                self._condition.notify_all()
+            if drained:
+                return
+
+    def _write(self, batch, retry=(), final=False):
+        """
+        Grava o lote no arquivo e no banco; `retry` são eventos que só faltam no banco.
+
+        Com final=True (encerramento) os eventos que falharem não voltam para a fila.
+        """
+        if self._file_logger is not None:
+            for event in batch:
+                self._file_logger.info(json.dumps(event, default=str))
+        batch = list(retry) + batch
+        if self.write_db:
+            try:
+                with self.app.app_context():
+                    db.session.execute(SecurityLog.__table__.insert(), [
+                        {
+                            'log_type': event['event_type'],
+                            'details': event['details'] if isinstance(event['details'], str) else json.dumps(event['details'], default=str),
+                            'severity': event['severity'],
+                            'ip_address': event['ip_address'],
+                            'user_id': event.get('user_id'),
+                            'timestamp': datetime.fromisoformat(event['timestamp']),
+                        }
+                        for event in batch
+                    ])
+                    db.session.commit()
+            except Exception as e:
+                self.write_errors += 1
+                print(f"SECURITY EVENT SINK ERROR: {e}")
+                self._requeue(batch, final)
+                return
+        self.written += len(batch)
+
+    def _requeue(self, events, final):
+        """Devolve os eventos 'error' e 'critical' para nova tentativa e conta os demais como descartados."""
+        with self._condition:
+            for event in events:
+                severity = event['severity'] if event['severity'] in SEVERITY_LEVELS else 'info'
+                keep = (not final and SEVERITY_LEVELS[severity] >= SEVERITY_LEVELS['error']
+                        and (severity == 'critical' or len(self._retry) < self.max_queue))
+                if keep:
+                    self._retry.append(event)
+                    self.retried += 1
+                else:
+                    self.dropped[severity] += 1
+
+    def flush(self, timeout=5.0):
+        """Espera a fila esvaziar (ex: antes de encerrar o worker)."""
+        with self._condition:
+            self._condition.notify()
+            self._condition.wait_for(lambda: self._size == 0 and self._in_flight == 0, timeout)
+
+    def close(self, timeout=5.0):
+        """Grava os eventos pendentes e encerra a thread de escrita."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._writer.join(timeout)
+
+    def stats(self):
+        """
+        Retorna métricas da fila.
+
+        Returns:
+            dict: Profundidade total e por severidade, eventos aguardando
+                  nova tentativa no banco, eventos aceitos, gravados,
+                  devolvidos para nova tentativa, descartados por severidade
+                  e erros de escrita
+        """
+        with self._condition:
+            return {
+                'queue_depth': self._size,
+                'queue_depth_by_severity': {s: len(q) for s, q in self._queues.items()},
+                'retry_depth': len(self._retry),
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'retried': self.retried,
+                'dropped': dict(self.dropped),
+                'write_errors': self.write_errors,
+            }
+
+class EventSampler:
+    """
+    Amostragem e filtro por severidade dos eventos de segurança.
+
+    Eventos abaixo de min_severity ou fora da amostra do seu tipo não são
+    gravados individualmente; eles são contados e, a cada rollup_interval
+    segundos, viram um único registro agregado ('security_events_suppressed')
+    com as contagens por tipo e severidade, então nada se perde por completo.
+    """
+
+    def __init__(self, sample_rates=None, min_severity='info', rollup_interval=60):
+        self._lock = threading.Lock()
+        self._suppressed = {}
+        self._window_start = time.time()
+        self.configure(sample_rates or {}, min_severity, rollup_interval)
+
+    def configure(self, sample_rates=None, min_severity=None, rollup_interval=None):
+        """
+        Altera a configuração em tempo de execução.
+
+        Args:
+            sample_rates: Mapeia tipo de evento -> fração gravada (0.0 a 1.0)
+            min_severity: Severidade mínima gravada individualmente
+            rollup_interval: Intervalo em segundos entre registros agregados
+
+        Valores inválidos geram ValueError sem alterar nada.
+        """
+        if sample_rates is not None:
+            if not isinstance(sample_rates, dict):
+                raise ValueError("sample_rates must map event types to rates")
+            for event_type, rate in sample_rates.items():
+                if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not 0.0 <= rate <= 1.0:
+                    raise ValueError(f"Invalid sample rate for {event_type}: {rate}")
+        if min_severity is not None and (not isinstance(min_severity, str) or min_severity not in SEVERITY_LEVELS):
+            raise ValueError(f"Invalid severity: {min_severity}")
+        if rollup_interval is not None and (isinstance(rollup_interval, bool)
+                                            or not isinstance(rollup_interval, (int, float)) or rollup_interval <= 0):
+            raise ValueError(f"Invalid rollup interval: {rollup_interval}")
+        with self._lock:
+            if sample_rates is not None:
+                self.sample_rates = dict(sample_rates)
+            if min_severity is not None:
+                self.min_severity = min_severity
+                self._min_level = SEVERITY_LEVELS[min_severity]
+            if rollup_interval is not None:
+                self.rollup_interval = rollup_interval
+
+    def get_config(self):
+        """Retorna a configuração atual."""
+        with self._lock:
+            return {
+                'sample_rates': dict(self.sample_rates),
+                'min_severity': self.min_severity,
+                'rollup_interval': self.rollup_interval,
+            }
+
+    def should_log(self, event_type, severity):
+        """
+        Decide se o evento deve ser gravado individualmente.
+
+        Eventos suprimidos são contados para o próximo registro agregado.
+        Eventos 'critical' nunca são suprimidos.
+        """
+        if severity == 'critical':
+            return True
+        if SEVERITY_LEVELS.get(severity, 0) >= self._min_level:
+            rate = self.sample_rates.get(event_type, 1.0)
+            if rate >= 1.0 or random.random() < rate:
+                return True
+        with self._lock:
+            key = (event_type, severity)
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+        return False
+
+    def take_rollup(self, force=False):
+        """
+        Retorna o registro agregado se o intervalo terminou (ou force=True).
+
+        Returns:
+            dict ou None: Evento com as contagens suprimidas na janela
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._window_start < self.rollup_interval:
+                return None
+            suppressed, self._suppressed = self._suppressed, {}
+            window_start, self._window_start = self._window_start, now
+        if not suppressed:
+            return None
+        counts = {}
+        for (event_type, severity), count in suppressed.items():
+            counts.setdefault(event_type, {})[severity] = count
+        return {
+            'timestamp': datetime.utcfromtimestamp(now).isoformat(),
+            'event_type': 'security_events_suppressed',
+            'details': {
+                'window_start': datetime.utcfromtimestamp(window_start).isoformat(),
+                'window_end': datetime.utcfromtimestamp(now).isoformat(),
+                'counts': counts,
+            },
+            'severity': 'info',
+            'ip_address': 'aggregate',
+            'user_id': None,
+        }
+
+# Amostragem padrão: tudo é gravado até que seja configurada
+event_sampler = EventSampler()
+
+def configure_event_sampling(sample_rates=None, min_severity=None, rollup_interval=None):
+    """Altera a amostragem dos eventos de segurança em tempo de execução."""
+    event_sampler.configure(sample_rates, min_severity, rollup_interval)
+    return event_sampler.get_config()
+
+_sink = None
+
+def init_event_sink(app):
+    """
+    Configura o destino assíncrono dos eventos de segurança.
+
+    Lê do app.config: SECURITY_LOG_TO_DB (padrão True), SECURITY_LOG_FILE
+    (opcional), SECURITY_LOG_QUEUE_SIZE, SECURITY_LOG_BATCH_SIZE e
+    SECURITY_LOG_FLUSH_SECONDS. A amostragem inicial vem de
+    SECURITY_LOG_SAMPLE_RATES e SECURITY_LOG_MIN_SEVERITY.
+    """
+    global _sink
+    configure_event_sampling(
+        sample_rates=app.config.get('SECURITY_LOG_SAMPLE_RATES'),
+        min_severity=app.config.get('SECURITY_LOG_MIN_SEVERITY'),
+    )
+    _sink = SecurityEventSink(
+        app=app,
+        log_path=app.config.get('SECURITY_LOG_FILE'),
+        write_db=app.config.get('SECURITY_LOG_TO_DB', True),
+        max_queue=app.config.get('SECURITY_LOG_QUEUE_SIZE', 10000),
+        batch_size=app.config.get('SECURITY_LOG_BATCH_SIZE', 500),
+        flush_interval=app.config.get('SECURITY_LOG_FLUSH_SECONDS', 1.0),
+    )
+    return _sink
+
+def get_event_sink():
+    """Retorna o destino configurado ou None se init_event_sink não foi chamado."""
+    return _sink
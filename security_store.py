@@ -0,0 +1,588 @@
+import os
+import time
+import socket
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+class MemoryBackend:
+    """
+    Armazenamento em memória do processo.
+
+    Adequado para desenvolvimento e para um único worker. Cada chave guarda
+    [valor, expira_em]; chaves expiradas são tratadas como inexistentes.
+
+    As expirações ficam indexadas em uma roda de tempo (um conjunto de chaves
+    por fatia de `resolution` segundos), então sweep() remove as chaves
+    vencidas em O(1) amortizado por chave, sem depender de o mesmo IP voltar.
+    Com max_keys definido, as chaves menos usadas recentemente são descartadas
+    quando o limite é atingido.
+    """
+
+    def __init__(self, max_keys=None, resolution=1.0):
+        self.max_keys = max_keys
+        self.resolution = resolution
+        self._data = OrderedDict()
+        self._wheel = {}
+        self._next_slot = int(time.time() // resolution)
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self.expired_evictions = 0
+        self.lru_evictions = 0
+
+    def _slot(self, expires_at):
+        return int(expires_at // self.resolution)
+
+    def _unschedule(self, key, expires_at):
+        if expires_at is not None:
+            slot = self._wheel.get(self._slot(expires_at))
+            if slot is not None:
+                slot.discard(key)
+
+    def _schedule(self, key, expires_at):
+        if expires_at is not None:
+            self._wheel.setdefault(self._slot(expires_at), set()).add(key)
+
+    def _store(self, key, value, expires_at):
+        entry = self._data.get(key)
+        if entry is not None:
+            if entry[1] != expires_at:
+                self._unschedule(key, entry[1])
+                self._schedule(key, expires_at)
+            entry[0] = value
+            entry[1] = expires_at
+            self._data.move_to_end(key)
+            return
+        self._data[key] = [value, expires_at]
+        self._schedule(key, expires_at)
+        if self.max_keys is not None and len(self._data) > self.max_keys:
+            old_key, old_entry = self._data.popitem(last=False)
+            self._unschedule(old_key, old_entry[1])
+            self.lru_evictions += 1
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._unschedule(key, entry[1])
+
+    def _live_value(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            self._remove(key)
+            self.expired_evictions += 1
+            return None
+        self._data.move_to_end(key)
+        return entry[0]
+
+    def get(self, key):
+        """Retorna o valor da chave ou None se não existir ou tiver expirado."""
+        with self._lock:
+            return self._live_value(key, time.time())
+
+    def set(self, key, value, ttl=None):
+        """Define o valor da chave, com expiração opcional em segundos."""
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._store(key, value, expires_at)
+
+    def delete(self, key):
+        """Remove a chave."""
+        with self._lock:
+            self._remove(key)
+
+    def incr(self, key, ttl, amount=1):
+        """
+        Incrementa atomicamente o contador da chave.
+
+        A expiração é definida apenas quando o contador é criado, então o
+        contador zera ttl segundos após o primeiro incremento.
+
+        Returns:
+            int: Valor do contador após o incremento
+        """
+        now = time.time()
+        with self._lock:
+            return self._incr(key, ttl, amount, now)
+
+    def _incr(self, key, ttl, amount, now):
+        value = self._live_value(key, now)
+        if value is None:
+            self._store(key, amount, now + ttl)
+            return amount
+        value += amount
+        self._data[key][0] = value
+        return value
+
+    def incr_window(self, current_key, previous_key, ttl, amount=1):
+        """
+        Incrementa o contador da janela atual e lê o da janela anterior.
+
+        Returns:
+            tuple: (contagem da janela anterior, contagem da janela atual)
+        """
+        now = time.time()
+        with self._lock:
+            current = self._incr(current_key, ttl, amount, now)
+            previous = self._live_value(previous_key, now) or 0
+            return previous, current
+
+    def update(self, key, func, ttl=None):
+        """
+        Aplica func(valor_atual) atomicamente e grava o novo valor.
+
+        func recebe o valor atual (ou None) e retorna (novo_valor, resultado).
+
+        Returns:
+            O resultado retornado por func
+        """
+        now = time.time()
+        with self._lock:
+            new_value, result = func(self._live_value(key, now))
+            self._store(key, new_value, now + ttl if ttl else None)
+            return result
+
+    def sweep(self, now=None):
+        """
+        Remove todas as chaves expiradas até agora.
+
+        Percorre apenas as fatias da roda de tempo vencidas desde a última
+        varredura.
+
+        Returns:
+            int: Número de chaves removidas
+        """
+        if now is None:
+            now = time.time()
+        removed = 0
+        last_slot = self._slot(now)
+        while True:
+            # O lock é liberado entre fatias para não travar as requisições
+            with self._lock:
+                slot = self._next_slot
+                if slot >= last_slot:
+                    break
+                for key in self._wheel.pop(slot, ()):
+                    self._data.pop(key, None)
+                    removed += 1
+                    self.expired_evictions += 1
+                self._next_slot = slot + 1
+        return removed
+
+    def start_sweeper(self, interval=5.0):
+        """Inicia uma thread daemon que chama sweep() a cada `interval` segundos."""
+        if self._sweeper is not None:
+            return self
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name='security-store-sweeper', daemon=True)
+        self._sweeper.start()
+        return self
+
+    def stats(self):
+        """
+        Retorna contadores do armazenamento.
+
+        Returns:
+            dict: live_keys, expired_evictions e lru_evictions
+        """
+        with self._lock:
+            return {
+                'live_keys': len(self._data),
+                'expired_evictions': self.expired_evictions,
+                'lru_evictions': self.lru_evictions,
+            }
+
+class SQLiteBackend:
+    """
+    Armazenamento compartilhado entre processos de um mesmo host via SQLite.
+
+    Todos os workers apontam para o mesmo arquivo. Usar um caminho em /dev/shm
+    mantém o arquivo em memória compartilhada. Requer SQLite 3.35+ (RETURNING).
+    As leituras já ignoram chaves expiradas; sweep() as remove do arquivo
+    pelo índice de expires_at.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._sweeper = None
+        self.expired_evictions = 0
+        conn = self._connection()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS security_store ('
+            'key TEXT PRIMARY KEY, value, expires_at REAL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS ix_security_store_expires_at '
+            'ON security_store (expires_at)'
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Retorna o valor da chave ou None se não existir ou tiver expirado."""
+        row = self._connection().execute(
+            'SELECT value FROM security_store WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        """Define o valor da chave, com expiração opcional em segundos."""
+        expires_at = time.time() + ttl if ttl else None
+        self._connection().execute(
+            'INSERT OR REPLACE INTO security_store (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, value, expires_at)
+        )
+
+    def delete(self, key):
+        """Remove a chave."""
+        self._connection().execute('DELETE FROM security_store WHERE key = ?', (key,))
+
+    def _incr(self, conn, key, ttl, amount, now):
+        # Um único UPSERT: reinicia o contador se expirou, senão soma
+        row = conn.execute(
+            'INSERT INTO security_store (key, value, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET '
+            'value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END, '
+            'expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END '
+            'RETURNING value',
+            (key, amount, now + ttl, now, now)
+        ).fetchone()
+        return row[0]
+
+    def incr(self, key, ttl, amount=1):
+        """
+        Incrementa atomicamente o contador da chave.
+
+        Returns:
+            int: Valor do contador após o incremento
+        """
+        return self._incr(self._connection(), key, ttl, amount, time.time())
+
+    def incr_window(self, current_key, previous_key, ttl, amount=1):
+        """
+        Incrementa o contador da janela atual e lê o da janela anterior.
+
+        Returns:
+            tuple: (contagem da janela anterior, contagem da janela atual)
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = self._incr(conn, current_key, ttl, amount, now)
+            row = conn.execute(
+                'SELECT value FROM security_store WHERE key = ? AND expires_at > ?',
+                (previous_key, now)
+            ).fetchone()
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return (row[0] if row else 0), current
+
+    def update(self, key, func, ttl=None):
+        """
+        Aplica func(valor_atual) atomicamente e grava o novo valor.
+
+        Returns:
+            O resultado retornado por func
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM security_store WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, now)
+            ).fetchone()
+            new_value, result = func(row[0] if row else None)
+            conn.execute(
+                'INSERT OR REPLACE INTO security_store (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, new_value, now + ttl if ttl else None)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def sweep(self, now=None, batch_size=1000):
+        """
+        Remove todas as chaves expiradas até agora.
+
+        Remove em lotes de `batch_size` chaves, cada um em sua transação,
+        para não segurar o lock de escrita do arquivo.
+
+        Returns:
+            int: Número de chaves removidas
+        """
+        if now is None:
+            now = time.time()
+        conn = self._connection()
+        removed = 0
+        while True:
+            deleted = conn.execute(
+                'DELETE FROM security_store WHERE rowid IN ('
+                'SELECT rowid FROM security_store WHERE expires_at <= ? LIMIT ?)',
+                (now, batch_size)
+            ).rowcount
+            removed += deleted
+            if deleted < batch_size:
+                break
+        self.expired_evictions += removed
+        return removed
+
+    def start_sweeper(self, interval=60.0):
+        """Inicia uma thread daemon que chama sweep() a cada `interval` segundos."""
+        if self._sweeper is not None:
+            return self
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except sqlite3.Error as e:
+                    print(f"SECURITY STORE ERROR: {e}")
+
+        self._sweeper = threading.Thread(target=run, name='security-store-sweeper', daemon=True)
+        self._sweeper.start()
+        return self
+
+class RedisError(Exception):
+    """Erro retornado pelo servidor Redis."""
+
+class RedisBackend:
+    """
+    Armazenamento compartilhado via protocolo Redis (RESP).
+
+    Fala o protocolo diretamente por socket, então funciona com Redis, KeyDB,
+    Valkey ou qualquer substituto local compatível. Cada thread usa sua
+    própria conexão; comandos do caminho crítico são enviados em pipeline
+    dentro de MULTI/EXEC, em uma única ida e volta.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None, timeout=1.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile('rb'))
+            self._local.conn = conn
+            if self.password:
+                self._execute(('AUTH', self.password))
+            if self.db:
+                self._execute(('SELECT', self.db))
+        return conn
+
+    @staticmethod
+    def _encode(command):
+        parts = [b'*%d\r\n' % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Redis connection closed')
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b'+':
+            return payload.decode()
+        if prefix == b'-':
+            return RedisError(payload.decode())
+        if prefix == b':':
+            return int(payload)
+        if prefix == b'$':
+            length = int(payload)
+            if length == -1:
+                return None
+            data = reader.read(length + 2)[:-2]
+            return data.decode()
+        if prefix == b'*':
+            length = int(payload)
+            if length == -1:
+                return None
+            return [self._read_reply(reader) for _ in range(length)]
+        raise RedisError(f'Unexpected reply: {line!r}')
+
+    def _pipeline(self, *commands):
+        """Envia vários comandos de uma vez e lê todas as respostas."""
+        sock, reader = self._connection()
+        try:
+            sock.sendall(b''.join(self._encode(c) for c in commands))
+            replies = [self._read_reply(reader) for _ in commands]
+        except (OSError, ConnectionError):
+            # Descartar a conexão quebrada; a próxima chamada reconecta
+            self._local.conn = None
+            raise
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def _execute(self, command):
+        return self._pipeline(command)[0]
+
+    def _transaction(self, *commands):
+        """Executa os comandos em MULTI/EXEC e retorna os resultados do EXEC (None se um WATCH falhou)."""
+        results = self._pipeline(('MULTI',), *commands, ('EXEC',))[-1]
+        # Erros de execução dos comandos vêm dentro da resposta do EXEC
+        for result in results or ():
+            if isinstance(result, RedisError):
+                raise result
+        return results
+
+    @staticmethod
+    def _number(value):
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return value
+
+    def get(self, key):
+        """Retorna o valor da chave ou None se não existir ou tiver expirado."""
+        return self._number(self._execute(('GET', key)))
+
+    def set(self, key, value, ttl=None):
+        """Define o valor da chave, com expiração opcional em segundos."""
+        if ttl:
+            self._execute(('SET', key, value, 'PX', int(ttl * 1000)))
+        else:
+            self._execute(('SET', key, value))
+
+    def delete(self, key):
+        """Remove a chave."""
+        self._execute(('DEL', key))
+
+    def incr(self, key, ttl, amount=1):
+        """
+        Incrementa atomicamente o contador da chave.
+
+        Returns:
+            int: Valor do contador após o incremento
+        """
+        # SET NX define a expiração apenas na criação; INCRBY a preserva
+        results = self._transaction(
+            ('SET', key, 0, 'PX', int(ttl * 1000), 'NX'),
+            ('INCRBY', key, amount),
+        )
+        return results[1]
+
+    def incr_window(self, current_key, previous_key, ttl, amount=1):
+        """
+        Incrementa o contador da janela atual e lê o da janela anterior.
+
+        Returns:
+            tuple: (contagem da janela anterior, contagem da janela atual)
+        """
+        results = self._transaction(
+            ('SET', current_key, 0, 'PX', int(ttl * 1000), 'NX'),
+            ('INCRBY', current_key, amount),
+            ('GET', previous_key),
+        )
+        return self._number(results[2]) or 0, results[1]
+
+    def update(self, key, func, ttl=None):
+        """
+        Aplica func(valor_atual) atomicamente e grava o novo valor.
+
+        Usa WATCH/MULTI/EXEC e repete a operação se a chave mudar no meio.
+
+        Returns:
+            O resultado retornado por func
+        """
+        while True:
+            self._execute(('WATCH', key))
+            try:
+                new_value, result = func(self._number(self._execute(('GET', key))))
+            except Exception:
+                self._execute(('UNWATCH',))
+                raise
+            command = ('SET', key, new_value, 'PX', int(ttl * 1000)) if ttl else ('SET', key, new_value)
+            if self._transaction(command) is not None:
+                return result
+
+def create_backend(url):
+    """
+    Cria um backend a partir de uma URL.
+
+    Exemplos:
+        memory://
+        memory://?max_keys=1000000&sweep_interval=5
+        sqlite:////dev/shm/dooficoin-security.db?sweep_interval=60
+        redis://:senha@localhost:6379/0
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == 'memory':
+        options = parse_qs(parsed.query)
+        max_keys = int(options['max_keys'][0]) if 'max_keys' in options else None
+        sweep_interval = float(options.get('sweep_interval', ['5'])[0])
+        return MemoryBackend(max_keys=max_keys).start_sweeper(sweep_interval)
+    if parsed.scheme == 'sqlite':
+        # Mesma convenção do SQLAlchemy: sqlite:///relativo.db ou sqlite:////absoluto.db
+        options = parse_qs(parsed.query)
+        sweep_interval = float(options.get('sweep_interval', ['60'])[0])
+        path = url[len('sqlite:///'):].split('?', 1)[0]
+        return SQLiteBackend(path).start_sweeper(sweep_interval)
+    if parsed.scheme == 'redis':
+        return RedisBackend(
+            host=parsed.hostname or 'localhost',
+            port=parsed.port or 6379,
+            db=int(parsed.path.lstrip('/') or 0),
+            password=parsed.password
+        )
+    raise ValueError(f"Unsupported security store URL: {url}")
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    Retorna o backend de estado de segurança do processo.
+
+    Na primeira chamada o backend é criado a partir da variável de ambiente
+    SECURITY_STORE_URL (padrão: memory://).
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_backend(os.environ.get('SECURITY_STORE_URL', 'memory://'))
+    return _store
+
+def set_store(backend):
+    """Substitui o backend de estado de segurança (ex: na inicialização ou em testes)."""
+    global _store
+    _store = backend
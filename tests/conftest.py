@@ -0,0 +1,18 @@
+import pytest
+from flask import Flask
+from models.user import db
+
+@pytest.fixture
+def app(tmp_path):
+    """Aplicação com um banco SQLite vazio em arquivo temporário."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: testes com milhões de linhas (excluir com -m "not slow")')
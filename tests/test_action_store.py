@@ -0,0 +1,36 @@
+import math
+import threading
+from utils.action_store import intern_action_type, action_type_name, encode_details, ActionStore
+
+def test_concurrent_interning_assigns_one_code_per_type():
+    names = [f'stress_action_{i}' for i in range(200)]
+    results = []
+    barrier = threading.Barrier(8)
+
+    def intern_all():
+        barrier.wait()
+        results.append([intern_action_type(name) for name in names])
+
+    threads = [threading.Thread(target=intern_all) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(codes == results[0] for codes in results)
+    assert len(set(results[0])) == len(names)
+    assert [action_type_name(code) for code in results[0]] == names
+
+def test_encode_details_keeps_only_amount_and_item_id():
+    assert encode_details({'amount': 12, 'price': 99, 'item_id': 4, 'placement': 'top'}) == (12.0, 4)
+    assert encode_details({'price': '7.5', 'item_id': 'not-an-int'}) == (7.5, -1)
+    amount, ref = encode_details({'display_id': 3, 'reason': 'Click too fast'})
+    assert math.isnan(amount) and ref == -1
+    amount, ref = encode_details(None)
+    assert math.isnan(amount) and ref == -1
+
+def test_recorded_action_keeps_encoded_fields():
+    store = ActionStore(capacity=2)
+    store.record(1, 'buy_item', 100.0, {'item_id': 9, 'price': 50, 'currency': 'coins'})
+    actions = store.get(1)
+    assert (actions.timestamp(-1), action_type_name(actions.type_code(-1)), actions.amount(-1), actions.ref(-1)) == \
+        (100.0, 'buy_item', 50.0, 9)
@@ -0,0 +1,132 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from models.user import db
+from models.adsense import AdDisplay
+from utils.ad_manager import AdManager
+from utils.ad_frequency import (
+    ad_frequency, init_ad_frequency, AdFrequencyCaps, LocalFrequencyBackend,
+    StoreFrequencyBackend
+)
+from utils.security_store import MemoryBackend, SQLiteBackend, get_store, set_store
+
+def _seed(rows):
+    """Grava exibições (session_id, ip_address, player_id, minutos atrás)."""
+    now = datetime.utcnow()
+    db.session.add_all(
+        AdDisplay(ad_unit_id=1, player_id=player_id, session_id=session_id, ip_address=ip_address,
+                  user_agent='pytest', displayed_at=now - timedelta(minutes=minutes_ago),
+                  protection_end_time=now)
+        for session_id, ip_address, player_id, minutes_ago in rows
+    )
+    db.session.commit()
+
+@pytest.fixture
+def store():
+    previous = get_store()
+    yield
+    set_store(previous)
+    ad_frequency.backend = LocalFrequencyBackend()
+    ad_frequency.reconcile_margin = None
+
+SEED = (
+    # Dentro das janelas de hora e de dia
+    [('s1', '10.0.0.1', 7, 5)] * 3 +
+    [('s1', '10.0.0.2', 7, 30)] * 2 +
+    # Fora da janela de hora, dentro da de dia
+    [('s2', '10.0.0.1', 8, 120)] * 4 +
+    # Fora das duas janelas
+    [('s1', '10.0.0.1', 7, 1500)] * 5
+)
+
+@pytest.mark.parametrize('backend', [
+    LocalFrequencyBackend,
+    lambda: StoreFrequencyBackend(MemoryBackend()),
+])
+def test_rebuild_matches_database(app, backend):
+    _seed(SEED)
+    caps = AdFrequencyCaps(backend())
+    caps.load_from_db()
+    assert caps.counts('s1', '10.0.0.1', 7) == {'ip_hour': 3, 'session_day': 5, 'player_day': 5}
+    assert caps.counts('s2', '10.0.0.1', 8) == {'ip_hour': 3, 'session_day': 4, 'player_day': 4}
+    assert caps.counts('s3', '10.0.0.3', None) == {'ip_hour': 0, 'session_day': 0, 'player_day': 0}
+
+def test_shared_store_rebuilds_once_and_counts_all_workers(app):
+    _seed([('s1', '10.0.0.1', None, 5)] * 2)
+    shared = MemoryBackend()
+    first, second = AdFrequencyCaps(StoreFrequencyBackend(shared)), AdFrequencyCaps(StoreFrequencyBackend(shared))
+    assert first.load_from_db() == 2
+    assert second.load_from_db() == 0
+    first.record('s1', '10.0.0.1')
+    second.record('s1', '10.0.0.1')
+    assert first.counts('s1', '10.0.0.1')['ip_hour'] == 4
+    assert second.counts('s1', '10.0.0.1')['session_day'] == 4
+
+def test_ip_hourly_cap(app, store):
+    ad_frequency.backend = LocalFrequencyBackend()
+    displays = {'now': datetime.utcnow()}
+    for _ in range(19):
+        ad_frequency.record('s1', '10.0.0.1')
+    assert AdManager._check_fraud_limits(displays, 's1', '10.0.0.1', None)['can_show'] is True
+    ad_frequency.record('s1', '10.0.0.1')
+    result = AdManager._check_fraud_limits(displays, 's1', '10.0.0.1', None)
+    assert result['can_show'] is False
+    assert result['reason'] == 'IP hourly limit exceeded'
+    # Uma exibição fora da janela de uma hora deixa de contar
+    assert ad_frequency.counts('s1', '10.0.0.1', now=time.time() + 62 * 60)['ip_hour'] == 0
+
+def test_reconcile_counts_other_workers_once(app):
+    first, second = AdFrequencyCaps(), AdFrequencyCaps()
+    for caps in (first, second):
+        caps.reconcile_margin = 300
+        caps.load_from_db()
+    # Exibições gravadas pelo primeiro worker: o segundo só as conhece pelo banco
+    _seed([('s1', '10.0.0.1', None, 0)] * 20)
+    for display in AdDisplay.query.all():
+        first.record(display.session_id, display.ip_address, display_id=display.id)
+    assert second.counts('s2', '10.0.0.1')['ip_hour'] == 0
+    assert second.reconcile() == 20
+    assert first.reconcile() == 0
+    assert second.reconcile() == 0
+    for caps in (first, second):
+        assert caps.counts('s1', '10.0.0.1') == {'ip_hour': 20, 'session_day': 20, 'player_day': 0}
+
+def test_reconcile_skips_displays_read_at_load(app):
+    _seed([('s1', '10.0.0.1', None, 1)] * 3)
+    caps = AdFrequencyCaps()
+    caps.reconcile_margin = 300
+    assert caps.load_from_db() == 3
+    assert caps.reconcile() == 0
+    assert caps.counts('s1', '10.0.0.1')['ip_hour'] == 3
+
+@pytest.mark.parametrize('url_store, expected', [
+    (lambda path: MemoryBackend(), LocalFrequencyBackend),
+    (lambda path: SQLiteBackend(str(path / 'store.db')), StoreFrequencyBackend),
+])
+def test_default_backend_follows_security_store(app, store, tmp_path, url_store, expected):
+    set_store(url_store(tmp_path))
+    app.config['AD_FREQUENCY_RECONCILE_SECONDS'] = 3600
+    init_ad_frequency(app)
+    assert isinstance(ad_frequency.backend, expected)
+
+def test_unknown_backend_is_rejected(app, store):
+    app.config['AD_FREQUENCY_BACKEND'] = 'redis'
+    with pytest.raises(ValueError):
+        init_ad_frequency(app)
+
+def test_default_eligibility_check_is_one_statement(app, store):
+    set_store(MemoryBackend())
+    app.config['AD_FREQUENCY_RECONCILE_SECONDS'] = 3600
+    init_ad_frequency(app)
+    _seed([('s1', '10.0.0.1', 7, 30)] * 3)
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        displays = AdManager._recent_display_stats('s1', '10.0.0.1', 7, 1, 10)
+        assert AdManager._check_ad_interval(displays, 7, 10)['can_show'] is True
+        assert AdManager._check_fraud_limits(displays, 's1', '10.0.0.1', 7)['can_show'] is True
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert len(statements) == 1, statements
@@ -0,0 +1,62 @@
+import json
+import time
+from models.user import db
+from models.security_log import FraudAlert
+from utils.fraud_alert_store import FraudAlertStore
+
+def _alert(player_id, alert_type='rapid_purchases', timestamp=None, **details):
+    return {
+        'timestamp': time.time() if timestamp is None else timestamp,
+        'player_id': player_id,
+        'alert_type': alert_type,
+        'details': details,
+        'reviewed': False,
+    }
+
+def test_review_closes_open_alert_evicted_from_hot_tier():
+    store = FraudAlertStore(hot_size=1)
+    first, created = store.add(_alert(1), coalesce_seconds=60)
+    assert created
+    # O segundo alerta tira o primeiro da camada quente, mas ele continua aberto
+    store.add(_alert(2), coalesce_seconds=60)
+    assert store.stats()['open_alerts'] == 2
+    assert store.mark_reviewed(first['id'], admin_id=9) is True
+    assert first['reviewed'] is True
+    assert store.stats()['open_alerts'] == 1
+    alert, created = store.add(_alert(1), coalesce_seconds=60)
+    assert created and alert is not first
+
+def test_review_closes_open_alert_in_database(app):
+    store = FraudAlertStore()
+    store.app = app
+    first, _ = store.add(_alert(1), coalesce_seconds=60)
+    store.persist_pending()
+    assert store.mark_reviewed(first['id'], admin_id=9) is True
+    assert store.stats()['open_alerts'] == 0
+    _, created = store.add(_alert(1), coalesce_seconds=60)
+    assert created
+    store.persist_pending()
+    assert FraudAlert.query.count() == 2
+
+def test_row_reviewed_by_other_worker_closes_open_alert(app):
+    store = FraudAlertStore()
+    store.app = app
+    first, _ = store.add(_alert(1, step=1), coalesce_seconds=60)
+    store.persist_pending()
+    # Outro worker revisa a linha diretamente no banco
+    FraudAlert.query.filter_by(id=first['id']).update({'reviewed': True, 'reviewed_by': 9})
+    db.session.commit()
+
+    alert, created = store.add(_alert(1, step=2), coalesce_seconds=60)
+    assert alert is first and not created
+    assert store.persist_pending() == 0
+    row = db.session.get(FraudAlert, first['id'])
+    db.session.refresh(row)
+    assert row.reviewed and json.loads(row.details) == {'step': 1}
+    assert first['reviewed'] is True
+    assert store.stats()['open_alerts'] == 0
+
+    _, created = store.add(_alert(1, step=3), coalesce_seconds=60)
+    assert created
+    store.persist_pending()
+    assert FraudAlert.query.filter_by(reviewed=False).count() == 1
@@ -0,0 +1,184 @@
+import math
+import random
+from collections import deque, defaultdict
+import pytest
+from utils import fraud_detection
+from utils.action_store import ActionStore, ACTION_CAPACITY, encode_details
+from utils.fraud_detection import FraudDetector
+from utils.fraud_graph import FraudGraph
+from utils.fraud_rules import DEFAULT_RULES_CONFIG, RuleEngine
+
+RULES = DEFAULT_RULES_CONFIG['rules']
+SCORING = DEFAULT_RULES_CONFIG['scoring']
+
+class BaselineDetector:
+    """
+    Detector de referência: recalcula as regras varrendo o buffer a cada ação,
+    como FraudDetector fazia antes do estado incremental.
+    """
+
+    def __init__(self):
+        self.actions = defaultdict(lambda: deque(maxlen=ACTION_CAPACITY))
+        self.counts = defaultdict(lambda: defaultdict(int))
+        self.suspicious = defaultdict(int)
+        self.risk = {}
+
+    def apply(self, player_id, action_type, details, now):
+        amount, ref = encode_details(details)
+        actions = self.actions[player_id]
+        actions.append((now, action_type, amount, ref))
+        counts = self.counts[player_id]
+        counts[action_type] += 1
+
+        alerts = []
+        bot = self._bot_activity(actions)
+        if bot is not None:
+            alerts.append(('bot_activity', bot))
+        if action_type == 'self_eliminate':
+            details = self._self_elimination(counts)
+            if details is not None:
+                alerts.append(('excessive_self_elimination', details))
+        if action_type == 'earn_coins':
+            details = self._coin_gain(actions, counts)
+            if details is not None:
+                alerts.append(('abnormal_coin_gain', details))
+        if action_type == 'buy_item':
+            details = self._rapid_purchases(actions, counts)
+            if details is not None:
+                alerts.append(('rapid_purchases', details))
+
+        if alerts:
+            points = sum(RULES[alert_type]['score'] for alert_type, _ in alerts)
+            self.suspicious[player_id] += points
+            value, updated_at = self.risk.get(player_id, (0.0, now))
+            value *= 0.5 ** (max(now - updated_at, 0.0) / SCORING['half_life_seconds'])
+            self.risk[player_id] = (min(value + points, SCORING['max_score']), now)
+        return alerts
+
+    @staticmethod
+    def _bot_activity(actions):
+        params = RULES['bot_activity']
+        sample = list(actions)[-params['sample_size']:]
+        if len(sample) < params['sample_size']:
+            return None
+        time_diffs = [sample[i][0] - sample[i - 1][0] for i in range(1, len(sample))]
+        avg_time_diff = sum(time_diffs) / len(time_diffs)
+        if avg_time_diff >= params['max_avg_interval']:
+            return None
+        std_dev = math.sqrt(sum((x - avg_time_diff) ** 2 for x in time_diffs) / len(time_diffs))
+        if std_dev >= params['max_std_dev']:
+            return None
+        return {
+            'avg_time_between_actions': avg_time_diff,
+            'std_dev': std_dev,
+            'action_types': [action_type for _, action_type, _, _ in sample],
+        }
+
+    @staticmethod
+    def _self_elimination(counts):
+        params = RULES['excessive_self_elimination']
+        count = counts['self_eliminate']
+        percentage = count / sum(counts.values())
+        if count > params['min_count'] and percentage > params['min_ratio']:
+            return {'count': count, 'percentage': percentage}
+        return None
+
+    @staticmethod
+    def _coin_gain(actions, counts):
+        params = RULES['abnormal_coin_gain']
+        if counts['earn_coins'] <= params['min_total_earns']:
+            return None
+        coin_actions = [(timestamp, amount) for timestamp, action_type, amount, _ in actions if action_type == 'earn_coins']
+        if len(coin_actions) < params['min_window_earns']:
+            return None
+        total_coins = sum(amount for _, amount in coin_actions if amount == amount)
+        time_span = coin_actions[-1][0] - coin_actions[0][0]
+        if time_span <= 0 or total_coins / time_span <= params['max_coins_per_second']:
+            return None
+        return {'coins_per_second': total_coins / time_span, 'total_coins': total_coins, 'time_span_seconds': time_span}
+
+    @staticmethod
+    def _rapid_purchases(actions, counts):
+        params = RULES['rapid_purchases']
+        if counts['buy_item'] <= params['min_total_buys']:
+            return None
+        buys = [(timestamp, ref, amount) for timestamp, action_type, amount, ref in actions if action_type == 'buy_item']
+        if len(buys) < params['min_window_buys']:
+            return None
+        if not any(buys[i][0] - buys[i - 1][0] < params['min_interval'] for i in range(1, len(buys))):
+            return None
+        return {'purchases': [(ref if ref >= 0 else None, price if price == price else None)
+                              for _, ref, price in buys[-5:]]}
+
+def _action_stream(seed, players=6, length=6000):
+    """Ações (player_id, tipo, detalhes, timestamp) com rajadas regulares, intervalos longos e valores ausentes."""
+    rng = random.Random(seed)
+    action_types = ('kill_monster', 'self_eliminate', 'earn_coins', 'buy_item')
+    # Cada jogador concentra as ações em um tipo (auto-eliminações passam de 80%)
+    weights = {
+        player_id: [30 if action_type == action_types[player_id % 4] else 1 for action_type in action_types]
+        for player_id in range(1, players + 1)
+    }
+    now = {player_id: 1_700_000_000.0 for player_id in weights}
+    stream = []
+    for _ in range(length):
+        player_id = rng.randint(1, players)
+        action_type = rng.choices(action_types, weights[player_id])[0]
+        gap = rng.choice((0.25, 0.3, rng.uniform(0.05, 0.6), rng.uniform(1, 30)))
+        now[player_id] += gap
+        if action_type == 'earn_coins':
+            details = {'amount': rng.randint(1, 500)} if rng.random() < 0.9 else {}
+        elif action_type == 'buy_item':
+            details = {'item_id': rng.randint(1, 40), 'price': rng.randint(10, 900)}
+            if rng.random() < 0.1:
+                del details['item_id']
+        else:
+            details = None
+        stream.append((player_id, action_type, details, now[player_id]))
+    return stream
+
+def _same(value, expected):
+    """Compara detalhes de alertas, com tolerância para somas de ponto flutuante."""
+    if isinstance(expected, dict):
+        return isinstance(value, dict) and value.keys() == expected.keys() and all(
+            _same(value[key], expected[key]) for key in expected)
+    if isinstance(expected, (list, tuple)):
+        return len(value) == len(expected) and all(_same(a, b) for a, b in zip(value, expected))
+    if isinstance(expected, float):
+        return math.isclose(value, expected, rel_tol=1e-9)
+    return value == expected
+
+@pytest.fixture
+def detector(monkeypatch):
+    engine = RuleEngine()
+    monkeypatch.setattr(fraud_detection, 'get_rule_engine', lambda: engine)
+    monkeypatch.setattr(fraud_detection, 'player_stats', {})
+    monkeypatch.setattr(fraud_detection, 'player_actions', ActionStore(capacity=ACTION_CAPACITY))
+    monkeypatch.setattr(fraud_detection, 'fraud_graph', FraudGraph())
+    alerts = []
+    monkeypatch.setattr(FraudDetector, 'create_fraud_alert',
+                        staticmethod(lambda player_id, alert_type, details: alerts.append((alert_type, details))))
+    return alerts
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_incremental_detector_matches_baseline(detector, seed):
+    baseline = BaselineDetector()
+    raised = defaultdict(int)
+    for player_id, action_type, details, now in _action_stream(seed):
+        expected = baseline.apply(player_id, action_type, details, now)
+        detector.clear()
+        FraudDetector.analyze_action(player_id, action_type, details, now)
+        assert [alert_type for alert_type, _ in detector] == [alert_type for alert_type, _ in expected]
+        for (alert_type, details), (_, expected_details) in zip(detector, expected):
+            assert _same(details, expected_details), (alert_type, details, expected_details)
+        for alert_type, _ in expected:
+            raised[alert_type] += 1
+    # O fluxo precisa exercitar todas as regras para a comparação valer alguma coisa
+    assert raised.keys() == RULES.keys()
+
+    for player_id, stats in fraud_detection.player_stats.items():
+        assert stats['suspicious_activity'] == baseline.suspicious[player_id]
+        if player_id in baseline.risk:
+            value, updated_at = baseline.risk[player_id]
+            assert FraudDetector.calculate_fraud_score(player_id, now=updated_at + 60) == pytest.approx(
+                value * 0.5 ** (60 / SCORING['half_life_seconds']))
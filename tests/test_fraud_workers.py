@@ -0,0 +1,57 @@
+import threading
+import pytest
+from utils import fraud_detection
+from utils.fraud_workers import ShardedWorkerPool
+
+@pytest.fixture
+def blocked_pool():
+    """Pool de um worker com fila de uma tarefa; o worker fica preso na primeira tarefa até `release`."""
+    started, release = threading.Event(), threading.Event()
+    handled, drops = [], []
+
+    def handler(value):
+        if value == 'first':
+            started.set()
+            release.wait(5)
+        handled.append(value)
+
+    def make(**options):
+        pool = ShardedWorkerPool(handler, workers=1, max_queue=1, on_drop=drops.append, **options)
+        assert pool.submit('player', ('first',))
+        assert started.wait(5)
+        # Ocupa a única posição da fila
+        assert pool.submit('player', ('second',))
+        return pool
+
+    yield make, release, handled, drops
+    release.set()
+
+def test_submit_waits_for_space_in_full_queue(blocked_pool):
+    make, release, handled, drops = blocked_pool
+    pool = make(submit_timeout=5)
+    threading.Timer(0.1, release.set).start()
+    assert pool.submit('player', ('third',)) is True
+    pool.flush()
+    assert handled == ['first', 'second', 'third']
+    assert pool.dropped == 0 and drops == []
+
+def test_drops_after_timeout_are_counted_and_reported(blocked_pool):
+    make, release, handled, drops = blocked_pool
+    pool = make(submit_timeout=0.01, drop_report_interval=60)
+    assert [pool.submit('player', (i,)) for i in range(3)] == [False, False, False]
+    assert pool.stats()['dropped'] == 3
+    # Primeiro descarte avisado na hora; os seguintes aguardam o intervalo
+    assert drops == [1]
+    pool.drop_report_interval = 0
+    assert pool.submit('player', ('late',)) is False
+    assert drops == [1, 3]
+    release.set()
+    pool.flush()
+    assert handled == ['first', 'second']
+
+def test_dropped_actions_emit_security_event(monkeypatch):
+    events = []
+    monkeypatch.setattr(fraud_detection, 'log_security_event',
+                        lambda event_type, details, severity='info', user_id=None: events.append((event_type, severity)))
+    fraud_detection._report_dropped_actions(5)
+    assert events == [('fraud_analysis_dropped', 'warning')]
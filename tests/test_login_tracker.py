@@ -0,0 +1,101 @@
+import multiprocessing
+import threading
+import pytest
+from utils.login_tracker import LoginAttemptTracker
+from utils.security_store import MemoryBackend, SQLiteBackend
+
+WINDOW = 900
+# Início de uma janela: a janela anterior não pesa na estimativa
+NOW = 1_700_000_000 // WINDOW * WINDOW + 1.0
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    if request.param == 'memory':
+        shared = MemoryBackend()
+        return lambda: shared
+    # Cada worker abre a sua própria conexão com o mesmo arquivo
+    return lambda: SQLiteBackend(str(tmp_path / 'store.db'))
+
+def _run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def test_failures_from_all_workers_share_one_counter(make_store):
+    workers = [LoginAttemptTracker(max_attempts=10 ** 4, store=make_store()) for _ in range(8)]
+
+    def hammer(index):
+        for i in range(250):
+            workers[index].record_failure('ip:10.0.0.1', NOW + i / 1000)
+
+    _run_threads(hammer, len(workers))
+    assert make_store().get(f'login_fail:ip:10.0.0.1:{int(NOW // WINDOW)}') == 8 * 250
+
+def test_block_counts_failures_of_every_worker(make_store):
+    workers = [LoginAttemptTracker(store=make_store()) for _ in range(4)]
+    # Nenhum worker sozinho chega a max_attempts falhas
+    results = [workers[i % 4].record_failure('user:alice', NOW + i) for i in range(5)]
+    assert results == [False, False, False, False, True]
+    for worker in workers:
+        assert worker.blocked_for('user:alice', NOW + 5) > 0
+        assert worker.blocked_for('ip:10.0.0.1', NOW + 5) == 0
+
+def test_concurrent_workers_block_once_threshold_is_reached(make_store):
+    workers = [LoginAttemptTracker(store=make_store()) for _ in range(16)]
+    blocked = []
+
+    def attempt(index):
+        if workers[index].record_failure('ip:10.0.0.2', NOW + index / 1000):
+            blocked.append(index)
+
+    _run_threads(attempt, len(workers))
+    assert blocked
+    assert all(worker.blocked_for('ip:10.0.0.2', NOW + 1) > 0 for worker in workers)
+
+def test_success_clears_shared_failures(make_store):
+    first, second = LoginAttemptTracker(store=make_store()), LoginAttemptTracker(store=make_store())
+    for i in range(4):
+        first.record_failure('ip:10.0.0.3', NOW + i)
+    second.record_success('ip:10.0.0.3', NOW + 4)
+    assert first.record_failure('ip:10.0.0.3', NOW + 5) is False
+
+class _BrokenStore(MemoryBackend):
+    def incr_window(self, current_key, previous_key, ttl, amount=1):
+        raise ConnectionError('store unavailable')
+
+def test_local_cache_limits_failures_without_store():
+    tracker = LoginAttemptTracker(store=_BrokenStore())
+    results = [tracker.record_failure('ip:10.0.0.6', NOW + i) for i in range(5)]
+    assert results == [False, False, False, False, True]
+
+def test_previous_window_still_counts(make_store):
+    tracker = LoginAttemptTracker(store=make_store())
+    end = NOW + WINDOW - 2
+    for i in range(3):
+        tracker.record_failure('ip:10.0.0.4', end - i)
+    # Outro worker, logo após a virada da janela: as 3 falhas anteriores ainda pesam quase inteiras
+    other = LoginAttemptTracker(store=make_store())
+    results = [other.record_failure('ip:10.0.0.4', end + 3 + i) for i in range(3)]
+    assert results == [False, False, True]
+
+def _process_failures(path, count, results):
+    tracker = LoginAttemptTracker(max_attempts=10 ** 4, store=SQLiteBackend(path))
+    for i in range(count):
+        tracker.record_failure('ip:10.0.0.5', NOW + i / 1000)
+    results.put(count)
+
+def test_processes_share_counter_through_sqlite(tmp_path):
+    path = str(tmp_path / 'store.db')
+    SQLiteBackend(path)
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=_process_failures, args=(path, 300, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * 4
+    assert sum(results.get(timeout=5) for _ in processes) == 1200
+    assert SQLiteBackend(path).get(f'login_fail:ip:10.0.0.5:{int(NOW // WINDOW)}') == 1200
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+import time
+import pytest
+from flask import Flask
+from sqlalchemy import event, inspect, Index
+from models.user import db
+from models.adsense import AdDisplay
+from utils.ad_manager import AdManager
+from utils.migrations import ensure_indexes
+
+ROWS = 2000000
+SESSIONS, IPS, PLAYERS = 200000, 50000, 100000
+
+@pytest.fixture(scope='module')
+def seeded(tmp_path_factory):
+    """Banco com milhões de exibições nas últimas 48 horas, com os índices de utils.migrations."""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path_factory.mktemp('migrations') / 'ads.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        ensure_indexes()
+        start = datetime.utcnow() - timedelta(hours=48)
+        step = 48 * 3600 / ROWS
+        for offset in range(0, ROWS, 100000):
+            db.session.execute(AdDisplay.__table__.insert(), [
+                {
+                    'ad_unit_id': i % 4,
+                    'player_id': i * 7 % PLAYERS or None,
+                    'session_id': f'sess-{i * 13 % SESSIONS}',
+                    'ip_address': f'10.{i % IPS // 65536}.{i % IPS // 256 % 256}.{i % 256}',
+                    'user_agent': 'pytest',
+                    'displayed_at': start + timedelta(seconds=i * step),
+                    'status': 'displayed',
+                }
+                for i in range(offset, min(offset + 100000, ROWS))
+            ])
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+        yield app
+        db.session.remove()
+
+def _plan(statement, parameters):
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    return [row[-1] for row in rows]
+
+def _captured_plan(func):
+    """Executa func e retorna o plano de cada consulta sobre ad_display que ela fez."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'ad_display' in statement and statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        result = func()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+    assert statements
+    return result, [_plan(statement, parameters) for statement, parameters in statements]
+
+@pytest.mark.slow
+def test_recent_display_stats_seeks_key_unit_and_period(seeded):
+    with seeded.app_context():
+        stats, plans = _captured_plan(
+            lambda: AdManager._recent_display_stats('sess-5', '10.0.0.5', 5, 1, 10)
+        )
+        assert stats is not None
+        plan = ' | '.join(plans[0])
+        for index, column in (('ix_ad_display_session_unit_displayed_at', 'session_id'),
+                              ('ix_ad_display_ip_unit_displayed_at', 'ip_address'),
+                              ('ix_ad_display_player_unit_displayed_at', 'player_id')):
+            assert f'USING INDEX {index} ({column}=? AND ad_unit_id=? AND displayed_at>?)' in plan, plan
+
+@pytest.mark.slow
+def test_recent_display_stats_latency_does_not_grow_with_table(seeded):
+    with seeded.app_context():
+        keys = [(f'sess-{i * 13 % SESSIONS}', f'10.{i % IPS // 65536}.{i % IPS // 256 % 256}.{i % 256}',
+                 i * 7 % PLAYERS, i % 4) for i in range(ROWS - 1000, ROWS)]
+        start = time.perf_counter()
+        for session_id, ip_address, player_id, ad_unit_id in keys:
+            stats = AdManager._recent_display_stats(session_id, ip_address, player_id, ad_unit_id, 10)
+            assert stats['session_interval'] is not None
+        # Uma busca por índice em cada chave; uma varredura de milhões de linhas levaria segundos por consulta
+        assert (time.perf_counter() - start) / len(keys) < 0.005
+
+@pytest.mark.slow
+def test_report_period_filter_uses_displayed_at_index(seeded):
+    with seeded.app_context():
+        start = datetime.utcnow() - timedelta(hours=1)
+        query = AdDisplay.query.filter(
+            AdDisplay.displayed_at >= start,
+            AdDisplay.displayed_at <= start + timedelta(minutes=10)
+        )
+        _, plans = _captured_plan(query.all)
+        assert any('USING INDEX ix_ad_display_displayed_at' in line for line in plans[0]), plans[0]
+
+def test_obsolete_indexes_are_replaced(app):
+    table = AdDisplay.__table__
+    old = Index('ix_ad_display_session_displayed_at', table.c.session_id, table.c.displayed_at)
+    table.indexes.discard(old)
+    old.create(db.engine)
+    ensure_indexes()
+    names = {index['name'] for index in inspect(db.engine).get_indexes(table.name)}
+    assert 'ix_ad_display_session_displayed_at' not in names
+    assert 'ix_ad_display_session_unit_displayed_at' in names
@@ -0,0 +1,47 @@
+import pytest
+from flask import Flask
+from utils.security import rate_limit
+from utils.security_store import MemoryBackend, get_store, set_store
+
+@pytest.fixture
+def client():
+    """Aplicação com duas rotas por IP compartilhado e duas com janela por rota."""
+    previous = get_store()
+    set_store(MemoryBackend())
+    app = Flask(__name__)
+
+    @app.route('/a')
+    @rate_limit(max_requests=2)
+    def route_a():
+        return 'a'
+
+    @app.route('/b')
+    @rate_limit(max_requests=2)
+    def route_b():
+        return 'b'
+
+    @app.route('/c')
+    @rate_limit(max_requests=2, per_route=True)
+    def route_c():
+        return 'c'
+
+    @app.route('/d')
+    @rate_limit(max_requests=2, per_route=True)
+    def route_d():
+        return 'd'
+
+    yield app.test_client()
+    set_store(previous)
+
+def _statuses(client, *paths, ip='10.0.0.1'):
+    return [client.get(path, environ_base={'REMOTE_ADDR': ip}).status_code for path in paths]
+
+def test_default_limit_is_shared_by_all_routes(client):
+    assert _statuses(client, '/a', '/b', '/a') == [200, 200, 429]
+    # O IP fica bloqueado em todas as rotas; outro IP não é afetado
+    assert _statuses(client, '/b') == [429]
+    assert _statuses(client, '/b', ip='10.0.0.2') == [200]
+
+def test_per_route_limit_is_opt_in(client):
+    assert _statuses(client, '/c', '/c', '/d', '/d') == [200, 200, 200, 200]
+    assert _statuses(client, '/c') == [429]
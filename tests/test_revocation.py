@@ -0,0 +1,59 @@
+import time
+import pytest
+from sqlalchemy import event
+from models.user import db
+from models.auth import RevokedToken
+from utils import security
+from utils.revocation import RevocationIndex, revocation_index, revoke_token
+from utils.security import generate_token, verify_token, revoke_current_token, clear_token_cache
+
+@pytest.fixture
+def secured(app):
+    app.config['SECRET_KEY'] = 'test-secret'
+    clear_token_cache()
+    revocation_index.refresh()
+    yield app
+    clear_token_cache()
+
+def _statements(func):
+    """Executa func e retorna o resultado e as instruções SQL emitidas."""
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        return func(), statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+
+def test_logout_revokes_token_without_db_query_on_verify(secured):
+    token = generate_token(7)
+    # O token já verificado fica no cache LRU; a revogação precisa valer mesmo assim
+    assert verify_token(token)['user_id'] == 7
+    with secured.test_request_context(headers={'Authorization': f'Bearer {token}'}):
+        payload, error = security._authenticate()
+        assert error is None
+        assert revoke_current_token() is True
+    assert RevokedToken.query.filter_by(jti=payload['jti']).count() == 1
+
+    result, statements = _statements(lambda: verify_token(token))
+    assert result is None
+    assert statements == []
+    # Um token novo do mesmo usuário continua válido
+    assert verify_token(generate_token(7))['user_id'] == 7
+
+def test_other_worker_sees_revocation_after_refresh(secured):
+    token = generate_token(8)
+    payload = verify_token(token)
+    other = RevocationIndex(refresh_interval=3600)
+    other.refresh()
+    assert not other.is_revoked(payload['jti'])
+    revoke_token(payload)
+    assert not other.is_revoked(payload['jti'])
+    other.refresh()
+    result, statements = _statements(lambda: other.is_revoked(payload['jti']))
+    assert result is True
+    assert statements == []
+
+def test_token_without_jti_is_not_revoked(secured):
+    assert revoke_token({'user_id': 1, 'exp': time.time() + 60}) is False
+    assert RevokedToken.query.count() == 0
@@ -0,0 +1,220 @@
+import socket
+import socketserver
+import threading
+import time
+import pytest
+from utils.security_store import RedisBackend, RedisError
+
+class FakeRedis:
+    """Estado de um servidor Redis mínimo: valores, expirações e versões das chaves (para WATCH)."""
+
+    def __init__(self):
+        self.values = {}
+        self.expires = {}
+        self.versions = {}
+        self.commands = []
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _alive(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and time.time() >= expires_at:
+            self._write(key, None)
+        return key in self.values
+
+    def _write(self, key, value, expires_at=None):
+        if value is None:
+            self.values.pop(key, None)
+        else:
+            self.values[key] = value
+        if expires_at is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = expires_at
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def run(self, command):
+        """Executa um comando fora de MULTI e retorna a resposta codificada."""
+        name, args = command[0].upper(), command[1:]
+        if name in ('AUTH', 'SELECT'):
+            return b'+OK\r\n'
+        if name == 'GET':
+            if not self._alive(args[0]):
+                return b'$-1\r\n'
+            value = self.values[args[0]]
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        if name == 'SET':
+            key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+            if b'NX' in options and self._alive(key):
+                return b'$-1\r\n'
+            expires_at = None
+            if b'PX' in options:
+                expires_at = time.time() + int(args[2 + options.index(b'PX') + 1]) / 1000
+            self._write(key, value, expires_at)
+            return b'+OK\r\n'
+        if name == 'DEL':
+            existed = self._alive(args[0])
+            self._write(args[0], None)
+            return b':%d\r\n' % existed
+        if name == 'INCRBY':
+            key = args[0]
+            current = self.values[key] if self._alive(key) else b'0'
+            try:
+                value = int(current) + int(args[1])
+            except ValueError:
+                return b'-ERR value is not an integer or out of range\r\n'
+            self._write(key, str(value).encode(), self.expires.get(key))
+            return b':%d\r\n' % value
+        return b'-ERR unknown command\r\n'
+
+class _Handler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        assert line[:1] == b'*'
+        command = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(length + 2)[:-2])
+        return command
+
+    def handle(self):
+        fake = self.server.fake
+        with fake.lock:
+            fake.connections.append(self.connection)
+        watched = {}
+        queued = None
+        while True:
+            try:
+                command = self._read_command()
+            except OSError:
+                return
+            if command is None:
+                return
+            name = command[0].upper()
+            with fake.lock:
+                fake.commands.append([part.decode() for part in command])
+                if name == b'WATCH':
+                    watched.update((key, fake.versions.get(key, 0)) for key in command[1:])
+                    reply = b'+OK\r\n'
+                elif name == b'UNWATCH':
+                    watched.clear()
+                    reply = b'+OK\r\n'
+                elif name == b'MULTI':
+                    queued = []
+                    reply = b'+OK\r\n'
+                elif name == b'EXEC':
+                    if any(fake.versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = b'*-1\r\n'
+                    else:
+                        replies = [fake.run([part.decode() if i == 0 else part for i, part in enumerate(queued_command)])
+                                   for queued_command in queued]
+                        reply = b'*%d\r\n' % len(replies) + b''.join(replies)
+                    queued = None
+                    watched.clear()
+                elif queued is not None:
+                    queued.append(command)
+                    reply = b'+QUEUED\r\n'
+                else:
+                    reply = fake.run([command[0].decode()] + command[1:])
+            try:
+                self.wfile.write(reply)
+            except OSError:
+                return
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+@pytest.fixture
+def fake_redis():
+    fake = FakeRedis()
+    server = _Server(('127.0.0.1', 0), _Handler)
+    server.fake = fake
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    fake.port = server.server_address[1]
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+def _backend(fake, **options):
+    return RedisBackend(host='127.0.0.1', port=fake.port, **options)
+
+def test_get_set_delete(fake_redis):
+    store = _backend(fake_redis)
+    assert store.get('missing') is None
+    store.set('block', 1700000000.5)
+    assert store.get('block') == 1700000000.5
+    store.set('name', 'alice', ttl=0.05)
+    assert store.get('name') == 'alice'
+    time.sleep(0.1)
+    assert store.get('name') is None
+    store.delete('block')
+    assert store.get('block') is None
+
+def test_incr_sets_expiration_only_on_creation(fake_redis):
+    store = _backend(fake_redis)
+    assert store.incr('counter', ttl=60) == 1
+    assert store.incr('counter', ttl=60, amount=4) == 5
+    assert ['SET', 'counter', '0', 'PX', '60000', 'NX'] in fake_redis.commands
+    # O segundo SET NX não altera o contador nem a expiração
+    assert store.get('counter') == 5
+
+def test_incr_window_reads_previous_window(fake_redis):
+    store = _backend(fake_redis)
+    assert store.incr_window('rl:ip:2', 'rl:ip:1', ttl=120) == (0, 1)
+    store.set('rl:ip:1', 7)
+    assert store.incr_window('rl:ip:2', 'rl:ip:1', ttl=120, amount=2) == (7, 3)
+
+def test_update_retries_after_watch_conflict(fake_redis):
+    store, other = _backend(fake_redis), _backend(fake_redis)
+    store.set('bucket', 10)
+    calls = []
+
+    def take(value):
+        calls.append(value)
+        if len(calls) == 1:
+            # Outro cliente altera a chave entre o WATCH e o EXEC
+            other.set('bucket', 3)
+        return value - 1, value
+
+    assert store.update('bucket', take, ttl=60) == 3
+    assert calls == [10, 3]
+    assert store.get('bucket') == 2
+    assert fake_redis.commands.count(['EXEC']) == 2
+
+def test_update_unwatches_when_func_fails(fake_redis):
+    store = _backend(fake_redis)
+
+    def fail(value):
+        raise ValueError('bad state')
+
+    with pytest.raises(ValueError):
+        store.update('bucket', fail)
+    assert fake_redis.commands[-1] == ['UNWATCH']
+
+def test_error_reply_is_raised(fake_redis):
+    store = _backend(fake_redis)
+    store.set('name', 'alice')
+    with pytest.raises(RedisError):
+        store._execute(('INCRBY', 'name', 1))
+    # Também quando o erro vem dentro da resposta do EXEC
+    with pytest.raises(RedisError):
+        store.incr('name', ttl=60)
+
+def test_reconnects_after_connection_drop(fake_redis):
+    store = _backend(fake_redis, db=2, password='secret')
+    store.set('key', 1)
+    with fake_redis.lock:
+        for connection in fake_redis.connections:
+            connection.shutdown(socket.SHUT_RDWR)
+    # A chamada que encontra a conexão fechada falha e a descarta
+    with pytest.raises((ConnectionError, OSError)):
+        store.get('key')
+    assert store.get('key') == 1
+    assert len(fake_redis.connections) == 2
+    # AUTH e SELECT são repetidos na nova conexão
+    assert fake_redis.commands.count(['AUTH', 'secret']) == 2
+    assert fake_redis.commands.count(['SELECT', '2']) == 2
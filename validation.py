@@ -0,0 +1,153 @@
+import re
+
+# Padrões pré-compilados uma única vez na importação do módulo
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+USERNAME_PATTERN = re.compile(r'^[a-zA-Z0-9_-]{3,20}$')
+SANITIZE_PATTERN = re.compile(r'[<>\'";]')
+
+# Classes de caracteres exigidas em senhas
+UPPERCASE = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+LOWERCASE = frozenset('abcdefghijklmnopqrstuvwxyz')
+DIGITS = frozenset('0123456789')
+SPECIAL_CHARACTERS = frozenset('!@#$%^&*(),.?":{}|<>')
+
+PASSWORD_MIN_LENGTH = 8
+
+def is_valid_email(email):
+    """Valida se o email está em um formato correto."""
+    return EMAIL_PATTERN.match(email) is not None
+
+def is_valid_username(username):
+    """Valida se o nome de usuário contém apenas caracteres permitidos."""
+    return USERNAME_PATTERN.match(username) is not None
+
+def classify_password(password):
+    """
+    Classifica a senha em uma única passagem pela string.
+
+    A string é percorrida uma vez para montar o conjunto de caracteres
+    distintos; as verificações seguintes operam sobre esse conjunto, que é
+    pequeno, em vez de varrer a senha uma vez por requisito.
+
+    Returns:
+        list: Requisitos não atendidos ('length', 'uppercase', 'lowercase',
+              'digit', 'special'); vazia se a senha for válida
+    """
+    missing = []
+    if len(password) < PASSWORD_MIN_LENGTH:
+        missing.append('length')
+    characters = set(password)
+    if characters.isdisjoint(UPPERCASE):
+        missing.append('uppercase')
+    if characters.isdisjoint(LOWERCASE):
+        missing.append('lowercase')
+    if characters.isdisjoint(DIGITS):
+        missing.append('digit')
+    if characters.isdisjoint(SPECIAL_CHARACTERS):
+        missing.append('special')
+    return missing
+
+def is_valid_password(password):
+    """Valida se a senha atende aos requisitos mínimos de segurança."""
+    if len(password) < PASSWORD_MIN_LENGTH:
+        return False
+    characters = set(password)
+    return not (
+        characters.isdisjoint(UPPERCASE)
+        or characters.isdisjoint(LOWERCASE)
+        or characters.isdisjoint(DIGITS)
+        or characters.isdisjoint(SPECIAL_CHARACTERS)
+    )
+
+def sanitize_input(input_str):
+    """Sanitiza a entrada do usuário para prevenir injeções."""
+    if input_str is None:
+        return None
+    return SANITIZE_PATTERN.sub('', input_str)
+
+# Validadores disponíveis para os esquemas de validate_payload
+VALIDATORS = {
+    'email': is_valid_email,
+    'username': is_valid_username,
+    'password': is_valid_password,
+}
+
+def compile_schema(schema):
+    """
+    Resolve um esquema de validação uma única vez.
+
+    Args:
+        schema: Mapeia nome do campo -> nome de um validador em VALIDATORS
+                ou uma função que retorna bool
+
+    Returns:
+        tuple: Esquema compilado, aceito por validate_payload e validate_records
+    """
+    if isinstance(schema, tuple):
+        return schema
+    return tuple(
+        (field, VALIDATORS[validator] if isinstance(validator, str) else validator)
+        for field, validator in schema.items()
+    )
+
+def _field_errors(data, compiled):
+    errors = None
+    for field, check in compiled:
+        value = data.get(field)
+        if isinstance(value, str) and value:
+            if check(value):
+                continue
+            message = f'Invalid {field}'
+        elif value is None or value == '':
+            message = f'Field {field} is required'
+        else:
+            message = f'Field {field} must be a string'
+        if errors is None:
+            errors = {}
+        errors[field] = message
+    return errors
+
+def _sanitized(data, sanitize):
+    if not sanitize:
+        return data
+    cleaned = dict(data)
+    for field in sanitize:
+        value = cleaned.get(field)
+        if isinstance(value, str):
+            cleaned[field] = SANITIZE_PATTERN.sub('', value)
+    return cleaned
+
+def validate_payload(data, schema, sanitize=()):
+    """
+    Valida todos os campos de um payload JSON em uma única passagem.
+
+    Args:
+        data: Dicionário com os dados recebidos
+        schema: Esquema (dicionário campo -> validador) ou resultado de compile_schema
+        sanitize: Campos de texto que devem ser sanitizados no resultado
+
+    Returns:
+        tuple: (dados limpos, dicionário campo -> mensagem de erro)
+    """
+    errors = _field_errors(data, compile_schema(schema))
+    return _sanitized(data, sanitize), errors or {}
+
+def validate_records(records, schema, sanitize=()):
+    """
+    Valida uma lista de registros (ex: importação em massa pelo admin).
+
+    O esquema é compilado uma única vez para o lote inteiro.
+
+    Returns:
+        tuple: (registros válidos já limpos, lista de (índice, erros) dos inválidos)
+    """
+    compiled = compile_schema(schema)
+    valid = []
+    invalid = []
+    for index, record in enumerate(records):
+        errors = _field_errors(record, compiled)
+        if errors:
+            invalid.append((index, errors))
+        else:
+            valid.append(_sanitized(record, sanitize))
+    return valid, invalid